@@ -0,0 +1,199 @@
+"""
+Benchmark: metrics of code that is not valid Python, single token scan vs the regex fallback.
+
+Before the token scan, calculate_metrics measured non-Python code with one re.findall
+per pattern over the whole source (3 method, 4 if, 9 loop and 15 decision patterns),
+which also counted keywords inside strings and comments and matched else-if and
+do-while twice. This script keeps those patterns as the baseline and, for JavaScript,
+Java and C# sources generated at every --megabytes size, reports:
+    regex   the previous fallback (REGEX_PATTERNS + indentation nesting)
+    scan    calculate_metrics, which now runs one pass of _scan_metrics
+with their throughput in MB/s and the metrics each one gives.
+
+Usage (from the repository root):
+    python evals/fallback_metrics_benchmark.py --megabytes 1 4
+
+Results are printed as a table and saved as fallback_metrics_benchmark_<timestamp>.csv.
+"""
+import argparse
+import csv
+import random
+import re
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+EVALS_DIR = Path(__file__).resolve().parent
+REPO_DIR = EVALS_DIR.parent
+# evals/src is a regular package and would shadow sauco-api's `src` namespace package
+sys.path = [p for p in sys.path if Path(p or ".").resolve() != EVALS_DIR]
+sys.path.insert(0, str(REPO_DIR / "sauco-api"))
+
+from src.service.metrics_service import calculate_metrics  # noqa: E402
+
+# The regex fallback as it was in metrics_service.py
+REGEX_PATTERNS = {
+    "method_number": (
+        r'(def|function)\s+\w+\s*\(',
+        r'(\w+\s+)+\w+\s*\([^)]*\)\s*{',
+        r'(const|let|var)?\s*\w+\s*=\s*(\([^)]*\)|[^=]*)\s*=>\s*[{(]',
+    ),
+    "number_of_ifs": (r'if\s*\(', r'if\s+[^(]', r'else\s+if\s*\(', r'elif\s+'),
+    "number_of_loops": (
+        r'for\s*\(', r'for\s+[^(]', r'while\s*\(', r'while\s+[^(]', r'do\s*{',
+        r'\.forEach\s*\(', r'\.map\s*\(', r'\.filter\s*\(', r'\.reduce\s*\(',
+    ),
+    "cyclomatic_complexity": (
+        r'if\s*\(', r'if\s+[^(]', r'else\s+if\s*\(', r'elif\s+',
+        r'for\s*\(', r'for\s+[^(]', r'while\s*\(', r'while\s+[^(]', r'do\s*{',
+        r'catch\s*\(', r'except\s+',
+        r'\s+&&\s+', r'\s+\|\|\s+', r'\s+and\s+', r'\s+or\s+',
+    ),
+}
+
+TEMPLATES = {
+    "javascript": ('''
+/**
+ * Processes the orders of a customer, if any (for reporting).
+ */
+function process{n}(orders, limit) {{
+  let total = 0;
+  for (let i = 0; i < orders.length; i++) {{
+    if (orders[i].status === "if cancelled, skip" || i > limit) {{
+      continue;
+    }} else if (orders[i].amount > {k} && orders[i].paid) {{
+      total += orders[i].amount;
+    }}
+  }}
+  const names = orders.filter(o => o.paid).map((o) => `${{o.name}} while`);
+  do {{ total--; }} while (total > {k});
+  return {{ total, names, options: {{ retry: true }} }};
+}}
+''', None),
+    "java": ('''
+    /** Sums the paid orders; if none, returns 0. */
+    public int process{n}(List<Order> orders, int limit) throws IOException {{
+        int total = 0;
+        for (Order order : orders) {{
+            if (order.isPaid() && order.getAmount() > {k}) {{
+                total += order.getAmount();
+            }} else if (order.getStatus().equals("while pending")) {{
+                total -= 1;
+            }}
+        }}
+        try {{
+            writer.write(total);
+        }} catch (IOException e) {{
+            total = -1;
+        }}
+        while (total > limit || total < 0) {{ total /= 2; }}
+        return total;
+    }}
+''', "public class Orders{n} {{\n"),
+    "csharp": ('''
+        // Sums the paid orders; if none, returns 0.
+        public int Process{n}(IEnumerable<Order> orders, int limit)
+        {{
+            var total = 0;
+            foreach (var order in orders)
+            {{
+                if (order.Paid && order.Amount > {k})
+                {{
+                    total += order.Amount;
+                }}
+                else if (order.Status == @"for ""pending""")
+                {{
+                    total -= 1;
+                }}
+            }}
+            var label = total switch {{ 0 => "none", _ => "some" }};
+            return orders.Where(o => o.Paid).Count() + total;
+        }}
+''', "namespace Shop{n}\n{{\n    public class Orders\n    {{\n"),
+}
+CLASS_END = {"javascript": "", "java": "}\n", "csharp": "    }\n}\n"}
+
+
+def generate_source(language: str, megabytes: float, seed: int = 0) -> str:
+    """Methods of the language's template (20 per class, if it has classes) up to the requested size."""
+    method, class_start = TEMPLATES[language]
+    rng = random.Random(seed)
+    parts, size, n = [], 0, 0
+    while size < megabytes * 1024 * 1024:
+        if class_start and n % 20 == 0:
+            if n:
+                parts.append(CLASS_END[language])
+            parts.append(class_start.format(n=n))
+        part = method.format(n=n, k=rng.randint(1, 100))
+        parts.append(part)
+        size += len(part)
+        n += 1
+    if class_start:
+        parts.append(CLASS_END[language])
+    return "".join(parts)
+
+
+def regex_metrics(code: str) -> dict:
+    """The previous fallback: one re.findall per pattern, nesting from indentation."""
+    metrics = {name: sum(len(re.findall(p, code)) for p in patterns) for name, patterns in REGEX_PATTERNS.items()}
+    metrics["cyclomatic_complexity"] += 1
+    non_empty_lines = [line for line in code.split("\n") if line.strip()]
+    metrics["average_method_size"] = len(non_empty_lines) / metrics["method_number"] if metrics["method_number"] else 0.0
+    metrics["max_nesting"] = max(((len(line) - len(line.lstrip())) // 2 for line in non_empty_lines), default=0)
+    return metrics
+
+
+def best_time(fn, code: str, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(code)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--megabytes", type=float, nargs="+", default=[1, 4])
+    parser.add_argument("--languages", nargs="+", default=list(TEMPLATES), choices=list(TEMPLATES))
+    parser.add_argument("--repeats", type=int, default=3, help="runs per measurement (best is kept)")
+    parser.add_argument("--output-dir", default=str(EVALS_DIR))
+    args = parser.parse_args()
+
+    rows = []
+    print(f"{'language':<10} {'MB':>5} {'regex MB/s':>10} {'scan MB/s':>10} {'speedup':>8}  metrics (regex -> scan)")
+    for language in args.languages:
+        for megabytes in args.megabytes:
+            code = generate_source(language, megabytes)
+            mb = len(code.encode("utf-8")) / (1024 * 1024)
+            regex_seconds = best_time(regex_metrics, code, args.repeats)
+            scan_seconds = best_time(calculate_metrics, code, args.repeats)
+            before = regex_metrics(code)
+            # Aggregates only: the per-function breakdown has no regex counterpart
+            after = {k: v for k, v in calculate_metrics(code).items() if k != "functions"}
+            row = {
+                "language": language,
+                "megabytes": round(mb, 2),
+                "regex_mb_s": mb / regex_seconds,
+                "scan_mb_s": mb / scan_seconds,
+                "speedup": regex_seconds / scan_seconds,
+                **{f"regex_{k}": v for k, v in before.items()},
+                **{f"scan_{k}": v for k, v in after.items()},
+            }
+            changes = ", ".join(f"{k} {before[k]:g} -> {after[k]:g}" for k in after)
+            print(f"{language:<10} {mb:>5.1f} {row['regex_mb_s']:>10.2f} {row['scan_mb_s']:>10.2f} "
+                  f"{row['speedup']:>7.1f}x  {changes}")
+            rows.append(row)
+
+    ts = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    output = Path(args.output_dir) / f"fallback_metrics_benchmark_{ts}.csv"
+    with open(output, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"\nSaved {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Benchmark: staged (describe -> recommendations -> refactor) vs fused
+(describe -> recommendations+refactor in one call) pipeline modes.
+
+For every exercise under evals/src it runs the ImprovementService workflow in each
+mode, measures wall-clock latency and OpenAI token usage, and runs the exercise's
+unittest file against the improved code (in a temporary copy, originals are untouched).
+
+Usage (from the repository root, with OPENAI_API_KEY set):
+    python evals/fused_pipeline_benchmark.py --runs 3 --model o3-mini
+
+Qdrant retrieval is used when QDRANT_URL and TFIDF_VECTORIZER_PATH are set, as in the API.
+Results are printed as a summary table and saved as fused_benchmark_<model>_<timestamp>.csv.
+"""
+import argparse
+import asyncio
+import csv
+import os
+import pickle
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+EVALS_DIR = Path(__file__).resolve().parent
+# evals/src is a regular package and would shadow sauco-api's `src` namespace package
+sys.path = [p for p in sys.path if Path(p or ".").resolve() != EVALS_DIR]
+sys.path.insert(0, str(EVALS_DIR.parent / "sauco-api"))
+
+from src.service.improvement_service import ImprovementService, PIPELINE_MODES  # noqa: E402
+from src.service.telemetry import LLM_REQUESTS, start_trace  # noqa: E402
+
+
+def find_exercises(src_dir: Path = EVALS_DIR / "src"):
+    """Yields (name, code_path, test_path) for each exercise with a *_test.py file."""
+    for exercise_dir in sorted(p for p in src_dir.iterdir() if p.is_dir()):
+        for test_path in sorted(exercise_dir.glob("*_test.py")):
+            code_path = test_path.with_name(test_path.name.replace("_test.py", ".py"))
+            if code_path.exists():
+                yield exercise_dir.name, code_path, test_path
+
+
+def run_tests(code_path: Path, test_path: Path, improved_code: str) -> bool:
+    """Runs the exercise tests against improved_code in a scratch copy of the exercise."""
+    with tempfile.TemporaryDirectory() as tmp:
+        shutil.copy2(test_path, tmp)
+        Path(tmp, code_path.name).write_text(improved_code, encoding="utf-8")
+        # Without the repo on the path the tests fall back to the local module import
+        env = {k: v for k, v in os.environ.items() if k != "PYTHONPATH"}
+        result = subprocess.run(
+            [sys.executable, "-m", "unittest", test_path.stem],
+            cwd=tmp, env=env, capture_output=True, text=True, timeout=120
+        )
+        return result.returncode == 0
+
+
+def build_service(model: str) -> ImprovementService:
+    qdrant, vectorizer = None, None
+    vectorizer_path = os.getenv("TFIDF_VECTORIZER_PATH")
+    if os.getenv("QDRANT_URL") and vectorizer_path and os.path.exists(vectorizer_path):
+        from qdrant_client import QdrantClient
+        qdrant = QdrantClient(url=os.getenv("QDRANT_URL"), api_key=os.getenv("QDRANT_API_KEY"))
+        with open(vectorizer_path, "rb") as f:
+            vectorizer = pickle.load(f)
+    return ImprovementService(
+        openai_model=model,
+        qdrant_client=qdrant,
+        qdrant_collection=os.getenv("QDRANT_COLLECTION", "code_knowledge"),
+        vectorizer=vectorizer,
+    )
+
+
+async def run_once(service: ImprovementService, mode: str, code: str, tests: str) -> dict:
+    # Memoized stages would turn later runs into cache hits
+    for cache in service.stage_cache.values():
+        cache.clear()
+    trace = start_trace()
+    # Every completion call counts, also several calls of one stage (one per unit in split mode)
+    calls_before = LLM_REQUESTS.total()
+    start = time.perf_counter()
+    _, improved_code, _, _ = await service.run_workflow(code, tests, pipeline_mode=mode)
+    latency = time.perf_counter() - start
+    tokens = trace["tokens"]
+    return {
+        "latency_s": round(latency, 3),
+        "llm_calls": int(LLM_REQUESTS.total() - calls_before),
+        "prompt_tokens": sum(t.get("prompt_tokens", 0) for t in tokens.values()),
+        "completion_tokens": sum(t.get("completion_tokens", 0) for t in tokens.values()),
+        "total_tokens": sum(t.get("total_tokens", 0) for t in tokens.values()),
+        "improved_code": improved_code,
+    }
+
+
+async def benchmark(model: str, runs: int, modes) -> list:
+    service = build_service(model)
+    rows = []
+    for name, code_path, test_path in find_exercises():
+        code = code_path.read_text(encoding="utf-8")
+        tests = test_path.read_text(encoding="utf-8")
+        for run in range(1, runs + 1):
+            # Alternate the order so provider warm-up does not favour one mode
+            for mode in (modes if run % 2 else list(reversed(modes))):
+                row = {"exercise": name, "mode": mode, "run": run}
+                try:
+                    result = await run_once(service, mode, code, tests)
+                    improved_code = result.pop("improved_code")
+                    row.update(result)
+                    row["tests_passed"] = run_tests(code_path, test_path, improved_code)
+                except Exception as e:
+                    row.update({"error": str(e), "tests_passed": False})
+                print(f"{name} [{mode}] run {run}: {row.get('latency_s')}s, "
+                      f"{row.get('total_tokens')} tokens, tests passed: {row['tests_passed']}")
+                rows.append(row)
+    return rows
+
+
+def summarize(rows: list, modes) -> None:
+    print(f"\n{'mode':<8} {'runs':>4} {'p50 s':>8} {'mean s':>8} {'calls':>6} {'prompt tk':>10} "
+          f"{'compl tk':>9} {'total tk':>9} {'pass rate':>9}")
+    for mode in modes:
+        ok = [r for r in rows if r["mode"] == mode and "error" not in r]
+        all_runs = [r for r in rows if r["mode"] == mode]
+        if not ok:
+            print(f"{mode:<8} {len(all_runs):>4}  (all runs failed)")
+            continue
+        mean = lambda key: statistics.mean(r[key] for r in ok)  # noqa: E731
+        pass_rate = sum(r["tests_passed"] for r in all_runs) / len(all_runs)
+        print(f"{mode:<8} {len(all_runs):>4} {statistics.median(r['latency_s'] for r in ok):>8.2f} "
+              f"{mean('latency_s'):>8.2f} {mean('llm_calls'):>6.1f} {mean('prompt_tokens'):>10.0f} "
+              f"{mean('completion_tokens'):>9.0f} {mean('total_tokens'):>9.0f} {pass_rate:>9.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=os.getenv("OPENAI_MODEL", "o3-mini"))
+    parser.add_argument("--runs", type=int, default=3, help="runs per exercise and mode")
+    parser.add_argument("--modes", nargs="+", default=list(PIPELINE_MODES), choices=PIPELINE_MODES)
+    parser.add_argument("--output-dir", default=str(EVALS_DIR))
+    args = parser.parse_args()
+
+    rows = asyncio.run(benchmark(args.model, args.runs, args.modes))
+    summarize(rows, args.modes)
+
+    ts = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    output = Path(args.output_dir) / f"fused_benchmark_{args.model}_{ts}.csv"
+    fields = ["exercise", "mode", "run", "latency_s", "llm_calls", "prompt_tokens",
+              "completion_tokens", "total_tokens", "tests_passed", "error"]
+    with open(output, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"\nSaved {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Benchmark: calculate_metrics on large generated Python modules, single-pass engine vs
+one parse per metric.
+
+Modules are built from a template mixing what the metrics look at: classes with
+methods, nested if/elif/else, for/while loops, try/except, with blocks and boolean
+conditions. For every module size it reports the time of:
+    per_metric   count_methods, count_ifs, count_loops, calculate_cyclomatic_complexity,
+                 calculate_average_method_size and calculate_max_nesting one after the
+                 other (what calculate_metrics used to do: 7 parses, 5 traversals)
+    single_pass  calculate_metrics (1 parse, 1 traversal)
+and checks that both give identical file-level metrics.
+
+Usage (from the repository root):
+    python evals/metrics_benchmark.py --functions 50 200 1000
+
+Results are printed as a table and saved as metrics_benchmark_<timestamp>.csv.
+"""
+import argparse
+import csv
+import random
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+EVALS_DIR = Path(__file__).resolve().parent
+REPO_DIR = EVALS_DIR.parent
+# evals/src is a regular package and would shadow sauco-api's `src` namespace package
+sys.path = [p for p in sys.path if Path(p or ".").resolve() != EVALS_DIR]
+sys.path.insert(0, str(REPO_DIR / "sauco-api"))
+
+from src.service.metrics_service import (  # noqa: E402
+    calculate_average_method_size, calculate_cyclomatic_complexity, calculate_max_nesting,
+    calculate_metrics, count_ifs, count_loops, count_methods,
+)
+
+FUNCTION = '''
+    def {name}(self, items, limit=10):
+        """Processes items up to a limit."""
+        total = 0
+        for index, item in enumerate(items):
+            if item is None or index > limit:
+                continue
+            elif item > {n} and item % 2 == 0:
+                total += item
+            else:
+                while total > {n} and limit:
+                    total -= 1
+        try:
+            with open(self.path) as handle:
+                total += len(handle.read())
+        except (OSError, ValueError):
+            total = -1
+        return [value for value in items if value and value > total]
+'''
+
+
+def generate_module(functions: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    parts = ["import os\n"]
+    for c in range(0, functions, 10):
+        parts.append(f"\nclass Service{c}:\n    path = os.devnull\n")
+        for f in range(c, min(c + 10, functions)):
+            parts.append(FUNCTION.format(name=f"handle_{f}", n=rng.randint(1, 100)))
+    return "".join(parts)
+
+
+def per_metric(code: str) -> dict:
+    return {
+        "method_number": count_methods(code)["count"],
+        "number_of_ifs": count_ifs(code),
+        "number_of_loops": count_loops(code),
+        "cyclomatic_complexity": calculate_cyclomatic_complexity(code)["total"],
+        "average_method_size": calculate_average_method_size(code),
+        "max_nesting": calculate_max_nesting(code),
+    }
+
+
+def aggregates(metrics: dict) -> dict:
+    """File-level metrics, without the per-function breakdown."""
+    return {key: value for key, value in metrics.items() if key != "functions"}
+
+
+def best_time(fn, code: str, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(code)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--functions", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--repeats", type=int, default=5, help="runs per measurement (best is kept)")
+    parser.add_argument("--output-dir", default=str(EVALS_DIR))
+    args = parser.parse_args()
+
+    rows = []
+    print(f"{'functions':>9} {'lines':>7} {'per_metric ms':>14} {'single_pass ms':>15} {'speedup':>8} {'identical':>9}")
+    for functions in args.functions:
+        code = generate_module(functions)
+        row = {
+            "functions": functions,
+            "lines": code.count("\n"),
+            "per_metric_ms": best_time(per_metric, code, args.repeats) * 1000,
+            "single_pass_ms": best_time(calculate_metrics, code, args.repeats) * 1000,
+            "identical": per_metric(code) == aggregates(calculate_metrics(code)),
+        }
+        row["speedup"] = row["per_metric_ms"] / row["single_pass_ms"]
+        print(f"{functions:>9} {row['lines']:>7} {row['per_metric_ms']:>14.1f} {row['single_pass_ms']:>15.1f} "
+              f"{row['speedup']:>7.1f}x {str(row['identical']):>9}")
+        rows.append(row)
+
+    ts = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    output = Path(args.output_dir) / f"metrics_benchmark_{ts}.csv"
+    with open(output, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"\nSaved {output}")
+
+
+if __name__ == "__main__":
+    main()
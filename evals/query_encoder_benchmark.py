@@ -0,0 +1,118 @@
+"""
+Microbenchmark: TF-IDF query encoding throughput, sklearn's TfidfVectorizer.transform
+vs the NumPy TfidfQueryEncoder used by the API.
+
+Queries are paragraphs of the repository's Markdown docs, close in size and wording to
+the analysis sections sent to retrieval. For every batch size it reports queries/s of:
+    sklearn        vectorizer.transform(batch)
+    numpy_cold     TfidfQueryEncoder.transform(batch) with an empty n-gram cache
+    numpy_warm     the same once the batch's n-grams are cached
+and checks that both encoders produce bit-identical vectors.
+
+Usage (from the repository root):
+    python evals/query_encoder_benchmark.py --vectorizer infra/tfidf_vectorizer.pkl
+
+Results are printed as a table and saved as query_encoder_benchmark_<timestamp>.csv.
+"""
+import argparse
+import csv
+import pickle
+import re
+import sys
+import time
+import warnings
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+EVALS_DIR = Path(__file__).resolve().parent
+REPO_DIR = EVALS_DIR.parent
+# evals/src is a regular package and would shadow sauco-api's `src` namespace package
+sys.path = [p for p in sys.path if Path(p or ".").resolve() != EVALS_DIR]
+sys.path.insert(0, str(REPO_DIR / "sauco-api"))
+
+from src.service.tfidf_artifact import TfidfQueryEncoder  # noqa: E402
+
+
+def load_vectorizer(path: str):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # sklearn version mismatch warnings
+        try:
+            import joblib
+            return joblib.load(path)
+        except ImportError:
+            with open(path, "rb") as f:
+                return pickle.load(f)
+
+
+def load_queries() -> list:
+    paragraphs = []
+    for doc in sorted(REPO_DIR.glob("*.md")) + sorted(REPO_DIR.glob("*/README.md")):
+        text = doc.read_text(encoding="utf-8", errors="ignore")
+        paragraphs.extend(p.strip() for p in re.split(r"\n\s*\n", text) if len(p.split()) >= 5)
+    return paragraphs
+
+
+def rate(fn, batch: list, min_seconds: float) -> float:
+    """Queries per second of fn(batch), repeated for at least min_seconds."""
+    calls, start = 0, time.perf_counter()
+    while True:
+        fn(batch)
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return calls * len(batch) / elapsed
+
+
+def same_vectors(a, b) -> bool:
+    return (np.array_equal(a.indptr, b.indptr) and np.array_equal(a.indices, b.indices)
+            and np.array_equal(a.data, b.data))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectorizer", default=str(REPO_DIR / "infra" / "tfidf_vectorizer.pkl"))
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--seconds", type=float, default=1.0, help="minimum time per measurement")
+    parser.add_argument("--output-dir", default=str(EVALS_DIR))
+    args = parser.parse_args()
+
+    vectorizer = load_vectorizer(args.vectorizer)
+    encoder = TfidfQueryEncoder.from_vectorizer(vectorizer)
+    queries = load_queries()
+    words = [len(q.split()) for q in queries]
+    print(f"{len(queries)} queries, {np.median(words):.0f} words median, vocabulary {len(vectorizer.vocabulary_)}")
+
+    def cold(batch):
+        encoder._column_cache.clear()
+        return encoder.transform(batch)
+
+    rows = []
+    print(f"\n{'batch':>5} {'sklearn q/s':>12} {'numpy cold':>11} {'numpy warm':>11} {'speedup':>8} {'identical':>9}")
+    for size in args.batch_sizes:
+        batch = (queries * (size // len(queries) + 1))[:size]
+        identical = same_vectors(vectorizer.transform(batch), encoder.transform(batch))
+        row = {
+            "batch_size": size,
+            "sklearn_qps": rate(vectorizer.transform, batch, args.seconds),
+            "numpy_cold_qps": rate(cold, batch, args.seconds),
+            "numpy_warm_qps": rate(encoder.transform, batch, args.seconds),
+            "identical": identical,
+        }
+        row["speedup_warm"] = row["numpy_warm_qps"] / row["sklearn_qps"]
+        print(f"{size:>5} {row['sklearn_qps']:>12.0f} {row['numpy_cold_qps']:>11.0f} "
+              f"{row['numpy_warm_qps']:>11.0f} {row['speedup_warm']:>7.1f}x {str(identical):>9}")
+        rows.append(row)
+
+    ts = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    output = Path(args.output_dir) / f"query_encoder_benchmark_{ts}.csv"
+    with open(output, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"\nSaved {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Benchmark: retrieval quality and per-query latency of the API's retrievers on EVAL_QUERIES.
+
+Queries are the EVAL_QUERIES of saucode_retrieval_eval.ipynb; relevance comes from the
+annotated retriever_result/retrieval_results_filled.csv (is_relevant per query and chunk).
+Chunks nobody judged count as not relevant, so `judged@k` reports how much of each top-k
+was annotated: a low value means the P@k/nDCG@k of that retriever is a lower bound.
+
+Retrievers (every one that is configured is measured):
+    qdrant   TF-IDF sparse search in the Qdrant collection      --qdrant-url
+    memory   TF-IDF sparse search in the in-process index       --tfidf-snapshot
+    bm25     BM25 in the in-process index, per --k1 x --b        --bm25-snapshot
+Both in-process indexes can also be built on the fly from a chunk JSONL with --chunks.
+
+Usage (from the repository root):
+    python evals/retrieval_benchmark.py --vectorizer infra/tfidf_vectorizer \
+        --tfidf-snapshot infra/snapshot --bm25-snapshot infra/snapshot_bm25 --k1 0.9 1.2 1.5 --b 0.4 0.75
+
+Results are printed as a table and saved as retrieval_benchmark_<timestamp>.csv.
+"""
+import argparse
+import ast
+import csv
+import json
+import math
+import statistics
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+EVALS_DIR = Path(__file__).resolve().parent
+REPO_DIR = EVALS_DIR.parent
+# evals/src is a regular package and would shadow sauco-api's `src` namespace package
+sys.path = [p for p in sys.path if Path(p or ".").resolve() != EVALS_DIR]
+sys.path.insert(0, str(REPO_DIR / "sauco-api"))
+
+from src.service.retrievers import BM25Retriever, InMemoryRetriever, QdrantRetriever, encode_queries, sparse_pairs  # noqa: E402
+from src.service.sparse_index import BM25Index, SparseIndex  # noqa: E402
+from src.service.tfidf_artifact import TfidfQueryEncoder, is_artifact  # noqa: E402
+
+
+def load_eval_queries(notebook: Path) -> list:
+    """EVAL_QUERIES as defined in the retrieval evaluation notebook."""
+    cells = json.loads(notebook.read_text(encoding="utf-8"))["cells"]
+    for cell in cells:
+        source = "".join(cell["source"])
+        if cell["cell_type"] == "code" and "EVAL_QUERIES = [" in source:
+            for node in ast.parse(source).body:
+                if isinstance(node, ast.Assign) and getattr(node.targets[0], "id", None) == "EVAL_QUERIES":
+                    return ast.literal_eval(node.value)
+    raise ValueError(f"EVAL_QUERIES not found in {notebook}")
+
+
+def load_judgments(path: Path) -> dict:
+    """(query_id, chunk_id) -> 0/1 from the annotated results."""
+    with open(path, newline="", encoding="utf-8") as f:
+        return {
+            (row["query_id"], row["chunk_id"]): int(float(row["is_relevant"]))
+            for row in csv.DictReader(f) if row.get("is_relevant") not in (None, "")
+        }
+
+
+def load_vectorizer(path: str):
+    if is_artifact(path):
+        return TfidfQueryEncoder.load(path)
+    import joblib
+    return TfidfQueryEncoder.from_vectorizer(joblib.load(path))
+
+
+def precision_at_k(rels: list, k: int) -> float:
+    return sum(rels[:k]) / float(k) if k > 0 else 0.0
+
+
+def ndcg_at_k(rels: list, k: int) -> float:
+    """Same definition as the notebook: ideal order of the retrieved judgments."""
+    def dcg(values):
+        return sum(rel / math.log2(i + 1) for i, rel in enumerate(values[:k], start=1))
+    ideal = dcg(sorted(rels, reverse=True))
+    return dcg(rels) / ideal if ideal > 0 else 0.0
+
+
+def build_retrievers(args, vectorizer) -> list:
+    """(label, retriever) for every configured backend."""
+    retrievers = []
+    chunks = None
+    if args.chunks:
+        with open(args.chunks, encoding="utf-8") as f:
+            chunks = [json.loads(line) for line in f if line.strip()]
+        texts = [c.get("text") or "" for c in chunks]
+
+    if args.qdrant_url:
+        from qdrant_client import QdrantClient
+        client = QdrantClient(url=args.qdrant_url, prefer_grpc=False, check_compatibility=False)
+        retrievers.append(("qdrant", QdrantRetriever(client, args.collection, vectorizer)))
+    if args.tfidf_snapshot:
+        retrievers.append(("memory", InMemoryRetriever.load(args.tfidf_snapshot, vectorizer)))
+    elif chunks is not None:
+        index = SparseIndex.from_vectors(encode_queries(vectorizer, texts), chunks)
+        retrievers.append(("memory", InMemoryRetriever(index, vectorizer)))
+
+    if args.bm25_snapshot or chunks is not None:
+        if not args.bm25_snapshot:
+            counts = vectorizer.counts(texts)
+            built = BM25Index.from_counts(sparse_pairs(counts), chunks, n_terms=counts.shape[1])
+        for k1 in args.k1:
+            for b in args.b:
+                if args.bm25_snapshot:
+                    index = BM25Index.load(args.bm25_snapshot, k1=k1, b=b)
+                else:
+                    index = BM25Index(built.meta, built.indptr, built.docs, built.weights, built.chunks,
+                                      built.doc_lengths, built.idf, k1=k1, b=b)
+                retrievers.append((f"bm25 k1={k1:g} b={b:g}", BM25Retriever(index, vectorizer)))
+    return retrievers
+
+
+def evaluate(retriever, queries: list, judgments: dict, k: int, repeats: int) -> dict:
+    p_at_k, ndcg, judged, latencies = [], [], [], []
+    for query in queries:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            hits = retriever.search([query["query_text"]], top_k=k)[0]
+            latencies.append((time.perf_counter() - start) * 1000)
+        keys = [(query["query_id"], hit["chunk_id"]) for hit in hits]
+        rels = [judgments.get(key, 0) for key in keys]
+        p_at_k.append(precision_at_k(rels, k))
+        ndcg.append(ndcg_at_k(rels, k))
+        judged.append(sum(key in judgments for key in keys) / float(k))
+    latencies.sort()
+    return {
+        f"P@{k}": statistics.mean(p_at_k),
+        f"nDCG@{k}": statistics.mean(ndcg),
+        f"judged@{k}": statistics.mean(judged),
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))],
+        "num_queries": len(queries),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectorizer", default=str(REPO_DIR / "infra" / "tfidf_vectorizer.pkl"))
+    parser.add_argument("--qdrant-url")
+    parser.add_argument("--collection", default="code_knowledge")
+    parser.add_argument("--tfidf-snapshot")
+    parser.add_argument("--bm25-snapshot")
+    parser.add_argument("--chunks", help="chunk JSONL to build the in-process indexes from")
+    parser.add_argument("--k1", type=float, nargs="+", default=[1.2])
+    parser.add_argument("--b", type=float, nargs="+", default=[0.75])
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=5, help="timed searches per query")
+    parser.add_argument("--notebook", default=str(EVALS_DIR / "saucode_retrieval_eval.ipynb"))
+    parser.add_argument("--judgments", default=str(EVALS_DIR / "retriever_result" / "retrieval_results_filled.csv"))
+    parser.add_argument("--output-dir", default=str(EVALS_DIR))
+    args = parser.parse_args()
+
+    queries = load_eval_queries(Path(args.notebook))
+    judgments = load_judgments(Path(args.judgments))
+    vectorizer = load_vectorizer(args.vectorizer)
+    retrievers = build_retrievers(args, vectorizer)
+    if not retrievers:
+        parser.error("configure at least one retriever (--qdrant-url, --tfidf-snapshot, --bm25-snapshot or --chunks)")
+    print(f"{len(queries)} EVAL_QUERIES, {len(judgments)} judgments")
+
+    k = args.top_k
+    rows = []
+    print(f"\n{'retriever':<24} {f'P@{k}':>6} {f'nDCG@{k}':>8} {f'judged@{k}':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for label, retriever in retrievers:
+        row = {"retriever": label, **evaluate(retriever, queries, judgments, k, args.repeats)}
+        print(f"{label:<24} {row[f'P@{k}']:>6.3f} {row[f'nDCG@{k}']:>8.3f} {row[f'judged@{k}']:>9.2f} "
+              f"{row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f}")
+        rows.append(row)
+
+    ts = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    output = Path(args.output_dir) / f"retrieval_benchmark_{ts}.csv"
+    with open(output, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"\nSaved {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark: cold import and startup time of the API.
+
+Each run starts a fresh interpreter (so nothing is cached in sys.modules) and measures:
+    - import_s: `import api` (module import, including building the app and services)
+    - warmup_s: background warm-up until the vectorizer, Qdrant and OpenAI client are ready
+    - per-component load time and the readiness result reported by /ready
+It also records which heavy dependencies (openai, qdrant_client, sklearn) were already
+imported by `import api`; with lazy startup that list should be empty.
+
+Usage (from the repository root; uses the same env vars as the API):
+    python evals/startup_benchmark.py --runs 5
+
+Results are printed as a summary table and saved as startup_benchmark_<timestamp>.csv.
+"""
+import argparse
+import csv
+import json
+import os
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+from pathlib import Path
+
+EVALS_DIR = Path(__file__).resolve().parent
+API_DIR = EVALS_DIR.parent / "sauco-api"
+HEAVY_MODULES = ("openai", "qdrant_client", "sklearn")
+
+CHILD = """
+import asyncio, json, sys, time
+start = time.perf_counter()
+import api
+import_s = time.perf_counter() - start
+heavy = [m for m in {heavy!r} if m in sys.modules]
+start = time.perf_counter()
+ready = asyncio.run(api.warm_up())
+warmup_s = time.perf_counter() - start
+print(json.dumps({{
+    "import_s": import_s, "warmup_s": warmup_s, "ready": ready, "heavy_at_import": heavy,
+    "components": {{r.name: r.status() for r in api._resources()}},
+}}))
+"""
+
+
+def run_once() -> dict:
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "benchmark-key")  # the client is built, never called
+    env.setdefault("JOB_WORKERS", "0")
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD.format(heavy=HEAVY_MODULES)],
+        cwd=API_DIR, env=env, capture_output=True, text=True, timeout=300
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else "child failed")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to start")
+    parser.add_argument("--output-dir", default=str(EVALS_DIR))
+    args = parser.parse_args()
+
+    rows = []
+    for run in range(1, args.runs + 1):
+        sample = run_once()
+        row = {
+            "run": run,
+            "import_s": round(sample["import_s"], 4),
+            "warmup_s": round(sample["warmup_s"], 4),
+            "ready": sample["ready"],
+            "heavy_at_import": " ".join(sample["heavy_at_import"]),
+        }
+        for name, status in sample["components"].items():
+            row[f"{name}_state"] = status["state"]
+            row[f"{name}_load_s"] = status.get("load_seconds")
+        print(f"run {run}: import {row['import_s']:.3f}s, warm-up {row['warmup_s']:.3f}s, ready: {row['ready']}")
+        rows.append(row)
+
+    print(f"\n{'':<10} {'p50 s':>8} {'mean s':>8} {'max s':>8}")
+    for key in ("import_s", "warmup_s"):
+        values = [r[key] for r in rows]
+        print(f"{key:<10} {statistics.median(values):>8.3f} {statistics.mean(values):>8.3f} {max(values):>8.3f}")
+    heavy = {r["heavy_at_import"] for r in rows if r["heavy_at_import"]}
+    print(f"heavy modules loaded by `import api`: {', '.join(sorted(heavy)) or 'none'}")
+
+    ts = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    output = Path(args.output_dir) / f"startup_benchmark_{ts}.csv"
+    fields = list(dict.fromkeys(key for row in rows for key in row))
+    with open(output, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"\nSaved {output}")
+
+
+if __name__ == "__main__":
+    main()
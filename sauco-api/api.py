@@ -1,16 +1,51 @@
 # api.py
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
 from pydantic import BaseModel, Field
 import os
+import asyncio
+import json
 import pickle
+import time
 import traceback
-from qdrant_client import QdrantClient
 from src.service.improvement_service import ImprovementService
-from src.domain.models import ImproveRequest, ImproveResponse, RetrieveContextRequest, RetrieveContextResponse
-from sklearn.feature_extraction.text import TfidfVectorizer
+from src.service.cache_service import ResponseCache, make_cache_key
+from src.service.singleflight import SingleFlight
+from src.service.job_queue import JobWorkerPool, create_job_queue, FINISHED_STATUSES
+from src.service.telemetry import start_trace, timed, render_prometheus
+from src.service.prompt_builder import DEFAULT_PROMPT_BUDGETS
+from src.service.llm_client import AdaptiveConcurrencyLimiter, CircuitBreaker, LLMUnavailableError, create_llm_client
+from src.service.lazy_resource import LazyResource, READY, DISABLED
+from src.service.tfidf_artifact import TfidfQueryEncoder, is_artifact
+from src.service.retrievers import RETRIEVERS, BM25Retriever, InMemoryRetriever
+from src.service.sparse_index import is_snapshot
+from src.service.metrics_service import calculate_metrics
+from src.service.metrics_pool import MetricsPool
+from src.domain.models import (
+    ImproveRequest, ImproveResponse, RetrieveContextRequest, RetrieveContextResponse, CacheInfo, JobResponse, TimingsInfo,
+    RetrieveContextBatchRequest, RetrieveContextBatchResponse, QueryContext, Metrics, CodeMetricsRequest,
+    CodeMetricsBatchRequest, CodeMetricsBatchResponse, FileMetrics
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # JOB_WORKERS=0 makes this node admission-only; `python worker.py` drains the queue elsewhere
+    pool = None
+    if JOB_WORKERS > 0:
+        pool = _job_worker_pool(JOB_WORKERS)
+        pool.start()
+    # Heavy resources load in the background: the server accepts requests right away
+    warmup = asyncio.create_task(warm_up()) if WARMUP_ON_STARTUP else None
+    yield
+    if warmup is not None:
+        warmup.cancel()
+    if pool is not None:
+        await pool.stop()
+    _metrics_pool.shutdown()
 
-app = FastAPI(title="Code Improver API", version="1.0.0")
+app = FastAPI(title="Code Improver API", version="1.0.0", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"]
@@ -20,22 +55,163 @@ OPENAI_MODEL = os.getenv("OPENAI_MODEL", "o3-mini")#"gpt-4o-mini") #gpt-4.1-nano
 QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")  
 QDRANT_COLLECTION = os.getenv("QDRANT_COLLECTION", "code_knowledge")
-TFIDF_VECTORIZER_PATH = os.getenv("TFIDF_VECTORIZER_PATH")  # ej: ./vectorizer.pkl
+TFIDF_VECTORIZER_PATH = os.getenv("TFIDF_VECTORIZER_PATH")  # ej: ./vectorizer.pkl o el directorio de export_vectorizer.py
+RETRIEVER = os.getenv("RETRIEVER", "qdrant")  # qdrant | memory (TF-IDF en proceso) | bm25 (BM25 en proceso)
+RETRIEVER_SNAPSHOT_PATH = os.getenv("RETRIEVER_SNAPSHOT_PATH")  # directorio de build_snapshot.py (memory | bm25)
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))  # saturación de la frecuencia del término
+BM25_B = float(os.getenv("BM25_B", "0.75"))  # normalización por longitud del chunk (0 = ninguna)
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "1024"))  # queries en caché por worker; 0 = sin caché
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "600"))  # segundos; 0 = sin expiración
+QDRANT_STAMP_SECONDS = float(os.getenv("QDRANT_STAMP_SECONDS", "30"))  # cada cuánto se relee points_count de la colección
+IMPROVE_CACHE_SIZE = int(os.getenv("IMPROVE_CACHE_SIZE", "256"))  # entradas en memoria por worker
+IMPROVE_CACHE_PATH = os.getenv("IMPROVE_CACHE_PATH", ".cache/improve_cache.sqlite3")  # vacío = sin disco
+JOB_QUEUE_URL = os.getenv("JOB_QUEUE_URL", "sqlite:///.cache/jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))  # workers de la cola en este proceso
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "analysis")  # analysis | code | hybrid
+_analysis_budget = os.getenv("RETRIEVAL_ANALYSIS_BUDGET", "")  # segundos; vacío = sin límite (modo hybrid)
+RETRIEVAL_ANALYSIS_BUDGET = float(_analysis_budget) if _analysis_budget else None
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "staged")  # staged | fused (recomendaciones + refactor en una llamada)
+
+def _prompt_budget(part: str):
+    # PROMPT_BUDGET_CODE / _ANALYSIS / _CONTEXT / _TESTS en tokens; 0 = sin límite
+    value = os.getenv(f"PROMPT_BUDGET_{part.upper()}")
+    if not value:
+        return DEFAULT_PROMPT_BUDGETS[part]
+    return int(value) or None
 
-_vectorizer = None
-if TFIDF_VECTORIZER_PATH and os.path.exists(TFIDF_VECTORIZER_PATH):
+PROMPT_BUDGETS = {part: _prompt_budget(part) for part in DEFAULT_PROMPT_BUDGETS}
+# Los presupuestos cambian el prompt (y la respuesta): forman parte de la clave de caché
+PROMPT_BUDGETS_KEY = json.dumps(PROMPT_BUDGETS, sort_keys=True)
+SPLIT_MODE = os.getenv("SPLIT_MODE", "off")  # off | units | auto (por función/clase, en paralelo)
+SPLIT_CONCURRENCY = int(os.getenv("SPLIT_CONCURRENCY", "4"))  # unidades en vuelo por request
+SPLIT_MIN_TOKENS = int(os.getenv("SPLIT_MIN_TOKENS", "2000"))  # umbral del modo auto
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))  # reintentos con backoff exponencial + jitter
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))  # segundos por llamada a OpenAI
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))  # pool keep-alive compartido
+LLM_CONCURRENCY_INITIAL = int(os.getenv("LLM_CONCURRENCY_INITIAL", "8"))  # límite AIMD inicial
+LLM_CONCURRENCY_MAX = int(os.getenv("LLM_CONCURRENCY_MAX", "32"))  # techo del límite AIMD (como mucho LLM_MAX_CONNECTIONS)
+LLM_CIRCUIT_FAILURES = int(os.getenv("LLM_CIRCUIT_FAILURES", "5"))  # fallos seguidos que abren el circuito
+LLM_CIRCUIT_RESET = float(os.getenv("LLM_CIRCUIT_RESET", "30"))  # segundos abierto antes de probar
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") != "0"  # 0 = todo se carga en la primera request
+_metrics_workers = os.getenv("METRICS_WORKERS", "")  # procesos para /code_metrics/batch; vacío = núcleos de la CPU, 0-1 = sin pool
+METRICS_WORKERS = int(_metrics_workers) if _metrics_workers else None
+METRICS_POOL_MIN_BYTES = int(os.getenv("METRICS_POOL_MIN_BYTES", "262144"))  # lotes más pequeños se miden en un hilo
+
+def _load_vectorizer():
+    # Exported artifact: memory-mapped, shared by every worker on the host, no sklearn
+    if is_artifact(TFIDF_VECTORIZER_PATH):
+        return TfidfQueryEncoder.load(TFIDF_VECTORIZER_PATH)
+    # Unpickling imports sklearn: only done on warm-up or first retrieval
     with open(TFIDF_VECTORIZER_PATH, "rb") as f:
-        _vectorizer = pickle.load(f)
+        vectorizer = pickle.load(f)
+    try:
+        # Same vectors as vectorizer.transform, without sklearn's per-call overhead
+        return TfidfQueryEncoder.from_vectorizer(vectorizer)
+    except ValueError as e:
+        print(f"Using the vectorizer as is - {e}")
+        return vectorizer
 
-_qdrant = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY) if QDRANT_URL else None
+def _build_qdrant():
+    from qdrant_client import QdrantClient
+    return QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
+
+def _check_qdrant(client) -> None:
+    # One round-trip so a missing Qdrant or collection shows up in /ready, not in the first request
+    if not client.collection_exists(QDRANT_COLLECTION):
+        raise RuntimeError(f"Collection '{QDRANT_COLLECTION}' not found")
+
+def _load_snapshot_retriever():
+    if RETRIEVER == "bm25":
+        return BM25Retriever.load(RETRIEVER_SNAPSHOT_PATH, _vectorizer.get(), k1=BM25_K1, b=BM25_B)
+    return InMemoryRetriever.load(RETRIEVER_SNAPSHOT_PATH, _vectorizer.get())
+
+if RETRIEVER not in RETRIEVERS:
+    raise ValueError(f"Unknown RETRIEVER '{RETRIEVER}'. Expected one of {RETRIEVERS}")
+_snapshot_mode = RETRIEVER in ("memory", "bm25")
+_vectorizer = LazyResource(
+    "vectorizer", _load_vectorizer if TFIDF_VECTORIZER_PATH and os.path.exists(TFIDF_VECTORIZER_PATH) else None
+)
+_qdrant = LazyResource("qdrant", _build_qdrant if QDRANT_URL and not _snapshot_mode else None, check=_check_qdrant)
+_snapshot_ready = _snapshot_mode and is_snapshot(RETRIEVER_SNAPSHOT_PATH)
+if _snapshot_ready and _vectorizer.factory is None:
+    # Sin vectorizer no se pueden codificar las queries: sin retrieval, como en modo qdrant
+    print(f"RETRIEVER={RETRIEVER} needs TFIDF_VECTORIZER_PATH - retrieval disabled")
+    _snapshot_ready = False
+_retriever = LazyResource("retriever", _load_snapshot_retriever if _snapshot_ready else None)
+
+_llm_client = create_llm_client(
+    timeout=LLM_TIMEOUT,
+    max_connections=LLM_MAX_CONNECTIONS,
+    max_keepalive_connections=LLM_MAX_CONNECTIONS,
+    max_retries=LLM_MAX_RETRIES,
+    limiter=AdaptiveConcurrencyLimiter(initial=LLM_CONCURRENCY_INITIAL, max_limit=LLM_CONCURRENCY_MAX),
+    breaker=CircuitBreaker(failure_threshold=LLM_CIRCUIT_FAILURES, reset_timeout=LLM_CIRCUIT_RESET),
+)
+
+
+def _knowledge_base_version() -> str:
+    """
+    Identifies the knowledge base for cache keys. KNOWLEDGE_BASE_VERSION wins; otherwise
+    the collection name plus the vectorizer file stamp, so re-indexing invalidates entries.
+    """
+    explicit = os.getenv("KNOWLEDGE_BASE_VERSION")
+    if explicit:
+        return explicit
+    stamp = ""
+    if _snapshot_mode and is_snapshot(RETRIEVER_SNAPSHOT_PATH):
+        with open(os.path.join(RETRIEVER_SNAPSHOT_PATH, "meta.json"), encoding="utf-8") as f:
+            stamp = f"{RETRIEVER}:{json.load(f).get('fingerprint', '')}:"
+        if RETRIEVER == "bm25":
+            stamp += f"k1={BM25_K1:g}:b={BM25_B:g}:"
+    if is_artifact(TFIDF_VECTORIZER_PATH):
+        with open(os.path.join(TFIDF_VECTORIZER_PATH, "meta.json"), encoding="utf-8") as f:
+            stamp += json.load(f).get("fingerprint", "")
+    elif TFIDF_VECTORIZER_PATH and os.path.exists(TFIDF_VECTORIZER_PATH):
+        st = os.stat(TFIDF_VECTORIZER_PATH)
+        stamp += f"{st.st_size}:{int(st.st_mtime)}"
+    return f"{QDRANT_COLLECTION}:{stamp}"
+
+KNOWLEDGE_BASE_VERSION = _knowledge_base_version()
 
 _service = ImprovementService(
     openai_model=OPENAI_MODEL,
+    llm_client=_llm_client,
     qdrant_client=_qdrant,
     qdrant_collection=QDRANT_COLLECTION,
+    knowledge_base_version=KNOWLEDGE_BASE_VERSION,
+    collection_stamp_seconds=QDRANT_STAMP_SECONDS,
     vectorizer=_vectorizer,
+    retrieval_mode=RETRIEVAL_MODE,
+    analysis_retrieval_budget=RETRIEVAL_ANALYSIS_BUDGET,
+    pipeline_mode=PIPELINE_MODE,
+    prompt_budgets=PROMPT_BUDGETS,
+    split_mode=SPLIT_MODE,
+    split_concurrency=SPLIT_CONCURRENCY,
+    split_min_tokens=SPLIT_MIN_TOKENS,
+    retriever=_retriever if _snapshot_mode else None,
+    retrieval_cache_size=RETRIEVAL_CACHE_SIZE,
+    retrieval_cache_ttl=RETRIEVAL_CACHE_TTL or None,
 )
 
+_cache = ResponseCache(memory_size=IMPROVE_CACHE_SIZE, disk_path=IMPROVE_CACHE_PATH or None)
+# Identical concurrent requests share one in-flight computation
+_improve_flight = SingleFlight()
+_retrieve_flight = SingleFlight()
+
+_jobs = create_job_queue(JOB_QUEUE_URL)
+
+_metrics_pool = MetricsPool(workers=METRICS_WORKERS, min_pool_bytes=METRICS_POOL_MIN_BYTES)
+
+
+async def warm_up() -> bool:
+    """Loads the vectorizer, connects to Qdrant (or loads the snapshot) and builds the OpenAI client, in parallel."""
+    start = time.perf_counter()
+    results = await asyncio.gather(*(resource.warm() for resource in _resources()))
+    print(f"Warm-up finished in {time.perf_counter() - start:.2f}s - ready: {all(results)}")
+    return all(results)
+
+def _resources():
+    return [_vectorizer, _retriever if _snapshot_mode else _qdrant, _llm_client.inner]
 
 @app.get("/health")
 def health_check():
@@ -49,38 +225,196 @@ def health_check():
         "version": "1.0.0"
     }
 
+@app.get("/ready")
+def readiness_check():
+    """
+    Readiness probe: 200 once the retriever (vectorizer + Qdrant or the memory snapshot) and the OpenAI client
+    are warm, 503 while they are still loading or when one of them failed.
+    Components that are not configured are reported as disabled and do not block.
+    """
+    components = {resource.name: resource.status() for resource in _resources()}
+    ready = all(c["state"] in (READY, DISABLED) for c in components.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "not_ready", "components": components}
+    )
+
+async def _run_improve(req: ImproveRequest) -> ImproveResponse:
+    """
+    Runs the workflow behind the content-addressed response cache.
+    Identical code/tests/model/knowledge base never reach the LLM twice, and identical
+    requests that arrive while the first one is still running wait for its result.
+    """
+    trace = start_trace()
+    start = time.perf_counter()
+    with timed("improve_request"):
+        response = await _cached_improve(req)
+    if req.IncludeTimings:
+        response.timings = TimingsInfo(total=time.perf_counter() - start, **trace)
+    return response
+
+async def _cached_improve(req: ImproveRequest) -> ImproveResponse:
+    # Retrieval, pipeline and split modes and the prompt budgets change what the LLM sees, so they are part of the key
+    key = ResponseCache.make_key(
+        req.Code, req.Tests, OPENAI_MODEL, KNOWLEDGE_BASE_VERSION,
+        req.RetrievalMode or RETRIEVAL_MODE, req.PipelineMode or PIPELINE_MODE, req.SplitMode or SPLIT_MODE,
+        PROMPT_BUDGETS_KEY
+    )
+    cached, tier = await asyncio.to_thread(_cache.get, key)
+    if cached is not None:
+        response = await _for_caller(ImproveResponse.model_validate_json(cached), req)
+        response.cache = CacheInfo(status="hit", tier=tier, key=key)
+        return response
+
+    payload, shared = await _improve_flight.do(key, lambda: _compute_improve(req, key))
+    # Each caller gets its own copy of the shared result
+    response = ImproveResponse.model_validate_json(payload)
+    if shared:
+        response = await _for_caller(response, req)
+    response.cache = CacheInfo(status="coalesced" if shared else "miss", key=key)
+    return response
+
+async def _for_caller(response: ImproveResponse, req: ImproveRequest) -> ImproveResponse:
+    # The key ignores leading blank lines, which shift the function lines of the "before" metrics:
+    # a shared result gets them from this caller's own code
+    if response.metrics is not None:
+        response.metrics.before = Metrics(**await asyncio.to_thread(calculate_metrics, req.Code))
+    return response
+
+async def _compute_improve(req: ImproveRequest, key: str) -> str:
+    analysis, improved_code, chunk_details, metrics = await _service.run_workflow(
+        req.Code, req.Tests, retrieval_mode=req.RetrievalMode, pipeline_mode=req.PipelineMode,
+        split_mode=req.SplitMode
+    )
+    
+    retrieved_context = [
+        {
+            "score": chunk.get("score", 0.0),
+            "page": chunk.get("page"),
+            "chunk_id": chunk.get("chunk_id"),
+            "text": chunk.get("text", "")
+        }
+        for chunk in chunk_details
+    ]
+    
+    response = ImproveResponse(
+        Analisis=analysis, 
+        Code=improved_code,
+        RetrievedContext=retrieved_context,
+        metrics=metrics
+    )
+    payload = response.model_dump_json(exclude={"cache", "timings"})
+    await asyncio.to_thread(_cache.set, key, payload)
+    return payload
+
 @app.post("/improve", response_model=ImproveResponse)
 async def improve(req: ImproveRequest):
     try:
-        analysis, improved_code, chunk_details, metrics = await _service.run_workflow(req.Code, req.Tests)
-        
-        retrieved_context = [
-            {
-                "score": chunk.get("score", 0.0),
-                "page": chunk.get("page"),
-                "chunk_id": chunk.get("chunk_id"),
-                "text": chunk.get("text", "")
-            }
-            for chunk in chunk_details
-        ]
-        
-        return ImproveResponse(
-            Analisis=analysis, 
-            Code=improved_code,
-            RetrievedContext=retrieved_context,
-            metrics=metrics
-        )
+        return await _run_improve(req)
+    except LLMUnavailableError as e:
+        # Provider down or circuit open: tell the client to come back later instead of a 500
+        print(f" Error 503 - {str(e)}")
+        headers = {"Retry-After": str(max(1, round(e.retry_after)))} if e.retry_after else None
+        raise HTTPException(status_code=503, detail=str(e), headers=headers)
     except Exception as e:
         print(f" Error 500 - {str(e)}")
         stacktrace = traceback.format_exc()  # 🔹 Captura todo el stacktrace como string
         print(stacktrace)
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _run_improve_job(payload: dict) -> dict:
+    response = await _run_improve(ImproveRequest(**payload))
+    return response.model_dump()
+
+def _job_worker_pool(concurrency: int) -> JobWorkerPool:
+    # Provider down or circuit open is transient: the job is retried later instead of failed
+    return JobWorkerPool(_jobs, _run_improve_job, concurrency=concurrency, retry_on=(LLMUnavailableError,))
+
+@app.post("/jobs", response_model=JobResponse, status_code=202)
+async def create_job(req: ImproveRequest):
+    """
+    Enqueues an /improve request and returns immediately with the job id.
+    Poll GET /jobs/{id} for the status and the ImproveResponse once it succeeds.
+    """
+    job = await asyncio.to_thread(_jobs.enqueue, req.model_dump())
+    return JobResponse(**job)
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    job = await asyncio.to_thread(_jobs.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return JobResponse(**job)
+
+@app.delete("/jobs/{job_id}", response_model=JobResponse)
+async def cancel_job(job_id: str):
+    """Cancels a queued or running job. Finished jobs cannot be cancelled (409)."""
+    job = await asyncio.to_thread(_jobs.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    if job["status"] in FINISHED_STATUSES and job["status"] != "cancelled":
+        raise HTTPException(status_code=409, detail=f"Job {job_id} already {job['status']}")
+    job = await asyncio.to_thread(_jobs.cancel, job_id)
+    return JobResponse(**job)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Per-stage latency histograms and OpenAI token counters in Prometheus text format."""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Hit/miss counters of the /improve response cache, each memoized LLM stage and the retrieval cache, for this worker."""
+    return {
+        "response_cache": _cache.stats(),
+        "stage_cache": _service.stage_cache_stats(),
+        "retrieval_cache": _service.retrieval_cache.stats() if _service.retrieval_cache else None,
+        "singleflight": {"improve": _improve_flight.stats(), "retrieve_context": _retrieve_flight.stats()},
+    }
+
+@app.get("/llm/stats")
+def llm_stats():
+    """Adaptive concurrency limit, in-flight calls and circuit breaker state of the shared OpenAI client."""
+    return _llm_client.stats()
+
+def _sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/improve/stream")
+async def improve_stream(req: ImproveRequest):
+    """
+    Streaming variant of /improve using Server-Sent Events.
+    Emits one event per pipeline stage (metrics_before, analysis, context,
+    recommendations, code_delta..., code, metrics_after) as soon as it is ready.
+    In split mode a `unit` event is also sent as each function/class is improved.
+    Failures are reported as an `error` event because the 200 status is already sent.
+    """
+    async def event_source():
+        try:
+            async for event, data in _service.stream_workflow(
+                req.Code, req.Tests, retrieval_mode=req.RetrievalMode, pipeline_mode=req.PipelineMode,
+                split_mode=req.SplitMode
+            ):
+                yield _sse_event(event, data)
+        except Exception as e:
+            print(f" Error in stream - {str(e)}")
+            print(traceback.format_exc())
+            yield _sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/retrieve_context", response_model=RetrieveContextResponse)
 async def retrieve_context(req: RetrieveContextRequest):
     try:
-        # Call the _retrieve_context method from the service
-        _, chunk_details = _service._retrieve_context(req.Query)
+        # Call the _retrieve_context method from the service; identical concurrent queries share one search
+        (_, chunk_details), _ = await _retrieve_flight.do(
+            make_cache_key(req.Query),
+            lambda: asyncio.to_thread(_service._retrieve_context, req.Query)
+        )
         
         print(f" ... {len(chunk_details)} items founded")
         print(f"Vectorizer Pkl {TFIDF_VECTORIZER_PATH}")
@@ -100,3 +434,49 @@ async def retrieve_context(req: RetrieveContextRequest):
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/retrieve_context/batch", response_model=RetrieveContextBatchResponse)
+async def retrieve_context_batch(req: RetrieveContextBatchRequest):
+    """
+    Retrieves context for many queries in one call: they are encoded together and
+    searched in one batched request, with each query's own TopK. Results are grouped
+    by query, in request order, and not deduplicated across queries.
+    """
+    queries = [q.Query for q in req.Queries]
+    limits = [q.TopK if q.TopK is not None else req.TopK for q in req.Queries]
+    try:
+        batch_results = await asyncio.to_thread(_service.retrieve_batch, queries, limits)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return RetrieveContextBatchResponse(Results=[
+        QueryContext(
+            QueryId=q.QueryId,
+            Query=q.Query,
+            RetrievedContext=[
+                {"score": hit.get("score", 0.0), "page": hit.get("page"), "chunk_id": hit.get("chunk_id"), "text": hit.get("text", "")}
+                for hit in hits
+            ],
+        )
+        for q, hits in zip(req.Queries, batch_results)
+    ])
+
+@app.post("/code_metrics", response_model=Metrics)
+async def code_metrics(req: CodeMetricsRequest):
+    """
+    Metrics of one snippet (the `before` of /improve, with the per-function breakdown),
+    without retrieval or LLM calls.
+    """
+    with timed("code_metrics"):
+        return Metrics(**await asyncio.to_thread(calculate_metrics, req.Code))
+
+@app.post("/code_metrics/batch", response_model=CodeMetricsBatchResponse)
+async def code_metrics_batch(req: CodeMetricsBatchRequest):
+    """
+    Metrics of many files in one call, without the LLM. Large batches are measured in a
+    process pool (METRICS_WORKERS); results are in request order.
+    """
+    with timed("code_metrics_batch"):
+        measured = await _metrics_pool.measure([f.Code for f in req.Files])
+    return CodeMetricsBatchResponse(Results=[
+        FileMetrics(Path=f.Path, metrics=Metrics(**metrics)) for f, metrics in zip(req.Files, measured)
+    ])
@@ -0,0 +1,85 @@
+# build_snapshot.py
+"""
+Builds the in-memory retrieval snapshot used with RETRIEVER=memory
+(see src/service/sparse_index.py).
+
+From the Qdrant collection (same vectors and payloads the qdrant retriever searches):
+
+    python build_snapshot.py ../infra/snapshot --qdrant-url http://localhost:6333
+
+From a JSONL file of chunk payloads ({"text": ..., "page": ..., "chunk_id": ...} per line),
+encoded with the knowledge-base vectorizer (pickle or export_vectorizer.py artifact):
+
+    python build_snapshot.py ../infra/snapshot --chunks chunks.jsonl --vectorizer ../infra/tfidf_vectorizer
+
+Then set RETRIEVER=memory and RETRIEVER_SNAPSHOT_PATH to the output directory.
+
+With --weighting bm25 the snapshot holds the chunks' term counts, lengths and IDF for
+RETRIEVER=bm25 instead; it always needs the vectorizer (its vocabulary is reused) and
+takes the chunk texts from --chunks or from the collection's payloads.
+"""
+import argparse
+import json
+import os
+
+from src.service.retrievers import SPARSE_VECTOR_NAME, encode_queries, sparse_pairs
+from src.service.sparse_index import BM25Index, SparseIndex, scroll_points
+from src.service.tfidf_artifact import TfidfQueryEncoder, is_artifact
+
+
+def load_vectorizer(path: str):
+    if is_artifact(path):
+        return TfidfQueryEncoder.load(path)
+    from export_vectorizer import load_pickle
+    return load_pickle(path)
+
+
+def load_chunks(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("output_dir")
+    parser.add_argument("--qdrant-url", default=os.getenv("QDRANT_URL"))
+    parser.add_argument("--collection", default=os.getenv("QDRANT_COLLECTION", "code_knowledge"))
+    parser.add_argument("--chunks", help="JSONL of chunk payloads; builds from text instead of Qdrant")
+    parser.add_argument("--vectorizer", default=os.getenv("TFIDF_VECTORIZER_PATH"))
+    parser.add_argument("--weighting", default="tfidf", choices=("tfidf", "bm25"))
+    args = parser.parse_args()
+
+    if not args.chunks and not args.qdrant_url:
+        parser.error("pass --chunks or --qdrant-url (or set QDRANT_URL)")
+    if (args.chunks or args.weighting == "bm25") and not args.vectorizer:
+        parser.error("--chunks and --weighting bm25 need --vectorizer (or TFIDF_VECTORIZER_PATH)")
+
+    client = None
+    if args.chunks:
+        chunks = load_chunks(args.chunks)
+        source = os.path.basename(args.chunks)
+    else:
+        from qdrant_client import QdrantClient
+        client = QdrantClient(url=args.qdrant_url, prefer_grpc=False, check_compatibility=False)
+        source = f"qdrant:{args.collection}"
+
+    if args.weighting == "bm25":
+        if client is not None:
+            chunks = [dict(p.payload or {}) for p in scroll_points(client, args.collection, False)]
+        encoder = TfidfQueryEncoder.wrap(load_vectorizer(args.vectorizer))
+        counts = encoder.counts([c.get("text") or "" for c in chunks])
+        index = BM25Index.from_counts(sparse_pairs(counts), chunks, n_terms=counts.shape[1], source=source)
+    elif client is not None:
+        index = SparseIndex.from_qdrant(client, args.collection, SPARSE_VECTOR_NAME)
+    else:
+        vectors = encode_queries(load_vectorizer(args.vectorizer), [c.get("text") or "" for c in chunks])
+        index = SparseIndex.from_vectors(vectors, chunks, source=source)
+
+    index.save(args.output_dir)
+    size = sum(os.path.getsize(os.path.join(args.output_dir, f)) for f in os.listdir(args.output_dir))
+    print(f"{index.WEIGHTING} snapshot of {index.n_docs} chunks, {len(index.docs)} postings ({index.meta['source']}) "
+          f"saved to {args.output_dir}: {size / 1024:.0f} KiB, fingerprint {index.fingerprint}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+import os
+
+# api reads these at import time: a dummy key (the OpenAI client is never reached in tests)
+# and no disk tier for the response cache
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+os.environ.setdefault("IMPROVE_CACHE_PATH", "")
@@ -0,0 +1,50 @@
+# export_vectorizer.py
+"""
+Exports the pickled TfidfVectorizer to the compact, memory-mappable artifact the API
+reads without sklearn (see src/service/tfidf_artifact.py).
+
+    python export_vectorizer.py ../infra/tfidf_vectorizer.pkl ../infra/tfidf_vectorizer
+
+Then point TFIDF_VECTORIZER_PATH at the output directory. Use --idf-dtype float64 to
+keep the IDF weights at full precision (larger file, vectors identical to sklearn's).
+"""
+import argparse
+import os
+import pickle
+
+from src.service.tfidf_artifact import TfidfQueryEncoder, export_vectorizer
+
+
+def load_pickle(path: str):
+    try:
+        import joblib  # the knowledge-base notebook may save with joblib
+        return joblib.load(path)
+    except ImportError:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pickle_path")
+    parser.add_argument("output_dir")
+    parser.add_argument("--idf-dtype", default="float32", choices=("float32", "float64"))
+    args = parser.parse_args()
+
+    vectorizer = load_pickle(args.pickle_path)
+    meta = export_vectorizer(vectorizer, args.output_dir, idf_dtype=args.idf_dtype)
+
+    # Sanity check: the artifact encodes a sample query to the same columns as the pickle
+    sample = "functions should do one thing and avoid deeply nested loops"
+    expected = vectorizer.transform([sample])
+    indices, values = TfidfQueryEncoder.load(args.output_dir).encode(sample)
+    assert indices.tolist() == sorted(expected.indices.tolist()), "artifact and pickle disagree"
+
+    size = sum(os.path.getsize(os.path.join(args.output_dir, f)) for f in os.listdir(args.output_dir))
+    print(f"Exported {meta['n_terms']} terms ({meta['idf_dtype']} idf) to {args.output_dir}: "
+          f"{size / 1024:.0f} KiB vs {os.path.getsize(args.pickle_path) / 1024:.0f} KiB pickled, "
+          f"fingerprint {meta['fingerprint']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Scripted stand-in for the AsyncOpenAI client used by the tests: `llm.chat.completions.create(...)`
+answers each pipeline stage without any network call.
+"""
+import asyncio
+from collections import Counter
+from types import SimpleNamespace
+
+DEFAULT_RESPONSES = {
+    "describe": "## Purpose\nDoes what its name says.",
+    "recommendations": "- Add a docstring",
+    "refactor": "",
+    "fused": "",
+}
+
+
+def stage_of(prompt: str, kwargs: dict) -> str:
+    """Pipeline stage of a completion call, told apart by its prompt (and JSON mode for fused)."""
+    if "Analyze these aspects" in prompt:
+        return "describe"
+    if kwargs.get("response_format") == {"type": "json_object"}:
+        return "fused"
+    if "code reviewer" in prompt:
+        return "recommendations"
+    return "refactor"
+
+
+def completion(content, usage=None):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=usage)
+
+
+def delta(content):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+
+class FakeStream:
+    """A streamed answer: the code in a ```python fence, one line per chunk."""
+
+    def __init__(self, text):
+        self.pieces = ["```python\n"] + [line + "\n" for line in text.splitlines()] + ["```"]
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for piece in self.pieces:
+            await asyncio.sleep(0)
+            yield delta(piece)
+
+
+class FakeLLM:
+    """
+    Each call answers with the response of its stage (describe, recommendations, refactor,
+    fused), given as a keyword: a string or a function of the prompt. Every call waits
+    `delay` seconds like a network round-trip; `usage` is reported on every answer and
+    stream=True calls stream the answer. Records the calls and the last prompt per stage
+    and the peak number of calls in flight.
+    """
+
+    def __init__(self, delay: float = 0.0, usage=None, **responses):
+        self.responses = {**DEFAULT_RESPONSES, **responses}
+        self.delay = delay
+        self.usage = usage
+        self.calls = Counter()
+        self.prompts = {}
+        self.active = 0
+        self.max_active = 0
+        self.chat = SimpleNamespace(completions=self)
+
+    async def create(self, model=None, messages=(), stream=False, **kwargs):
+        prompt = messages[-1]["content"]
+        stage = stage_of(prompt, kwargs)
+        self.calls[stage] += 1
+        self.prompts[stage] = prompt
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            if self.delay:
+                await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+        content = self.responses[stage]
+        if callable(content):
+            content = content(prompt)
+        return FakeStream(content) if stream else completion(content, self.usage)
@@ -1,6 +1,19 @@
 # /src/domain/models.py
 from pydantic import BaseModel, Field
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Literal
+
+# Tamaño máximo (caracteres) del código de cada archivo en /code_metrics y /code_metrics/batch
+MAX_METRICS_CODE_LENGTH = 2 * 1024 * 1024
+
+class FunctionMetrics(BaseModel):
+    name: str = Field(..., description="Name of the function/method")
+    start_line: int = Field(..., description="Line of the definition")
+    end_line: int = Field(..., description="Last line of the function body")
+    line_count: int = Field(..., description="Number of lines from start_line to end_line")
+    cyclomatic_complexity: int = Field(1, description="Cyclomatic complexity of the function (nested functions are reported on their own)")
+    max_nesting: int = Field(1, description="Maximum nesting level inside the function, its body being level 1")
+    number_of_ifs: int = Field(0, description="Number of if statements in the function")
+    number_of_loops: int = Field(0, description="Number of loops in the function")
 
 class Metrics(BaseModel):
     method_number: int = Field(0, description="Number of methods/functions in the code")
@@ -9,6 +22,8 @@ class Metrics(BaseModel):
     cyclomatic_complexity: int = Field(1, description="Cyclomatic complexity of the code")
     average_method_size: float = Field(0.0, description="Average number of lines of code per method")
     max_nesting: int = Field(0, description="Maximum nesting level in the code")
+    partial: bool = Field(False, description="True when the code could not be parsed into a syntax tree (too large or too deeply nested) and the metrics come from a token scan")
+    functions: List[FunctionMetrics] = Field([], description="Per-function breakdown of the metrics, in source order (empty when the code has no Python syntax tree)")
 
 class MetricsResponse(BaseModel):
     before: Metrics = Field(Metrics(), description="Metrics before code improvement")
@@ -17,6 +32,16 @@ class MetricsResponse(BaseModel):
 class ImproveRequest(BaseModel):
     Code: str = Field(..., description="Código fuente a analizar y mejorar")
     Tests: Optional[str] = Field(None, description="Pruebas asociadas al código para considerar en la mejora")
+    RetrievalMode: Optional[Literal["analysis", "code", "hybrid"]] = Field(
+        None, description="Origen de las queries de contexto: analysis (LLM), code (derivadas del código, en paralelo) o hybrid. Por defecto RETRIEVAL_MODE"
+    )
+    PipelineMode: Optional[Literal["staged", "fused"]] = Field(
+        None, description="staged: recomendaciones y refactor en dos llamadas; fused: una sola llamada estructurada. Por defecto PIPELINE_MODE"
+    )
+    SplitMode: Optional[Literal["off", "units", "auto"]] = Field(
+        None, description="units: mejora cada función/clase de primer nivel en paralelo y reensambla el módulo; auto: solo en archivos grandes. Por defecto SPLIT_MODE"
+    )
+    IncludeTimings: bool = Field(False, description="Adjunta los tiempos por etapa y el uso de tokens a la respuesta")
 
 class RetrieveContextRequest(BaseModel):
     Query: str = Field(..., description="Consulta para recuperar contexto")
@@ -30,8 +55,67 @@ class ChunkDetail(BaseModel):
 class RetrieveContextResponse(BaseModel):
     RetrievedContext: List[ChunkDetail] = []
 
+class BatchQuery(BaseModel):
+    Query: str = Field(..., description="Consulta para recuperar contexto")
+    QueryId: Optional[str] = Field(None, description="Identificador opcional, se devuelve con sus resultados")
+    TopK: Optional[int] = Field(None, ge=0, le=100, description="Chunks a devolver para esta consulta. Por defecto el TopK del lote")
+
+class RetrieveContextBatchRequest(BaseModel):
+    Queries: List[BatchQuery] = Field(..., min_length=1, max_length=1000, description="Consultas; se codifican juntas y se buscan en una sola petición")
+    TopK: int = Field(5, ge=0, le=100, description="Chunks por consulta cuando la consulta no indica el suyo")
+
+class QueryContext(BaseModel):
+    QueryId: Optional[str] = None
+    Query: str
+    RetrievedContext: List[ChunkDetail] = []
+
+class RetrieveContextBatchResponse(BaseModel):
+    Results: List[QueryContext] = Field([], description="Resultados por consulta, en el mismo orden que Queries")
+
+class CodeMetricsRequest(BaseModel):
+    Code: str = Field(..., max_length=MAX_METRICS_CODE_LENGTH, description="Código fuente a medir (sin LLM)")
+
+class CodeFile(BaseModel):
+    Code: str = Field(..., max_length=MAX_METRICS_CODE_LENGTH, description="Código fuente del archivo")
+    Path: Optional[str] = Field(None, description="Ruta o identificador opcional, se devuelve con sus métricas")
+
+class CodeMetricsBatchRequest(BaseModel):
+    Files: List[CodeFile] = Field(..., min_length=1, max_length=10000, description="Archivos a medir; los lotes grandes se reparten en un pool de procesos")
+
+class FileMetrics(BaseModel):
+    Path: Optional[str] = None
+    metrics: Metrics
+
+class CodeMetricsBatchResponse(BaseModel):
+    Results: List[FileMetrics] = Field([], description="Métricas por archivo, en el mismo orden que Files")
+
+class CacheInfo(BaseModel):
+    status: str = Field(..., description="hit, miss o coalesced (compartió una ejecución en curso)")
+    tier: Optional[str] = Field(None, description="Nivel que respondió: memory o disk")
+    key: Optional[str] = Field(None, description="Clave de contenido usada para la búsqueda")
+
+class TimingsInfo(BaseModel):
+    total: float = Field(..., description="Segundos totales de la petición")
+    stages: Dict[str, float] = Field({}, description="Segundos por etapa (metrics_before, describe, vectorizer_transform, qdrant_search, recommendations, refactor, metrics_after)")
+    tokens: Dict[str, Dict[str, int]] = Field({}, description="Uso de tokens de OpenAI por etapa")
+    prompt: Dict[str, Dict[str, int]] = Field({}, description="Tokens de cada parte del prompt (code, analysis, context, tests) por etapa, tras aplicar el presupuesto")
+    degraded: Dict[str, List[str]] = Field({}, description="Partes recortadas por etapa, p.ej. context:dropped_chunks o tests:signatures")
+
 class ImproveResponse(BaseModel):
     Analisis: str
     Code: str
     RetrievedContext: List[ChunkDetail] = []
     metrics: Optional[MetricsResponse] = None
+    cache: Optional[CacheInfo] = None
+    timings: Optional[TimingsInfo] = None
+
+
+class JobResponse(BaseModel):
+    id: str
+    status: str = Field(..., description="queued, running, succeeded, failed o cancelled")
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    attempts: int = 0
+    result: Optional[ImproveResponse] = None
+    error: Optional[str] = None
@@ -0,0 +1,257 @@
+# /src/service/cache_service.py
+from __future__ import annotations
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional, Tuple, Dict, Any, Iterator
+import ast
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+
+def normalize_code(code: Optional[str]) -> str:
+    """
+    Normaliza el código para que diferencias triviales (CRLF, espacios al final de
+    línea, líneas vacías al inicio/fin) no generen claves de caché distintas.
+    """
+    if not code:
+        return ""
+    lines = code.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip("\n")
+
+
+def make_cache_key(*parts: Optional[str]) -> str:
+    """SHA-256 over the given parts; None and "" are distinct from each other."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if part is None:
+            digest.update(b"\x00none")
+        else:
+            digest.update(b"\x01" + part.encode("utf-8"))
+        digest.update(b"\x1f")
+    return digest.hexdigest()
+
+
+def code_fingerprint(code: str) -> str:
+    """
+    Hash of the code's AST, so whitespace- and comment-only edits keep the same
+    fingerprint. Code that does not parse as Python falls back to its text with
+    whitespace collapsed.
+    """
+    try:
+        canonical = "ast:" + ast.dump(ast.parse(code))
+    except (SyntaxError, ValueError):
+        canonical = "text:" + " ".join(code.split())
+    return make_cache_key(canonical)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Memory tier: thread-safe LRU
+# ─────────────────────────────────────────────────────────────────────────────
+class LRUCache:
+    """Size-bounded, thread-safe LRU mapping that tracks its own hits and misses."""
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+        }
+
+
+class TTLCache(LRUCache):
+    """LRUCache whose entries also expire `ttl` seconds after they were stored (None = never)."""
+
+    def __init__(self, maxsize: int = 256, ttl: Optional[float] = None, clock=time.monotonic):
+        super().__init__(maxsize)
+        self.ttl = ttl
+        self.clock = clock
+        self.expired = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] is not None and entry[0] <= self.clock():
+                del self._data[key]
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, value: Any) -> None:
+        expires_at = self.clock() + self.ttl if self.ttl else None
+        super().set(key, (expires_at, value))
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "ttl": self.ttl, "expired": self.expired}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Disk tier: SQLite shared by every uvicorn worker on the host
+# ─────────────────────────────────────────────────────────────────────────────
+class SqliteCacheStore:
+    """
+    Persistent key/value store in SQLite. WAL mode lets several worker processes read
+    and write the same file; entries beyond `max_entries` are pruned oldest-access first.
+    """
+
+    def __init__(self, path: str, max_entries: int = 10000):
+        self.path = path
+        self.max_entries = max_entries
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # One short-lived connection per operation: safe across threads and processes
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            conn.execute(
+                """
+                DELETE FROM cache WHERE key IN (
+                    SELECT key FROM cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+
+    def __len__(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ResponseCache: memory LRU in front of the SQLite tier
+# ─────────────────────────────────────────────────────────────────────────────
+class ResponseCache:
+    """
+    Content-addressed cache for /improve responses. Values are serialized strings.
+    Lookups try the in-process LRU first, then the SQLite tier (promoting hits to memory).
+    """
+
+    def __init__(self, memory_size: int = 256, disk_path: Optional[str] = None, disk_max_entries: int = 10000):
+        self.memory = LRUCache(memory_size)
+        self.disk = SqliteCacheStore(disk_path, disk_max_entries) if disk_path else None
+        self._lock = threading.Lock()
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+
+    @staticmethod
+    def make_key(code: str, tests: Optional[str], model: str, kb_version: str, *options: Optional[str]) -> str:
+        # options: pipeline settings that change the answer (retrieval mode, pipeline mode...)
+        return make_cache_key(normalize_code(code), normalize_code(tests) if tests else None, model, kb_version, *options)
+
+    def get(self, key: str) -> Tuple[Optional[str], Optional[str]]:
+        """Returns (value, tier) where tier is "memory", "disk" or None on a miss."""
+        value = self.memory.get(key)
+        if value is not None:
+            self._count("memory")
+            return value, "memory"
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+                self._count("disk")
+                return value, "disk"
+        self._count(None)
+        return None, None
+
+    def set(self, key: str, value: str) -> None:
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def _count(self, tier: Optional[str]) -> None:
+        with self._lock:
+            if tier is None:
+                self.misses += 1
+            else:
+                self.hits[tier] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.hits["memory"] + self.hits["disk"]
+        lookups = hits + self.misses
+        return {
+            "hits": hits,
+            "memory_hits": self.hits["memory"],
+            "disk_hits": self.hits["disk"],
+            "misses": self.misses,
+            "hit_rate": (hits / lookups) if lookups else 0.0,
+            "memory_size": len(self.memory),
+            "memory_maxsize": self.memory.maxsize,
+            "disk_path": self.disk.path if self.disk else None,
+        }
@@ -0,0 +1,237 @@
+# /src/service/code_splitter.py
+from __future__ import annotations
+from typing import Optional, Dict, List, Set, Tuple, Union
+import ast
+
+# Entry point used by the functional tests: never sent to the LLM in split mode
+ENTRY_POINT = "execute"
+
+
+class CodeUnit:
+    """A top-level function or class, with its decorators, as it appears in the source."""
+
+    def __init__(self, name: str, kind: str, source: str, signature: str):
+        self.name = name
+        self.kind = kind  # "function" | "class"
+        self.source = source
+        self.signature = signature
+
+    @property
+    def improvable(self) -> bool:
+        return self.name != ENTRY_POINT
+
+    def __repr__(self) -> str:
+        return f"CodeUnit({self.kind} {self.name})"
+
+
+class ModuleSplit:
+    """
+    A module cut into an ordered list of segments: plain text (imports, globals,
+    comments, `if __name__ == ...` blocks) and CodeUnits. Joining the segments gives
+    back the original source.
+    """
+
+    def __init__(self, segments: List[Union[str, CodeUnit]]):
+        self.segments = segments
+
+    @property
+    def units(self) -> List[CodeUnit]:
+        return [s for s in self.segments if isinstance(s, CodeUnit)]
+
+    @property
+    def improvable_units(self) -> List[CodeUnit]:
+        return [u for u in self.units if u.improvable]
+
+    def outline(self, exclude: Optional[str] = None) -> str:
+        """Module text with every unit (except `exclude`) reduced to its signature."""
+        parts = []
+        for segment in self.segments:
+            if isinstance(segment, CodeUnit):
+                if segment.name != exclude:
+                    parts.append(segment.signature)
+            elif segment.strip():
+                parts.append(segment.strip("\n"))
+        return "\n\n".join(parts)
+
+    def reassemble(self, improved: Dict[str, str]) -> str:
+        """
+        Rebuilds the module replacing each unit by its improved source. Improved
+        sources that do not parse or no longer define the unit keep the original, and
+        so do the ones whose added helpers (top-level names other than the unit) clash
+        with a name of the module or a helper already added by an earlier unit: the
+        later definition would silently shadow the other one.
+        Imports the improved units need are hoisted to the module header (after the
+        existing imports), skipping the ones already present.
+        """
+        existing_imports = {ast.unparse(node) for node in _top_level_imports(self._text_source())}
+        taken = _top_level_names(self._original_source())
+        new_imports: List[str] = []
+        pieces: List[Tuple[str, bool]] = []  # (text, replaced)
+        for segment in self.segments:
+            if not isinstance(segment, CodeUnit):
+                pieces.append((segment, False))
+                continue
+            source = improved.get(segment.name)
+            if source is None or not is_valid_replacement(segment, source):
+                pieces.append((segment.source, False))
+                continue
+            added = _top_level_names(source, imports=False) - {segment.name}
+            if added & taken:
+                print(f"Keeping the original {segment.name}: its helpers {sorted(added & taken)} clash with the module")
+                pieces.append((segment.source, False))
+                continue
+            taken |= added
+            body, imports = _split_imports(source)
+            for stmt in imports:
+                if stmt not in existing_imports and stmt not in new_imports:
+                    new_imports.append(stmt)
+            pieces.append((body.strip("\n") + "\n", True))
+        return _insert_imports(_join_pieces(pieces), new_imports)
+
+    def _text_source(self) -> str:
+        return "".join(s for s in self.segments if isinstance(s, str))
+
+    def _original_source(self) -> str:
+        return "".join(s.source if isinstance(s, CodeUnit) else s for s in self.segments)
+
+
+def _interface(node: ast.AST) -> str:
+    # What the rest of the module relies on: decorators and, for functions, the parameters
+    decorators = [ast.dump(d) for d in node.decorator_list]
+    params = ast.dump(node.args) if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) else ""
+    return f"{type(node).__name__}:{decorators}:{params}"
+
+
+def _find_definition(tree: ast.Module, name: str) -> Optional[ast.AST]:
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)) and node.name == name:
+            return node
+    return None
+
+
+def is_valid_replacement(unit: CodeUnit, source: str) -> bool:
+    """
+    The improved source must parse and still define the unit at top level with the
+    same decorators and parameters, since the rest of the module calls it.
+    """
+    try:
+        improved = _find_definition(ast.parse(source), unit.name)
+    except (SyntaxError, ValueError):
+        return False
+    original = _find_definition(ast.parse(unit.source), unit.name)
+    return improved is not None and _interface(improved) == _interface(original)
+
+
+def split_module(code: str) -> Optional[ModuleSplit]:
+    """
+    Splits Python source at its top-level functions and classes.
+    Returns None when the code does not parse (e.g. another language).
+    """
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return None
+
+    lines = code.splitlines(keepends=True)
+    segments: List[Union[str, CodeUnit]] = []
+    cursor = 0  # 0-based line index of the first line not yet assigned
+    for node in tree.body:
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            continue
+        start = min([d.lineno for d in node.decorator_list] + [node.lineno]) - 1
+        end = node.end_lineno
+        if start > cursor:
+            segments.append("".join(lines[cursor:start]))
+        source = "".join(lines[start:end])
+        body_start = node.body[0].lineno - 1
+        signature = "".join(lines[start:max(body_start, node.lineno)]).rstrip() + "\n    ..."
+        kind = "class" if isinstance(node, ast.ClassDef) else "function"
+        segments.append(CodeUnit(node.name, kind, source, signature))
+        cursor = end
+    if cursor < len(lines):
+        segments.append("".join(lines[cursor:]))
+    return ModuleSplit(segments)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Stitching helpers
+# ─────────────────────────────────────────────────────────────────────────────
+def _top_level_imports(source: str) -> List[ast.stmt]:
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return []
+    return [n for n in tree.body if isinstance(n, (ast.Import, ast.ImportFrom))]
+
+
+def _top_level_names(source: str, imports: bool = True) -> Set[str]:
+    """Names bound at module level: definitions, assignments and (optionally) imports."""
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return set()
+    names: Set[str] = set()
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, (ast.Assign, ast.AnnAssign, ast.AugAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            for target in targets:
+                names.update(n.id for n in ast.walk(target) if isinstance(n, ast.Name))
+        elif imports and isinstance(node, (ast.Import, ast.ImportFrom)):
+            names.update((a.asname or a.name).split(".")[0] for a in node.names if a.name != "*")
+    return names
+
+
+def _split_imports(source: str):
+    """Separates the top-level imports an improved unit added from the rest of its code."""
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return source, []
+    import_lines = set()
+    imports = []
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            imports.append(ast.unparse(node))
+            import_lines.update(range(node.lineno - 1, node.end_lineno))
+    if not imports:
+        return source, []
+    kept = [line for i, line in enumerate(source.splitlines(keepends=True)) if i not in import_lines]
+    return "".join(kept).strip("\n") + "\n", imports
+
+
+def _insert_imports(module: str, new_imports: List[str]) -> str:
+    """Adds import lines right after the module's last leading import (or its docstring)."""
+    if not new_imports:
+        return module
+    anchor = 0
+    for i, node in enumerate(ast.parse(module).body):
+        is_docstring = i == 0 and isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant) \
+            and isinstance(node.value.value, str)
+        if not (is_docstring or isinstance(node, (ast.Import, ast.ImportFrom))):
+            break
+        anchor = node.end_lineno
+    lines = module.splitlines(keepends=True)
+    block = "\n".join(new_imports) + "\n"
+    if anchor == 0:
+        return block + "\n" + module
+    return "".join(lines[:anchor]) + block + "".join(lines[anchor:])
+
+
+def _join_pieces(pieces: List[Tuple[str, bool]]) -> str:
+    """
+    Joins the pieces; around replaced units it keeps the blank line PEP 8 expects
+    between top-level definitions. Untouched pieces are joined verbatim.
+    """
+    text = ""
+    previous_replaced = False
+    for piece, replaced in pieces:
+        if not piece:
+            continue
+        if text and (replaced or previous_replaced):
+            text = text.rstrip("\n") + "\n\n\n"
+            piece = piece.lstrip("\n")
+        text += piece
+        previous_replaced = replaced
+    return text
@@ -1,44 +1,107 @@
 # /src/service/improvement_service.py
 from __future__ import annotations
-from typing import Optional, Tuple, List, Union, Dict, Any
+from typing import Optional, Tuple, List, Union, Dict, Any, AsyncIterator, TYPE_CHECKING
 import re
-import os
-
-from openai import OpenAI
-from qdrant_client import QdrantClient
-from qdrant_client.http.models import NamedSparseVector, SparseVector
-from sklearn.feature_extraction.text import TfidfVectorizer
+import json
+import asyncio
 
 from src.service.metrics_service import calculate_metrics
+from src.service.cache_service import LRUCache, code_fingerprint, make_cache_key, normalize_code
+from src.service.telemetry import timed, record_usage
+from src.service.query_builder import build_code_queries
+from src.service.prompt_builder import PromptAssembler
+from src.service.code_splitter import ModuleSplit, CodeUnit, split_module
+from src.service.llm_client import ResilientLLMClient, create_llm_client
+from src.service.lazy_resource import LazyResource, resolve
+from src.service.retrievers import (  # noqa: F401 - search helpers re-exported for existing callers
+    Retriever, QdrantRetriever, CachedRetriever, RetrievalCache, SPARSE_VECTOR_NAME,
+    encode_queries, search_tfidf, search_tfidf_batch
+)
 from src.domain.models import Metrics, MetricsResponse
 
+if TYPE_CHECKING:  # heavy imports, only needed when retrieval actually runs
+    from openai import AsyncOpenAI
+    from qdrant_client import QdrantClient
 
-# ─────────────────────────────────────────────────────────────────────────────
-# Helper: TF-IDF sparse search in Qdrant
-# ─────────────────────────────────────────────────────────────────────────────
-def search_tfidf(
-    client: QdrantClient,
-    collection_name: str,
-    query: str,
-    vectorizer,
-    top_k: int = 5
-):
-    if client is None or vectorizer is None:
-        return []
-    q = vectorizer.transform([query])
-    idx = q.indices.tolist()
-    vals = q.data.tolist()
-
-    results = client.search(
-        collection_name=collection_name,
-        query_vector=NamedSparseVector(
-            name="text",  # Debe coincidir con tu sparse_vectors_config
-            vector=SparseVector(indices=idx, values=vals)
-        ),
-        limit=top_k,
-        with_payload=True
+
+# analysis: queries from the LLM description (waits for describe)
+# code:     queries derived from the code itself, searched while describe runs
+# hybrid:   code queries first, merged with the analysis queries if they arrive in budget
+RETRIEVAL_MODES = ("analysis", "code", "hybrid")
+# staged: recommendations and refactor are two sequential LLM calls
+# fused:  one structured call returns both (half the round-trips, code/context sent once)
+PIPELINE_MODES = ("staged", "fused")
+# off:   the whole file is one LLM pipeline
+# units: top-level functions/classes are improved concurrently and stitched back
+# auto:  units only when the file reaches split_min_tokens
+SPLIT_MODES = ("off", "units", "auto")
+MAX_CONTEXT_CHUNKS = 5
+
+
+# Constraints shared by every prompt that rewrites code
+REFACTOR_RULES = """Hard requirements (must comply):
+        1) 'execute' is the ONLY public entry point and the MAIN orchestrator.
+        2) Preserve 'execute' EXACT NAME and EXACT PARAMETER LIST (names, order, defaults, *args, **kwargs).
+        3) Keep 'execute' callable by existing code and tests (same module/class location).
+        4) You may create helper functions (e.g., 'main', 'run', '_impl'), BUT 'execute' must remain and call them as needed.
+        5) Do NOT change 'execute' decorators or return contract (type/shape of the return value).
+
+        Allowed changes (flexible):
+        - Refactor internal logic, extract helpers, rename local variables, reorder internal steps if behavior is unchanged.
+        - Improve readability, error handling, docstrings, and performance without altering observable behavior.
+
+        Behavioral constraint:
+        - The overall control flow triggered by calling 'execute(...)' must remain equivalent (same functional outcomes, same side effects order where visible to callers)."""
+
+
+def _top_chunks(chunk_details: List[Dict]) -> Tuple[str, List[Dict]]:
+    """Dedupes chunks by text, keeps the best scored ones and joins their text."""
+    unique: Dict[str, Dict] = {}
+    for chunk in chunk_details:
+        current = unique.get(chunk["text"])
+        if current is None or chunk["score"] > current["score"]:
+            unique[chunk["text"]] = chunk
+    top = sorted(unique.values(), key=lambda x: x["score"], reverse=True)[:MAX_CONTEXT_CHUNKS]
+    return "\n\n---\n\n".join(c["text"] for c in top), top
+
+def _parse_fused_response(text: str) -> Optional[Tuple[str, str]]:
+    """Parses the fused JSON answer into (recommendations_text, code); None if malformed."""
+    try:
+        data = json.loads(_clean_code(text))
+    except ValueError:
+        return None
+    if not isinstance(data, dict) or not isinstance(data.get("code"), str) or not data["code"].strip():
+        return None
+    recommendations = data.get("recommendations") or []
+    if isinstance(recommendations, list):
+        recommendations = "\n".join(f"- {str(r).lstrip('- ').strip()}" for r in recommendations)
+    return str(recommendations).strip(), _clean_code(data["code"])
+
+def _unit_scope(split: ModuleSplit, unit: CodeUnit) -> str:
+    """Scope note for one unit: what to return, and an outline of the rest of the module."""
+    return (
+        f"The code below is only the top-level {unit.kind} `{unit.name}` of a larger module. "
+        f"Improve only `{unit.name}` and return only its definition (you may add helper functions "
+        f"or imports above it). Keep its name, decorators and parameters unchanged because the rest "
+        f"of the module uses them. The `execute` rules refer to the module: do not add an `execute` "
+        f"function here.\n"
+        f"Rest of the module (read-only outline):\n{split.outline(exclude=unit.name)}"
     )
-    return results
+
+def _scope_section(scope: str) -> str:
+    """Prompt block that frames the code as one unit of a larger module (split mode)."""
+    if not scope:
+        return ""
+    return f"""
+        MODULE SCOPE:
+        {scope}
+        """
+
+def _clean_code(text: str) -> str:
+    """Remove any markdown code block markers the model may have added."""
+    cleaned_code = re.sub(r'^```\w*\s*', '', text)
+    cleaned_code = re.sub(r'```$', '', cleaned_code)
+    return cleaned_code.strip()
 
 # ─────────────────────────────────────────────────────────────────────────────
 # ImprovementService
@@ -47,41 +110,132 @@ class ImprovementService:
     def __init__(
         self,
         openai_model: str,
-        qdrant_client: Optional[QdrantClient],
+        qdrant_client: Optional[Union[QdrantClient, LazyResource]],
         qdrant_collection: Optional[str],
-        vectorizer
+        vectorizer,  # TfidfVectorizer o LazyResource que lo carga en el primer uso
+        llm_client: Optional[Union[AsyncOpenAI, ResilientLLMClient]] = None,
+        stage_cache_size: int = 512,
+        retrieval_mode: str = "analysis",
+        analysis_retrieval_budget: Optional[float] = None,
+        pipeline_mode: str = "staged",
+        prompt_budgets: Optional[Dict[str, Optional[int]]] = None,
+        split_mode: str = "off",
+        split_concurrency: int = 4,
+        split_min_tokens: int = 2000,
+        retriever: Optional[Union[Retriever, LazyResource]] = None,
+        retrieval_cache_size: int = 1024,
+        retrieval_cache_ttl: Optional[float] = 600.0,
+        knowledge_base_version: str = "",
+        collection_stamp_seconds: float = 30.0
     ):
         self.model = openai_model
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        # Cliente async: cada etapa hace await sin bloquear el event loop de uvicorn.
+        # Por defecto con reintentos, límite de concurrencia adaptativo y circuit breaker
+        self.client = llm_client or create_llm_client()
         self.qdrant = qdrant_client
         self.collection = qdrant_collection
+        # Versión de la base de conocimiento en Qdrant: re-ingestar con otra versión invalida la caché de retrieval
+        self.knowledge_base_version = knowledge_base_version
+        # Cada cuánto se relee el número de puntos de la colección (detecta re-ingestas sin cambiar la versión)
+        self.collection_stamp_seconds = collection_stamp_seconds
+        self._qdrant_retriever: Optional[QdrantRetriever] = None
         self.vectorizer = vectorizer
+        # Explicit backend (e.g. the in-memory index); by default Qdrant with the vectorizer
+        self._retriever = retriever
+        if retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode '{retrieval_mode}'. Expected one of {RETRIEVAL_MODES}")
+        self.retrieval_mode = retrieval_mode
+        # hybrid: seconds to wait for the analysis-query search once describe is done (None = no limit)
+        self.analysis_retrieval_budget = analysis_retrieval_budget
+        if pipeline_mode not in PIPELINE_MODES:
+            raise ValueError(f"Unknown pipeline mode '{pipeline_mode}'. Expected one of {PIPELINE_MODES}")
+        self.pipeline_mode = pipeline_mode
+        # Presupuesto de tokens por parte del prompt (code, analysis, context, tests)
+        self.prompts = PromptAssembler(prompt_budgets, model=openai_model)
+        if split_mode not in SPLIT_MODES:
+            raise ValueError(f"Unknown split mode '{split_mode}'. Expected one of {SPLIT_MODES}")
+        self.split_mode = split_mode
+        self.split_concurrency = split_concurrency
+        self.split_min_tokens = split_min_tokens
+        # Memo per etapa LLM, con claves derivadas de sus entradas reales
+        self.stage_cache: Dict[str, LRUCache] = {
+            stage: LRUCache(stage_cache_size) for stage in ("describe", "recommendations", "refactor", "recommend_refactor")
+        }
+        # Hits por query codificada (vector sparse); 0 = sin caché de retrieval
+        self.retrieval_cache = RetrievalCache(retrieval_cache_size, retrieval_cache_ttl) if retrieval_cache_size > 0 else None
+
+    # Qdrant and the vectorizer may be LazyResources: resolved on first retrieval
+    @property
+    def qdrant(self) -> Optional[QdrantClient]:
+        return resolve(self._qdrant)
+
+    @qdrant.setter
+    def qdrant(self, value) -> None:
+        self._qdrant = value
+
+    @property
+    def vectorizer(self):
+        return resolve(self._vectorizer)
+
+    @vectorizer.setter
+    def vectorizer(self, value) -> None:
+        self._vectorizer = value
+
+    @property
+    def retriever(self) -> Optional[Retriever]:
+        """Retrieval backend, or None when retrieval is not configured."""
+        if self._retriever is not None:
+            return resolve(self._retriever)
+        qdrant, vectorizer = self.qdrant, self.vectorizer
+        if not qdrant or not self.collection or not vectorizer:
+            return None
+        # Reused while the client and the vectorizer stay the same, so its collection stamp is rate-limited
+        current = self._qdrant_retriever
+        if current is None or current.client is not qdrant or current.vectorizer is not vectorizer:
+            current = QdrantRetriever(
+                qdrant, self.collection, vectorizer, self.knowledge_base_version, self.collection_stamp_seconds
+            )
+            self._qdrant_retriever = current
+        return current
+
+    @retriever.setter
+    def retriever(self, value) -> None:
+        self._retriever = value
 
     # -------------------- Public API --------------------
-    async def run_workflow(self, code: str, tests: Optional[str] = None) -> Tuple[str, str, List[Dict], MetricsResponse]:
+    async def run_workflow(
+        self,
+        code: str,
+        tests: Optional[str] = None,
+        retrieval_mode: Optional[str] = None,
+        pipeline_mode: Optional[str] = None,
+        split_mode: Optional[str] = None
+    ) -> Tuple[str, str, List[Dict], MetricsResponse]:
         """
         1) Describe y analiza el código (variables, métodos, bucles, responsabilidades)
-        2) Usa esa descripción como query TF-IDF en Qdrant para recuperar contexto (chunks)
+        2) Usa esa descripción como query TF-IDF en Qdrant para recuperar contexto (chunks);
+           en modo code/hybrid las queries salen del propio código y corren en paralelo con (1)
         3) Pide recomendaciones a OpenAI
         4) Pide código mejorado a OpenAI, considerando las pruebas si están disponibles
+           (en modo fused, 3 y 4 son una sola llamada estructurada)
+           (en modo split, 1-4 corren por función/clase de primer nivel, en paralelo)
         5) Calculate metrics before and after code improvement
         Returns: (analysis_text, improved_code, retrieved_context_details, metrics)
         """
 
         print("starting workflow")
 
-        # Calculate metrics before code improvement
-        before_metrics = calculate_metrics(code)
-        
-        analysis_list = await self._describe_code(code)
-        # Join the analysis list for display purposes
-        analysis = "\n\n".join(analysis_list)
-        retrieved_text, chunk_details = self._retrieve_context(analysis_list)
-        recommendations = await self._recommendations(code, analysis, retrieved_text)
-        improved_code = await self._refactor_code(code, recommendations, retrieved_text, tests)
-
-        # Calculate metrics after code improvement
-        after_metrics = calculate_metrics(improved_code)
+        # Non-streaming callers consume the same pipeline and keep only the final values
+        results: Dict[str, Any] = {}
+        async for event, data in self.stream_workflow(code, tests, stream_code=False, retrieval_mode=retrieval_mode,
+                                                     pipeline_mode=pipeline_mode, split_mode=split_mode):
+            results[event] = data
+
+        before_metrics = results["metrics_before"]
+        analysis = "\n\n".join(results["analysis"])
+        chunk_details = results["context"]
+        improved_code = results["code"]
+        after_metrics = results["metrics_after"]
         
         # Create metrics response
         metrics_response = MetricsResponse(
@@ -91,7 +245,9 @@ class ImprovementService:
                 number_of_loops=before_metrics["number_of_loops"],
                 cyclomatic_complexity=before_metrics["cyclomatic_complexity"],
                 average_method_size=before_metrics["average_method_size"],
-                max_nesting=before_metrics["max_nesting"]
+                max_nesting=before_metrics["max_nesting"],
+                partial=before_metrics.get("partial", False),
+                functions=before_metrics.get("functions", [])
             ),
             after=Metrics(
                 method_number=after_metrics["method_number"],
@@ -99,7 +255,9 @@ class ImprovementService:
                 number_of_loops=after_metrics["number_of_loops"],
                 cyclomatic_complexity=after_metrics["cyclomatic_complexity"],
                 average_method_size=after_metrics["average_method_size"],
-                max_nesting=after_metrics["max_nesting"]
+                max_nesting=after_metrics["max_nesting"],
+                partial=after_metrics.get("partial", False),
+                functions=after_metrics.get("functions", [])
             )
         )
 
@@ -109,8 +267,252 @@ class ImprovementService:
 
         return analysis, improved_code, chunk_details, metrics_response
 
+    async def stream_workflow(
+        self,
+        code: str,
+        tests: Optional[str] = None,
+        stream_code: bool = True,
+        retrieval_mode: Optional[str] = None,
+        pipeline_mode: Optional[str] = None,
+        split_mode: Optional[str] = None,
+        scope: Optional[str] = None
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Runs the improvement pipeline and yields (event, data) pairs as soon as each
+        stage finishes, in this order:
+            metrics_before  -> dict from calculate_metrics(code)
+            analysis        -> list of analysis sections
+            context         -> list of retrieved chunk details
+            recommendations -> recommendations text
+            code_delta      -> refactored code fragments (only when stream_code=True)
+            code            -> full refactored code, cleaned of markdown fences
+            metrics_after   -> dict from calculate_metrics(improved_code)
+
+        Each LLM stage is memoized on its real inputs: the code's AST fingerprint, the
+        analysis hash, the retrieved chunk ids and, for the refactor, the tests.
+
+        retrieval_mode (default: the service's) picks where the context queries come
+        from; see RETRIEVAL_MODES. pipeline_mode="fused" replaces the recommendations
+        and refactor calls with one structured call; see PIPELINE_MODES.
+
+        With split_mode "units" (or "auto" on large files) each top-level function or
+        class runs its own pipeline concurrently; a `unit` event is emitted as each one
+        finishes, before the aggregated analysis/context/recommendations/code events.
+        `scope` frames the code as one unit of a larger module in every prompt.
+        """
+        mode = retrieval_mode or self.retrieval_mode
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode '{mode}'. Expected one of {RETRIEVAL_MODES}")
+        pipeline = pipeline_mode or self.pipeline_mode
+        if pipeline not in PIPELINE_MODES:
+            raise ValueError(f"Unknown pipeline mode '{pipeline}'. Expected one of {PIPELINE_MODES}")
+
+        split = self._split_for(code, split_mode or self.split_mode)
+        if split is not None:
+            async for item in self._stream_units(code, split, tests, stream_code, mode, pipeline):
+                yield item
+            return
+
+        with timed("metrics_before"):
+            before_metrics = calculate_metrics(code)
+        yield "metrics_before", before_metrics
+
+        # Code-derived search starts now and overlaps with the describe round-trip
+        code_retrieval = None
+        if mode != "analysis":
+            code_queries = build_code_queries(code, before_metrics)
+            code_retrieval = asyncio.ensure_future(asyncio.to_thread(self._retrieve_context, code_queries))
+
+        try:
+            fingerprint = code_fingerprint(code)
+            if scope:
+                # The same function in another module gets different prompts
+                fingerprint = make_cache_key(fingerprint, scope)
+            describe_key = self._stage_key(fingerprint)
+            analysis_list = self.stage_cache["describe"].get(describe_key)
+            if analysis_list is None:
+                analysis_list = await self._describe_code(code, scope)
+                self.stage_cache["describe"].set(describe_key, analysis_list)
+        except BaseException:
+            if code_retrieval is not None:
+                code_retrieval.cancel()
+            raise
+        yield "analysis", list(analysis_list)
+
+        # Join the analysis list for display purposes
+        analysis = "\n\n".join(analysis_list)
+        _, chunk_details = await self._gather_context(mode, analysis_list, code_retrieval)
+        yield "context", chunk_details
+
+        chunk_ids = ",".join(str(c.get("chunk_id") or make_cache_key(c.get("text", ""))) for c in chunk_details)
+        tests_key = normalize_code(tests) if tests else None
+        if pipeline == "fused":
+            fused_key = self._stage_key(fingerprint, make_cache_key(analysis), chunk_ids, tests_key)
+            fused = self.stage_cache["recommend_refactor"].get(fused_key)
+            if fused is None:
+                fused = await self._recommend_and_refactor(code, analysis, chunk_details, tests, scope)
+                self.stage_cache["recommend_refactor"].set(fused_key, fused)
+            recommendations, improved_code = fused
+            yield "recommendations", recommendations
+            # The code arrives inside a JSON document, so it is sent as a single delta
+            if stream_code:
+                yield "code_delta", improved_code
+            yield "code", improved_code
+        else:
+            recommendations_key = self._stage_key(fingerprint, make_cache_key(analysis), chunk_ids)
+            recommendations = self.stage_cache["recommendations"].get(recommendations_key)
+            if recommendations is None:
+                recommendations = await self._recommendations(code, analysis, chunk_details, scope)
+                self.stage_cache["recommendations"].set(recommendations_key, recommendations)
+            yield "recommendations", recommendations
+
+            refactor_key = self._stage_key(
+                fingerprint, make_cache_key(recommendations), chunk_ids, tests_key
+            )
+            improved_code = self.stage_cache["refactor"].get(refactor_key)
+            if improved_code is not None:
+                if stream_code:
+                    yield "code_delta", improved_code
+            elif stream_code:
+                parts: List[str] = []
+                async for delta in self._refactor_code_stream(code, recommendations, chunk_details, tests, scope):
+                    parts.append(delta)
+                    yield "code_delta", delta
+                improved_code = _clean_code("".join(parts))
+            else:
+                improved_code = await self._refactor_code(code, recommendations, chunk_details, tests, scope)
+            self.stage_cache["refactor"].set(refactor_key, improved_code)
+            yield "code", improved_code
+
+        # Calculate metrics after code improvement
+        with timed("metrics_after"):
+            after_metrics = calculate_metrics(improved_code)
+        yield "metrics_after", after_metrics
+
+    def _split_for(self, code: str, split_mode: str) -> Optional[ModuleSplit]:
+        """Returns the module split when split mode applies, None for the whole-file pipeline."""
+        if split_mode not in SPLIT_MODES:
+            raise ValueError(f"Unknown split mode '{split_mode}'. Expected one of {SPLIT_MODES}")
+        if split_mode == "off":
+            return None
+        if split_mode == "auto" and self.prompts.count(code) < self.split_min_tokens:
+            return None
+        split = split_module(code)
+        if split is None:
+            return None
+        names = [unit.name for unit in split.units]
+        # One unit gains nothing, and redefined names cannot be stitched back unambiguously
+        if len(split.improvable_units) < 2 or len(set(names)) != len(names):
+            return None
+        return split
+
+    async def _stream_units(
+        self,
+        code: str,
+        split: ModuleSplit,
+        tests: Optional[str],
+        stream_code: bool,
+        retrieval_mode: str,
+        pipeline_mode: str
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Split mode: runs the pipeline on every improvable unit with at most
+        split_concurrency units in flight, then reassembles the module. Imports,
+        module globals and `execute` are kept as they are.
+        """
+        with timed("metrics_before"):
+            before_metrics = calculate_metrics(code)
+        yield "metrics_before", before_metrics
+
+        semaphore = asyncio.Semaphore(self.split_concurrency)
+
+        async def improve_unit(unit: CodeUnit) -> Tuple[CodeUnit, Dict[str, Any]]:
+            async with semaphore:
+                results: Dict[str, Any] = {}
+                async for event, data in self.stream_workflow(
+                    unit.source, tests, stream_code=False, retrieval_mode=retrieval_mode,
+                    pipeline_mode=pipeline_mode, split_mode="off", scope=_unit_scope(split, unit)
+                ):
+                    results[event] = data
+                return unit, results
+
+        units = split.improvable_units
+        print(f"Improving {len(units)} units, {self.split_concurrency} at a time...")
+        tasks = [asyncio.ensure_future(improve_unit(unit)) for unit in units]
+        unit_results: Dict[str, Dict[str, Any]] = {}
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                unit, results = await next_done
+                unit_results[unit.name] = results
+                yield "unit", {"name": unit.name, "kind": unit.kind, "code": results["code"]}
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        ordered = [unit_results[unit.name] for unit in units]
+        yield "analysis", [
+            f"{unit.name}: {section}" for unit, results in zip(units, ordered) for section in results["analysis"]
+        ]
+        _, chunk_details = _top_chunks([chunk for results in ordered for chunk in results["context"]])
+        yield "context", chunk_details
+        yield "recommendations", "\n\n".join(
+            f"## {unit.name}\n{results['recommendations']}" for unit, results in zip(units, ordered)
+        )
+
+        improved_code = split.reassemble({unit.name: results["code"] for unit, results in zip(units, ordered)})
+        if stream_code:
+            yield "code_delta", improved_code
+        yield "code", improved_code
+
+        with timed("metrics_after"):
+            after_metrics = calculate_metrics(improved_code)
+        yield "metrics_after", after_metrics
+
+    async def _gather_context(
+        self,
+        mode: str,
+        analysis_list: List[str],
+        code_retrieval: Optional[asyncio.Future]
+    ) -> Tuple[str, List[Dict]]:
+        # Qdrant client is synchronous: run it in a worker thread so other requests keep flowing
+        if code_retrieval is None:
+            return await asyncio.to_thread(self._retrieve_context, analysis_list)
+
+        code_text, code_chunks = await code_retrieval
+        if mode == "code":
+            return code_text, code_chunks
+
+        try:
+            _, analysis_chunks = await asyncio.wait_for(
+                asyncio.to_thread(self._retrieve_context, analysis_list),
+                timeout=self.analysis_retrieval_budget
+            )
+        except asyncio.TimeoutError:
+            print(f"Analysis retrieval over budget ({self.analysis_retrieval_budget}s), using code queries only")
+            return code_text, code_chunks
+        return _top_chunks(code_chunks + analysis_chunks)
+
+    def stage_cache_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Hit/miss counters and hit rate of each memoized LLM stage."""
+        return {stage: cache.stats() for stage, cache in self.stage_cache.items()}
+
+    def _stage_key(self, *parts: Optional[str]) -> str:
+        return make_cache_key(self.model, *parts)
+
+    async def _chat(self, stage: str, messages: List[Dict[str, str]], **kwargs):
+        """One chat completion for a pipeline stage, timed and with its token usage recorded."""
+        with timed(stage):
+            resp = await self.client.chat.completions.create(
+                model=self.model,
+            #    temperature=0.0,
+                messages=messages,
+                **kwargs
+            )
+        record_usage(stage, getattr(resp, "usage", None))
+        return resp
+
     # -------------------- Steps --------------------
-    async def _describe_code(self, code: str) -> List[str]:
+    async def _describe_code(self, code: str, scope: Optional[str] = None) -> List[str]:
         """
         Pide a OpenAI que describa el código: propósito, métodos/funciones, variables,
         bucles/condiciones y posibles problemas visibles (sin cambiar comportamiento).
@@ -119,6 +521,7 @@ class ImprovementService:
         """
         print("Describing...")
 
+        parts = self.prompts.build("describe", code=code, scope=scope)
         prompt = f"""
             You are a senior engineer. Analyze the following code and return a structured description with each aspect clearly separated.
             
@@ -135,21 +538,16 @@ class ImprovementService:
             Return plain text (no markdown fences)
 
             IMPORTANT: NEVER take care of the "execute" Function or its params because is used to perform functional tests. 
-
+            {_scope_section(parts.scope)}
             CODE:
-            {code}
+            {parts.code}
             """
-        resp = self.client.chat.completions.create(
-            model=self.model,
-        #    temperature=0.0,
-            messages=[
-                {"role": "system", "content": "Be precise and structured."},
-                {"role": "user", "content": prompt}
-            ]
-        )
+        resp = await self._chat("describe", [
+            {"role": "system", "content": "Be precise and structured."},
+            {"role": "user", "content": prompt}
+        ])
 
         content = resp.choices[0].message.content.strip()
-        print(resp)
         
         sections = []
         
@@ -183,10 +581,12 @@ class ImprovementService:
 
     def _retrieve_context(self, query_text: Union[str, List[str]]) -> Tuple[str, List[Dict]]:
         """
-        Realiza retrieval en Qdrant usando TF-IDF sparse search y concatena los top chunks.
+        Realiza retrieval (Qdrant o el índice en memoria, ver self.retriever) usando
+        TF-IDF sparse search y concatena los top chunks.
         
         Accepts either a single query string or a list of query strings.
-        For a list, it performs a search for each item and combines the results.
+        For a list, all queries are encoded together and searched in one batch
+        (one Qdrant request); the results are then combined.
         
         Returns:
             Tuple containing:
@@ -194,51 +594,33 @@ class ImprovementService:
             - A list of dictionaries with chunk details (score, page, chunk_id, text)
         """
         print("Retrieving Context...")
-        print(f"configuration : {self.qdrant} - {self.collection} - {self.vectorizer} ")
-
-        if not self.qdrant or not self.collection or not self.vectorizer:
-            return "", []
-            
-        all_chunks: List[str] = []
-        chunk_details: List[Dict] = []
-        
         queries = query_text if isinstance(query_text, list) else [query_text]
         print(f"searching data.. {queries}")
 
+        # One encoder pass and one search for every section not in the retrieval cache
+        batch_results = self.retrieve_batch(queries, top_k=3)
+        chunk_details: List[Dict] = [hit for hits in batch_results for hit in hits if hit["text"]]
 
-        for query in queries:
-            results = search_tfidf(
-                client=self.qdrant,
-                collection_name=self.collection,
-                query=query,
-                vectorizer=self.vectorizer,
-                top_k=3  
-            )
-            
-            for r in results or []:
-                payload = getattr(r, "payload", {}) or {}
-                txt = payload.get("text") or ""
-                
-                if txt and txt not in all_chunks:
-                    all_chunks.append(txt)
-                    
-                    chunk_details.append({
-                        "score": getattr(r, "score", 0.0),
-                        "page": payload.get("page"),
-                        "chunk_id": payload.get("chunk_id"),
-                        "text": txt
-                    })
-        
-        print(f"Retrieved {len(all_chunks)} unique chunks")
-        
-        chunk_details.sort(key=lambda x: x["score"], reverse=True)
-        
-        chunk_details = chunk_details[:5]
-        all_chunks_text = "\n\n---\n\n".join([c["text"] for c in chunk_details])
+        all_chunks_text, chunk_details = _top_chunks(chunk_details)
+        print(f"Retrieved {len(chunk_details)} unique chunks")
             
         return all_chunks_text, chunk_details
 
-    async def _recommendations(self, code: str, analysis: str, retrieved: str) -> str:
+    def retrieve_batch(self, queries: List[str], top_k: Union[int, List[int]] = 5) -> List[List[Dict]]:
+        """
+        Hits of every query, grouped by query and in the same order (no dedupe across
+        queries). All queries are encoded together and searched in one batched request;
+        `top_k` is an int or one int per query. Empty lists when retrieval is not configured.
+        """
+        retriever = self.retriever
+        print(f"configuration : {retriever.version if retriever else None}")
+        if retriever is None:
+            return [[] for _ in queries]
+        if self.retrieval_cache is not None:
+            retriever = CachedRetriever(retriever, self.retrieval_cache)
+        return retriever.search(queries, top_k=top_k)
+
+    async def _recommendations(self, code: str, analysis: str, chunks: List[Dict], scope: Optional[str] = None) -> str:
         """
         Pide a OpenAI recomendaciones concretas (lista corta) para mejorar el código,
         usando el análisis y el contexto recuperado (patrones/estándares/ejemplos).
@@ -246,91 +628,183 @@ class ImprovementService:
 
         print("get recomendations ...")
 
+        parts = self.prompts.build("recommendations", code=code, analysis=analysis, chunks=chunks, scope=scope)
         prompt = f"""
         You are a code reviewer. Based on the analysis and retrieved context, propose specific,
         actionable recommendations to improve the code while preserving behavior.
 
         Analysis:
-        {analysis}
+        {parts.analysis}
 
         Retrieved context (patterns/snippets/style guides):
-        {retrieved or "(no context)"}
-
+        {parts.context or "(no context)"}
+        {_scope_section(parts.scope)}
         Code:
-        {code}
+        {parts.code}
 
         IMPORTANT: NEVER RECOMEND CHANGE THE "execute" Function or its params because is used to perform functional tests. 
 
         Return 5-10 bullet points (short, actionable). No extra commentary.
         """
-        resp = self.client.chat.completions.create(
-            model=self.model,
-        #    temperature=0.0,
-            messages=[
-                {"role": "system", "content": "Be concise and actionable."},
-                {"role": "user", "content": prompt}
-            ]
-        )
+        resp = await self._chat("recommendations", [
+            {"role": "system", "content": "Be concise and actionable."},
+            {"role": "user", "content": prompt}
+        ])
         return resp.choices[0].message.content.strip()
 
-    async def _refactor_code(self, code: str, recommendations: str, retrieved: str, tests: Optional[str] = None) -> str:
+    def _refactor_messages(
+        self,
+        code: str,
+        recommendations: str,
+        chunks: List[Dict],
+        tests: Optional[str] = None,
+        scope: Optional[str] = None
+    ) -> List[Dict[str, str]]:
         """
-        Pide a OpenAI que entregue SOLO el código mejorado, preservando comportamiento,
-        aplicando las recomendaciones y siguiendo el contexto recuperado si aplica.
+        Construye los mensajes para que OpenAI entregue SOLO el código mejorado, preservando
+        comportamiento, aplicando las recomendaciones y siguiendo el contexto recuperado si aplica.
         Si se proporcionan pruebas, se incluyen para que el LLM las tenga en cuenta al generar la respuesta.
+        El código nunca se recorta aquí: el modelo debe devolver el archivo completo.
         """
+        parts = self.prompts.build("refactor", code=code, chunks=chunks, tests=tests, truncate_code=False, scope=scope)
+
         # Include tests section if tests are provided
         tests_section = ""
-        if tests:
+        if parts.tests:
             tests_section = f"""
         TESTS:
         The following tests are provided to help you understand how the code should behave.
         Make sure your refactored code passes these tests:
         
-        {tests}
+        {parts.tests}
         """
 
         prompt = f"""
         You are a senior refactoring assistant. Improve the code while preserving functional behavior.
 
-        Hard requirements (must comply):
-        1) 'execute' is the ONLY public entry point and the MAIN orchestrator.
-        2) Preserve 'execute' EXACT NAME and EXACT PARAMETER LIST (names, order, defaults, *args, **kwargs).
-        3) Keep 'execute' callable by existing code and tests (same module/class location).
-        4) You may create helper functions (e.g., 'main', 'run', '_impl'), BUT 'execute' must remain and call them as needed.
-        5) Do NOT change 'execute' decorators or return contract (type/shape of the return value).
-
-        Allowed changes (flexible):
-        - Refactor internal logic, extract helpers, rename local variables, reorder internal steps if behavior is unchanged.
-        - Improve readability, error handling, docstrings, and performance without altering observable behavior.
-
-        Behavioral constraint:
-        - The overall control flow triggered by calling 'execute(...)' must remain equivalent (same functional outcomes, same side effects order where visible to callers).
+        {REFACTOR_RULES}
 
         Use the following recommendations and (optionally) the retrieved context to guide changes:
         RECOMMENDATIONS:
         {recommendations}
 
         RETRIEVED CONTEXT:
-        {retrieved or "(no context)"}
+        {parts.context or "(no context)"}
         {tests_section}
+        {_scope_section(parts.scope)}
+        CODE:
+        {parts.code}
 
         Output format:
         - Return ONLY the full improved code (no markdown fences, no ```python, no explanations).
         """
-        resp = self.client.chat.completions.create(
-            model=self.model,
-        #    temperature=0.0,
-            messages=[
-                {"role": "system", "content": "Return only the raw improved code; no code block markers, no explanations."},
-                {"role": "user", "content": prompt}
-            ]
-        )
+        return [
+            {"role": "system", "content": "Return only the raw improved code; no code block markers, no explanations."},
+            {"role": "user", "content": prompt}
+        ]
+
+    async def _refactor_code(
+        self,
+        code: str,
+        recommendations: str,
+        chunks: List[Dict],
+        tests: Optional[str] = None,
+        scope: Optional[str] = None
+    ) -> str:
+        """
+        Pide a OpenAI que entregue SOLO el código mejorado (ver _refactor_messages).
+        """
+        resp = await self._chat("refactor", self._refactor_messages(code, recommendations, chunks, tests, scope))
 
         text = resp.choices[0].message.content or ""
-        
-        # Remove any markdown code block markers if they exist
-        cleaned_code = re.sub(r'^```\w*\s*', '', text)
-        cleaned_code = re.sub(r'```$', '', cleaned_code)
-        
-        return cleaned_code.strip()
+        return _clean_code(text)
+
+    async def _recommend_and_refactor(
+        self,
+        code: str,
+        analysis: str,
+        chunks: List[Dict],
+        tests: Optional[str] = None,
+        scope: Optional[str] = None
+    ) -> Tuple[str, str]:
+        """
+        Fused mode: one JSON call returns both the recommendations and the improved
+        code, so the code and the retrieved context are sent once instead of twice.
+        If the model does not return valid JSON, falls back to the two staged calls.
+        Returns: (recommendations_text, improved_code)
+        """
+        print("get recomendations and refactor (fused) ...")
+
+        parts = self.prompts.build(
+            "recommend_refactor", code=code, analysis=analysis, chunks=chunks, tests=tests,
+            truncate_code=False, scope=scope
+        )
+        tests_section = ""
+        if parts.tests:
+            tests_section = f"""
+        TESTS (the improved code must pass them):
+        {parts.tests}
+        """
+
+        prompt = f"""
+        You are a senior code reviewer and refactoring assistant. First propose 5-10 specific,
+        actionable recommendations based on the analysis and retrieved context, then apply them
+        to the code while preserving functional behavior.
+
+        {REFACTOR_RULES}
+
+        Analysis:
+        {parts.analysis}
+
+        Retrieved context (patterns/snippets/style guides):
+        {parts.context or "(no context)"}
+        {_scope_section(parts.scope)}
+        Code:
+        {parts.code}
+        {tests_section}
+
+        Output format: a JSON object with exactly these keys:
+        {{"recommendations": ["short actionable bullet", ...], "code": "the full improved code"}}
+        The "code" value is raw code (no markdown fences, no explanations).
+        """
+        resp = await self._chat("recommend_refactor", [
+            {"role": "system", "content": "Return only a JSON object with the keys recommendations and code."},
+            {"role": "user", "content": prompt}
+        ], response_format={"type": "json_object"})
+
+        parsed = _parse_fused_response(resp.choices[0].message.content or "")
+        if parsed is None:
+            print("Fused response is not valid JSON, falling back to staged calls")
+            recommendations = await self._recommendations(code, analysis, chunks, scope)
+            return recommendations, await self._refactor_code(code, recommendations, chunks, tests, scope)
+        return parsed
+
+    async def _refactor_code_stream(
+        self,
+        code: str,
+        recommendations: str,
+        chunks: List[Dict],
+        tests: Optional[str] = None,
+        scope: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Same request as _refactor_code but streamed: yields the code fragments as the
+        model produces them. Fences are not stripped here; callers clean the joined text.
+        """
+        usage = None
+        with timed("refactor"):
+            stream = await self.client.chat.completions.create(
+                model=self.model,
+                messages=self._refactor_messages(code, recommendations, chunks, tests, scope),
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            async for chunk in stream:
+                # The last chunk carries the usage and no choices
+                usage = getattr(chunk, "usage", None) or usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        record_usage("refactor", usage)
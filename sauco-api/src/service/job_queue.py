@@ -0,0 +1,351 @@
+# /src/service/job_queue.py
+from __future__ import annotations
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Callable, Awaitable, Iterator, List, Tuple, Type
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import time
+import traceback
+import uuid
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATUSES = (SUCCEEDED, FAILED, CANCELLED)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Backend interface
+# ─────────────────────────────────────────────────────────────────────────────
+class JobQueue(ABC):
+    """
+    Durable job queue shared by API nodes (which enqueue) and workers (which claim).
+    Jobs are plain dicts: id, status, payload, result, error, attempts, worker_id,
+    created_at, started_at, finished_at.
+
+    Backends must make `claim` atomic across processes: a queued job is handed to
+    exactly one worker. Running jobs whose lease expired (crashed worker) go back to
+    the queue on the next claim; workers keep the lease of a long job alive with
+    `heartbeat`. With a `worker_id`, complete/fail/requeue only apply to a job that
+    worker still holds, so a worker whose lease was lost cannot overwrite the job.
+    A job is claimed at most `max_attempts` times; `requeue` with a `delay` retries it
+    later (e.g. after a transient provider error).
+    """
+
+    max_attempts: int = 3
+
+    @abstractmethod
+    def enqueue(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        """
+        Extends the lease of a job the worker is still running. False when the job is
+        no longer running or belongs to another worker: the worker must stop it.
+        """
+        ...
+
+    @abstractmethod
+    def complete(self, job_id: str, result: Dict[str, Any], worker_id: Optional[str] = None) -> bool:
+        ...
+
+    @abstractmethod
+    def fail(self, job_id: str, error: str, worker_id: Optional[str] = None) -> bool:
+        ...
+
+    @abstractmethod
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def requeue(self, job_id: str, worker_id: Optional[str] = None, delay: float = 0.0) -> bool:
+        """
+        Hands a running job back to the queue, e.g. when its worker shuts down; it is
+        not claimed again for `delay` seconds.
+        """
+        ...
+
+    def status(self, job_id: str) -> Optional[str]:
+        job = self.get(job_id)
+        return job["status"] if job else None
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# SQLite backend
+# ─────────────────────────────────────────────────────────────────────────────
+class SqliteJobQueue(JobQueue):
+    """
+    JobQueue on a SQLite file. Claims use BEGIN IMMEDIATE, so every worker process on
+    the host (or on a shared volume with proper locking) can drain the same file.
+    """
+
+    def __init__(self, path: str, lease_seconds: float = 600.0, max_attempts: int = 3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    worker_id TEXT,
+                    lease_until REAL,
+                    run_after REAL,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)")
+            # Files created before delayed retries existed
+            if "run_after" not in {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}:
+                conn.execute("ALTER TABLE jobs ADD COLUMN run_after REAL")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # Autocommit mode: transactions are opened explicitly where atomicity matters
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _to_job(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job.pop("lease_until", None)
+        job.pop("run_after", None)
+        return job
+
+    def enqueue(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, payload, created_at) VALUES (?, ?, ?, ?)",
+                (job_id, QUEUED, json.dumps(payload), time.time()),
+            )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_job(row) if row else None
+
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Expired leases belong to workers that died mid-job
+                conn.execute(
+                    "UPDATE jobs SET status = ?, worker_id = NULL, lease_until = NULL "
+                    "WHERE status = ? AND lease_until < ? AND attempts < ?",
+                    (QUEUED, RUNNING, now, self.max_attempts),
+                )
+                conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, finished_at = ? "
+                    "WHERE status = ? AND lease_until < ?",
+                    (FAILED, "worker lease expired too many times", now, RUNNING, now),
+                )
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE status = ? AND (run_after IS NULL OR run_after <= ?) "
+                    "ORDER BY created_at LIMIT 1",
+                    (QUEUED, now),
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = ?, worker_id = ?, started_at = ?, lease_until = ?, "
+                    "attempts = attempts + 1 WHERE id = ?",
+                    (RUNNING, worker_id, now, now + self.lease_seconds, row["id"]),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return self.get(row["id"])
+
+    @staticmethod
+    def _held_by(worker_id: Optional[str]) -> tuple:
+        # Extra WHERE clause (and its parameter) restricting an update to the worker's own job
+        return (" AND worker_id = ?", (worker_id,)) if worker_id is not None else ("", ())
+
+    def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND status = ? AND worker_id = ?",
+                (time.time() + self.lease_seconds, job_id, RUNNING, worker_id),
+            )
+            return cursor.rowcount == 1
+
+    def _finish(self, job_id: str, status: str, result: Optional[str], error: Optional[str],
+                worker_id: Optional[str]) -> bool:
+        # Only running jobs can finish: a result for a cancelled (or re-claimed) job is discarded
+        held, params = self._held_by(worker_id)
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, lease_until = NULL "
+                "WHERE id = ? AND status = ?" + held,
+                (status, result, error, time.time(), job_id, RUNNING, *params),
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, job_id: str, result: Dict[str, Any], worker_id: Optional[str] = None) -> bool:
+        return self._finish(job_id, SUCCEEDED, json.dumps(result), None, worker_id)
+
+    def fail(self, job_id: str, error: str, worker_id: Optional[str] = None) -> bool:
+        return self._finish(job_id, FAILED, None, error, worker_id)
+
+    def requeue(self, job_id: str, worker_id: Optional[str] = None, delay: float = 0.0) -> bool:
+        held, params = self._held_by(worker_id)
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, worker_id = NULL, lease_until = NULL, run_after = ? "
+                "WHERE id = ? AND status = ?" + held,
+                (QUEUED, time.time() + delay if delay > 0 else None, job_id, RUNNING, *params),
+            )
+            return cursor.rowcount == 1
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, lease_until = NULL WHERE id = ? AND status IN (?, ?)",
+                (CANCELLED, time.time(), job_id, QUEUED, RUNNING),
+            )
+        return self.get(job_id)
+
+
+def create_job_queue(url: str, **kwargs) -> JobQueue:
+    """
+    Builds a queue backend from a URL, e.g. "sqlite:///.cache/jobs.sqlite3".
+    New backends (Redis, Postgres...) plug in here by implementing JobQueue.
+    """
+    scheme, _, location = url.partition("://")
+    if scheme == "sqlite":
+        # sqlite:///relative/path or sqlite:////absolute/path, as in SQLAlchemy URLs
+        return SqliteJobQueue(location[1:] if location.startswith("/") else location, **kwargs)
+    raise ValueError(f"Unsupported job queue backend '{scheme}'. Supported: sqlite")
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Worker pool
+# ─────────────────────────────────────────────────────────────────────────────
+class JobWorkerPool:
+    """
+    Runs `concurrency` asyncio workers that drain the queue with `handler(payload)`.
+    A running job is polled for cancellation: if its status leaves "running" (e.g.
+    DELETE /jobs/{id} from any API node) the handler task is cancelled. Every
+    `heartbeat_interval` seconds the worker renews the job's lease, so a job that
+    runs longer than the lease is not handed to a second worker.
+
+    Handler errors listed in `retry_on` are transient (e.g. the LLM provider is
+    unavailable): the job goes back to the queue with exponential backoff until the
+    queue's max_attempts is reached. Any other error fails the job.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        handler: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+        concurrency: int = 2,
+        poll_interval: float = 0.5,
+        heartbeat_interval: float = 30.0,
+        retry_on: Tuple[Type[BaseException], ...] = (),
+        retry_backoff: float = 5.0,
+        retry_backoff_max: float = 300.0,
+    ):
+        self.queue = queue
+        self.handler = handler
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.retry_on = retry_on
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+        self.worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        for i in range(self.concurrency):
+            self._tasks.append(asyncio.ensure_future(self._worker(f"{self.worker_prefix}:{i}")))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self, worker_id: str) -> None:
+        while True:
+            try:
+                job = await asyncio.to_thread(self.queue.claim, worker_id)
+                if job is not None:
+                    await self.run_job(job)
+                    continue
+            except Exception as e:
+                # e.g. "database is locked": the worker keeps polling, an unfinished job's lease expires
+                print(f" Job worker {worker_id} error - {type(e).__name__}: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def run_job(self, job: Dict[str, Any]) -> None:
+        job_id, worker_id = job["id"], job["worker_id"]
+        task = asyncio.ensure_future(self.handler(job["payload"]))
+        last_heartbeat = time.monotonic()
+        try:
+            while not task.done():
+                await asyncio.wait({task}, timeout=self.poll_interval)
+                if task.done():
+                    break
+                if time.monotonic() - last_heartbeat >= self.heartbeat_interval:
+                    last_heartbeat = time.monotonic()
+                    running = await asyncio.to_thread(self.queue.heartbeat, job_id, worker_id)
+                else:
+                    running = await asyncio.to_thread(self.queue.status, job_id) == RUNNING
+                if not running:
+                    task.cancel()
+        except asyncio.CancelledError:
+            # Pool shutting down: stop the work and let another worker pick the job up
+            task.cancel()
+            await asyncio.to_thread(self.queue.requeue, job_id, worker_id)
+            raise
+        if task.cancelled():
+            return
+        error = task.exception()
+        if isinstance(error, self.retry_on) and job["attempts"] < self.queue.max_attempts:
+            delay = min(self.retry_backoff * 2 ** (job["attempts"] - 1), self.retry_backoff_max)
+            delay = max(delay, getattr(error, "retry_after", None) or 0.0)  # e.g. until the circuit half-opens
+            print(f" Job {job_id} will be retried in {delay:g}s - {error}")
+            await asyncio.to_thread(self.queue.requeue, job_id, worker_id, delay)
+        elif error is not None:
+            print(f" Job {job_id} failed - {error}")
+            print("".join(traceback.format_exception(error)))
+            await asyncio.to_thread(self.queue.fail, job_id, str(error), worker_id)
+        else:
+            await asyncio.to_thread(self.queue.complete, job_id, task.result(), worker_id)
@@ -0,0 +1,122 @@
+# /src/service/lazy_resource.py
+from __future__ import annotations
+from typing import Optional, Dict, Any, Callable
+import asyncio
+import threading
+import time
+
+# cold -> warming -> ready | error ; disabled = not configured (nothing to load)
+COLD, WARMING, READY, ERROR, DISABLED = "cold", "warming", "ready", "error", "disabled"
+
+
+class LazyResource:
+    """
+    A heavy dependency (pickled vectorizer, Qdrant client, OpenAI client) built on
+    first use instead of at import time. `warm()` builds it ahead of the first
+    request (in a thread, off the event loop) and runs an optional `check` probe,
+    e.g. a Qdrant round-trip, so a missing backend shows up in /ready rather than
+    in the first /improve. A failed build is retried on the next `get()`; a failed
+    probe is re-run from `status()`, at most every `recheck_seconds`, so a backend
+    that comes back later turns the resource ready again.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        factory: Optional[Callable[[], Any]],
+        check: Optional[Callable[[Any], None]] = None,
+        recheck_seconds: float = 10.0
+    ):
+        self.name = name
+        self.factory = factory
+        self.check = check
+        self.recheck_seconds = recheck_seconds
+        self.state = DISABLED if factory is None else COLD
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self._value: Any = None
+        self._built = False
+        self._lock = threading.Lock()
+        self._last_check = 0.0
+
+    @property
+    def loaded(self) -> bool:
+        return self._built
+
+    def get(self) -> Any:
+        """Returns the resource, building it the first time (None when disabled)."""
+        if self._built or self.factory is None:
+            return self._value
+        with self._lock:
+            if not self._built:
+                start = time.perf_counter()
+                try:
+                    self._value = self.factory()
+                except Exception as e:
+                    self.state, self.error = ERROR, f"{type(e).__name__}: {e}"
+                    raise
+                self.load_seconds = round(time.perf_counter() - start, 4)
+                self._built = True
+                if self.state != WARMING:
+                    self.state, self.error = READY, None
+        return self._value
+
+    def warm_sync(self) -> bool:
+        """Builds and probes the resource; True when it is ready (or disabled)."""
+        if self.factory is None:
+            return True
+        self.state = WARMING
+        self._last_check = time.monotonic()
+        try:
+            value = self.get()
+            if self.check is not None:
+                self.check(value)
+        except Exception as e:
+            self.state, self.error = ERROR, f"{type(e).__name__}: {e}"
+            print(f"Warm-up of {self.name} failed - {self.error}")
+            return False
+        self.state, self.error = READY, None
+        return True
+
+    async def warm(self) -> bool:
+        return await asyncio.to_thread(self.warm_sync)
+
+    async def aget(self) -> Any:
+        """get() for the event loop: the first build runs in a thread."""
+        if self._built or self.factory is None:
+            return self._value
+        return await asyncio.to_thread(self.get)
+
+    def _recheck(self) -> None:
+        """Re-runs the probe of a built resource in error, rate-limited."""
+        now = time.monotonic()
+        if now - self._last_check < self.recheck_seconds:
+            return
+        self._last_check = now
+        try:
+            self.check(self._value)
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            return
+        self.state, self.error = READY, None
+        print(f"{self.name} is ready again")
+
+    def status(self) -> Dict[str, Any]:
+        if self.state == ERROR and self._built and self.check is not None:
+            self._recheck()
+        status: Dict[str, Any] = {"state": self.state}
+        if self.load_seconds is not None:
+            status["load_seconds"] = self.load_seconds
+        if self.error:
+            status["error"] = self.error
+        return status
+
+
+def resolve(value: Any) -> Any:
+    """Unwraps a LazyResource; plain values are returned as they are."""
+    return value.get() if isinstance(value, LazyResource) else value
+
+
+async def aresolve(value: Any) -> Any:
+    """resolve() for the event loop: a LazyResource is built in a thread."""
+    return await value.aget() if isinstance(value, LazyResource) else value
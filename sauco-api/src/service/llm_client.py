@@ -0,0 +1,357 @@
+# /src/service/llm_client.py
+from __future__ import annotations
+from collections import deque
+from typing import Optional, Dict, Any, AsyncIterator, Deque
+import asyncio
+import os
+import random
+import time
+
+import httpx
+
+from src.service.lazy_resource import LazyResource, aresolve
+from src.service.telemetry import (
+    LLM_RETRIES, LLM_CIRCUIT_REJECTIONS, LLM_CONCURRENCY_LIMIT, LLM_IN_FLIGHT, LLM_CIRCUIT_STATE
+)
+
+
+class LLMUnavailableError(Exception):
+    """The provider could not serve the call (retries exhausted or circuit open)."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(LLMUnavailableError):
+    """Raised without calling the provider while the circuit breaker is open."""
+
+
+def retry_reason(error: BaseException) -> Optional[str]:
+    """
+    Classifies a failed attempt: "rate_limited", "timeout", "connection" or
+    "server_error" are worth retrying; None means the request itself is wrong (4xx).
+    """
+    import openai  # already loaded by the time a call has failed
+
+    if isinstance(error, openai.RateLimitError):
+        return "rate_limited"
+    if isinstance(error, (openai.APITimeoutError, asyncio.TimeoutError, httpx.TimeoutException)):
+        return "timeout"
+    if isinstance(error, (openai.APIConnectionError, httpx.TransportError)):
+        return "connection"
+    if isinstance(error, openai.APIStatusError):
+        status = error.status_code
+        if status == 408:
+            return "timeout"
+        if status == 409 or status >= 500:
+            return "server_error"
+    return None
+
+
+def _retry_after_seconds(error: BaseException) -> Optional[float]:
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# AIMD concurrency limit
+# ─────────────────────────────────────────────────────────────────────────────
+class AdaptiveConcurrencyLimiter:
+    """
+    Caps concurrent provider calls with an AIMD limit, like TCP congestion control:
+    every success adds 1/limit (about +1 per round of calls) and a rate limit
+    multiplies the limit by `decrease`. Decreases happen at most once per
+    `decrease_interval`, so one burst of 429s counts as one congestion signal.
+    """
+
+    def __init__(
+        self,
+        initial: float = 8,
+        min_limit: float = 1,
+        max_limit: float = 32,
+        decrease: float = 0.5,
+        decrease_interval: float = 1.0
+    ):
+        self.limit = float(initial)
+        self.min_limit = float(min_limit)
+        self.max_limit = float(max_limit)
+        self.decrease = decrease
+        self.decrease_interval = decrease_interval
+        self.in_flight = 0
+        self._last_decrease = float("-inf")
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._publish()
+
+    def cap(self, max_limit: float) -> None:
+        """Lowers the ceiling (and the current limit) to `max_limit`, e.g. the HTTP pool size."""
+        self.max_limit = min(self.max_limit, float(max_limit))
+        self.limit = min(self.limit, self.max_limit)
+        self._publish()
+
+    def _has_room(self) -> bool:
+        return self.in_flight < max(int(self.limit), 1)
+
+    async def acquire(self) -> None:
+        if self._has_room() and not self._waiters:
+            self.in_flight += 1
+            self._publish()
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was granted just before the cancellation: hand it on
+                self.release(adjust=False)
+            else:
+                self._waiters.remove(waiter)
+            raise
+
+    def release(self, overloaded: bool = False, adjust: bool = True) -> None:
+        self.in_flight -= 1
+        if adjust:
+            if overloaded:
+                now = time.monotonic()
+                if now - self._last_decrease >= self.decrease_interval:
+                    self.limit = max(self.min_limit, self.limit * self.decrease)
+                    self._last_decrease = now
+            else:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+        self._wake()
+        self._publish()
+
+    def _wake(self) -> None:
+        while self._waiters and self._has_room():
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self.in_flight += 1
+            waiter.set_result(None)
+
+    def _publish(self) -> None:
+        LLM_CONCURRENCY_LIMIT.set((), self.limit)
+        LLM_IN_FLIGHT.set((), self.in_flight)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"limit": round(self.limit, 2), "in_flight": self.in_flight, "waiting": len(self._waiters)}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Circuit breaker
+# ─────────────────────────────────────────────────────────────────────────────
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive provider failures (timeouts,
+    connection errors, 5xx) and rejects calls for `reset_timeout` seconds. Then one
+    probe call is let through (half-open): success closes the circuit, failure
+    opens it again. Rate limits are neither failures nor successes.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._publish()
+
+    def before_call(self) -> None:
+        if self.state == OPEN:
+            remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+            if remaining > 0:
+                LLM_CIRCUIT_REJECTIONS.inc()
+                raise CircuitOpenError("LLM provider circuit is open", retry_after=remaining)
+            self._set_state(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self._probe_in_flight:
+                LLM_CIRCUIT_REJECTIONS.inc()
+                raise CircuitOpenError("LLM provider circuit is half-open, probe in flight", retry_after=1.0)
+            self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._probe_in_flight = False
+        self._set_state(CLOSED)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+            self._set_state(OPEN)
+
+    def record_neutral(self) -> None:
+        """Rate limit or cancellation: says nothing about provider health."""
+        self._probe_in_flight = False
+
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            print(f"LLM circuit breaker: {self.state} -> {state}")
+        self.state = state
+        self._publish()
+
+    def _publish(self) -> None:
+        LLM_CIRCUIT_STATE.set((), _STATE_VALUES[self.state])
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "consecutive_failures": self.failures}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Client
+# ─────────────────────────────────────────────────────────────────────────────
+class _Chat:
+    def __init__(self, completions: "ResilientLLMClient"):
+        self.completions = completions
+
+
+class ResilientLLMClient:
+    """
+    Drop-in for AsyncOpenAI's `client.chat.completions.create(...)` that adds:
+        - jittered exponential retries ("full jitter", honouring Retry-After) for
+          429, timeouts, connection errors and 5xx; 4xx errors are raised at once
+        - an AIMD adaptive concurrency limit that backs off on rate limits
+        - a circuit breaker that fails fast while the provider is degraded
+    After the last attempt it raises LLMUnavailableError (CircuitOpenError when the
+    breaker rejects the call). Streams are retried only until the response starts;
+    their concurrency slot is held until the stream is consumed.
+    `inner` may be a LazyResource: the OpenAI SDK is then imported on first use.
+    """
+
+    def __init__(
+        self,
+        inner: Any,
+        max_retries: int = 4,
+        backoff_base: float = 0.5,
+        backoff_max: float = 20.0,
+        limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        rng: Optional[random.Random] = None
+    ):
+        self.inner = inner
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.limiter = limiter or AdaptiveConcurrencyLimiter()
+        self.breaker = breaker or CircuitBreaker()
+        self._random = rng or random.Random()
+        self.chat = _Chat(self)
+
+    async def create(self, **kwargs) -> Any:
+        stream = bool(kwargs.get("stream"))
+        last_error: Optional[BaseException] = None
+        for attempt in range(self.max_retries + 1):
+            self.breaker.before_call()
+            try:
+                await self.limiter.acquire()
+            except asyncio.CancelledError:
+                self.breaker.record_neutral()
+                raise
+            try:
+                client = await aresolve(self.inner)
+                result = await client.chat.completions.create(**kwargs)
+            except asyncio.CancelledError:
+                self.limiter.release(adjust=False)
+                self.breaker.record_neutral()
+                raise
+            except Exception as error:
+                reason = retry_reason(error)
+                self.limiter.release(overloaded=reason == "rate_limited", adjust=reason is not None)
+                if reason is None:
+                    # The provider answered: our request is wrong and retrying will not help
+                    self.breaker.record_success()
+                    raise
+                if reason == "rate_limited":
+                    self.breaker.record_neutral()
+                else:
+                    self.breaker.record_failure()
+                LLM_RETRIES.inc((reason,))
+                last_error = error
+                if attempt == self.max_retries:
+                    break
+                delay = self._backoff(attempt, error)
+                print(f"LLM call failed ({reason}), retry {attempt + 1}/{self.max_retries} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            if stream:
+                return self._release_when_done(result)
+            self.limiter.release()
+            return result
+
+        raise LLMUnavailableError(
+            f"LLM provider unavailable after {self.max_retries + 1} attempts: {last_error}",
+            retry_after=_retry_after_seconds(last_error)
+        ) from last_error
+
+    def _backoff(self, attempt: int, error: BaseException) -> float:
+        delay = self._random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        retry_after = _retry_after_seconds(error)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return min(delay, self.backoff_max)
+
+    async def _release_when_done(self, stream: Any) -> AsyncIterator[Any]:
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            self.limiter.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"concurrency": self.limiter.stats(), "circuit": self.breaker.stats()}
+
+
+def create_llm_client(
+    api_key: Optional[str] = None,
+    base_url: Optional[str] = None,
+    timeout: float = 120.0,
+    max_connections: int = 20,
+    max_keepalive_connections: int = 10,
+    keepalive_expiry: float = 30.0,
+    **resilience: Any
+) -> ResilientLLMClient:
+    """
+    Builds the shared OpenAI client: one pooled keep-alive HTTP transport reused by
+    every call of the process, with the SDK's own retries disabled so the retry,
+    concurrency and circuit-breaker policy lives in ResilientLLMClient.
+    The SDK is imported and the client built lazily (first call or warm-up).
+    The concurrency limit is capped at `max_connections`: calls beyond the pool would
+    only wait for a connection, and a pool timeout counts as a provider failure.
+    """
+    limiter = resilience.get("limiter") or AdaptiveConcurrencyLimiter()
+    limiter.cap(max_connections)
+    resilience["limiter"] = limiter
+
+    def build():
+        from openai import AsyncOpenAI
+
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(timeout, connect=10.0),
+        )
+        return AsyncOpenAI(
+            api_key=api_key or os.getenv("OPENAI_API_KEY"),
+            base_url=base_url,
+            http_client=http_client,
+            max_retries=0,
+            timeout=timeout,
+        )
+
+    return ResilientLLMClient(LazyResource("llm_client", build), **resilience)
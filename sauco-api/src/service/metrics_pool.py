@@ -0,0 +1,83 @@
+# /src/service/metrics_pool.py
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional
+import asyncio
+import multiprocessing
+import os
+
+from src.service.metrics_service import calculate_metrics
+
+
+def measure_all(codes: List[str]) -> List[Dict[str, Any]]:
+    """calculate_metrics of every code, in order. Runs in the pool workers."""
+    return [calculate_metrics(code) for code in codes]
+
+
+def split_by_size(codes: List[str], parts: int) -> List[List[int]]:
+    """Indices of `codes` in at most `parts` consecutive chunks of similar total length."""
+    target = sum(len(code) for code in codes) / max(parts, 1)
+    chunks, current, size = [], [], 0
+    for i, code in enumerate(codes):
+        current.append(i)
+        size += len(code)
+        if size >= target and len(chunks) < parts - 1:
+            chunks.append(current)
+            current, size = [], 0
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class MetricsPool:
+    """
+    Code metrics for batches of files, without the LLM.
+
+    calculate_metrics is pure CPU work (parse + one traversal) that holds the GIL, so
+    large batches are split into chunks of similar size and measured in a process pool,
+    `chunks_per_worker` chunks per worker so one big file does not leave the others idle.
+    Batches under `min_pool_bytes` (or with a single file) run in a thread of this
+    process: below that, sending the code to another process costs more than measuring it.
+
+    The pool is created on the first large batch. Workers are spawned, not forked: the
+    server process has threads (event loop, to_thread workers) and a forked child could
+    inherit one of their locks held; a spawned worker only imports metrics_service.
+    If a worker dies (e.g. killed for memory) the pool is broken for good: it is dropped,
+    the batch is measured in a thread and the next large batch starts a new pool.
+    """
+
+    def __init__(self, workers: Optional[int] = None, min_pool_bytes: int = 256 * 1024, chunks_per_worker: int = 4):
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.min_pool_bytes = min_pool_bytes
+        self.chunks_per_worker = chunks_per_worker
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    async def measure(self, codes: List[str]) -> List[Dict[str, Any]]:
+        """calculate_metrics of every code, in request order."""
+        if self.workers < 2 or len(codes) < 2 or sum(len(code) for code in codes) < self.min_pool_bytes:
+            return await asyncio.to_thread(measure_all, codes)
+
+        loop = asyncio.get_running_loop()
+        pool = self._pool()
+        chunks = split_by_size(codes, self.workers * self.chunks_per_worker)
+        try:
+            measured = await asyncio.gather(*(
+                loop.run_in_executor(pool, measure_all, [codes[i] for i in chunk]) for chunk in chunks
+            ))
+        except BrokenProcessPool as e:
+            print(f"Metrics pool broken, measuring the batch in-process - {e}")
+            if self._executor is pool:
+                self.shutdown()
+            return await asyncio.to_thread(measure_all, codes)
+        return [metrics for chunk in measured for metrics in chunk]
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
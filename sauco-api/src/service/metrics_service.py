@@ -1,6 +1,240 @@
 import ast
+import io
 import re
-from typing import Dict, Any, List, Set
+import tokenize
+from collections import deque
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+# Single-scan fallback for code that is not valid Python (JavaScript, TypeScript, Java, C#...).
+# One regex alternation tokenizes the source left to right; strings and comments are
+# matched as a whole and skipped, so keywords inside them are never counted.
+_SCAN_TOKENS = re.compile(
+    r'(?P<skip>'
+    r'//[^\n]*|/\*.*?(?:\*/|\Z)'                      # // and /* */ comments
+    r'|^[ \t]*#[^\n]*|#(?=\s)[^\n]*'                   # # comments, C# preprocessor directives
+    r'|"""(?:\\.|.)*?(?:"""|\Z)|\'\'\'(?:\\.|.)*?(?:\'\'\'|\Z)'  # text blocks, triple-quoted strings
+    r'|@"(?:[^"]|"")*"'                                 # C# verbatim strings
+    r'|`(?:\\.|[^`\\])*`'                              # template literals
+    r'|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\''     # strings and chars (one line)
+    r')'
+    r'|(?P<word>[A-Za-z_$][\w$]*)'
+    r'|(?P<op>&&|\|\||\?\?|=>|[{}()\[\];.,=:?<>|])',
+    re.S | re.M,
+)
+# Names that, followed by parentheses and a block, do not declare a method
+_NOT_METHODS = {
+    "if", "elif", "else", "for", "foreach", "while", "do", "switch", "case", "catch", "when", "try",
+    "using", "lock", "fixed", "synchronized", "with", "return", "await", "throw", "new", "typeof",
+    "sizeof", "nameof", "function", "def", "in", "of", "and", "or", "not",
+}
+# Tokens after the ")" of a signature that start a return type, throws or where clause
+_SIGNATURE_TAIL = {":", "throws", "where"}
+_TYPE_SYMBOLS = {".", ",", "<", ">", "[", "]", "?", "|", ":"}
+# A "{" after one of these opens an object/array literal or an initializer, not a block
+_LITERAL_PREFIXES = {"=", "(", ",", ":", "[", "]", "?", "return", "&&", "||", "??"}
+# Array methods counted as loops (JavaScript)
+_ITERATOR_METHODS = {"forEach", "map", "filter", "reduce"}
+_LOOP_KEYWORDS = {"for", "foreach", "while", "do"}
+_DECISION_KEYWORDS = {"if", "elif", "catch", "except", "case", "and", "or"} | _LOOP_KEYWORDS
+# Tokens kept to find the name before type parameters, as in name<T, U>(...)
+_GENERIC_LOOKBACK = 32
+
+
+def _generic_name(recent) -> Optional[Tuple[str, str]]:
+    """(name, token before it) of a `name<...>` ending at the last scanned token, or None."""
+    depth = 0
+    for i in range(len(recent) - 1, 0, -1):
+        text, is_word = recent[i]
+        if text == ">":
+            depth += 1
+        elif text == "<":
+            depth -= 1
+            if depth == 0:
+                name, name_is_word = recent[i - 1]
+                if not name_is_word:
+                    return None
+                return name, recent[i - 2][0] if i >= 2 else ""
+        elif not is_word and text not in _TYPE_SYMBOLS:
+            return None
+    return None
+
+
+def _scan_metrics(code: str) -> Dict[str, Any]:
+    """
+    Metrics of code that is not valid Python (JavaScript, TypeScript, Java, C#...) from one
+    pass of a small tokenizer; strings and comments are skipped.
+    
+    - methods: function/def declarations, name(...) { and generic name<T>(...) {
+      declarations (optionally with a return type, throws or where clause) and arrow
+      functions/lambdas (=>). A method's
+      size is its line span up to its closing brace (1 for expression-bodied arrows)
+    - ifs: if/elif ("else if" is one if)
+    - loops: for, foreach, while, do-while (once) and .forEach/.map/.filter/.reduce calls
+    - cyclomatic complexity: 1 + if/elif, for/foreach/while/do, catch/except, case,
+      C# switch expression arms, &&, ||, ?? and and/or
+    - max nesting: depth of block braces (object literals and initializers do not nest);
+      code without blocks falls back to indentation
+    """
+    ifs = loops = decisions = methods = depth = max_depth = parens = 0
+    sizes: List[Any] = []  # per method: line count, or None if its body has no braces
+    braces: List[Any] = []  # per open "{": "literal", "switch", "block", "do" or a method's start line
+    calls: List[Any] = []  # per open "(": start line if it may hold a method's parameters
+    signature = None  # start line of a method whose parameters just closed, until its "{"
+    in_tail = False  # the tokens after that signature are a return type/throws/where clause
+    function = None  # (start line, paren depth) of a "function" keyword until its body
+    arrow = None  # start line of an arrow function until its first body token
+    after_do = False
+    prev, prev2, prev_word = "", "", False
+    recent = deque(maxlen=_GENERIC_LOOKBACK)  # (text, is_word) of the last tokens
+    line, line_pos = 1, 0
+    
+    def line_at(pos):
+        nonlocal line, line_pos
+        line += code.count("\n", line_pos, pos)
+        line_pos = pos
+        return line
+    
+    for match in _SCAN_TOKENS.finditer(code):
+        kind = match.lastgroup
+        if kind == "skip":
+            continue
+        text = match.group()
+        is_word = kind == "word"
+        closed_do = False
+        
+        if arrow is not None and text != "{":
+            sizes.append(1)  # expression-bodied arrow function
+            arrow = None
+        if signature is not None and text != "{":
+            if text in _SIGNATURE_TAIL or (in_tail and (is_word or text in _TYPE_SYMBOLS)):
+                in_tail = True
+            else:
+                signature, in_tail = None, False
+        
+        if is_word:
+            if prev != ".":
+                if text in _DECISION_KEYWORDS and not (text == "while" and after_do):
+                    decisions += 1
+                    if text == "if" or text == "elif":
+                        ifs += 1
+                    elif text in _LOOP_KEYWORDS:
+                        loops += 1
+                elif text == "function":
+                    methods += 1
+                    function = (line_at(match.start()), parens)
+                elif text == "def":
+                    methods += 1
+                    sizes.append(None)
+        elif text == "(":
+            if prev2 == "." and prev in _ITERATOR_METHODS:
+                loops += 1
+            name, name_is_word, before = prev, prev_word, prev2
+            if prev == ">":
+                name, before = _generic_name(recent) or ("", "")
+                name_is_word = bool(name)
+            if name_is_word and name not in _NOT_METHODS and before not in (".", "new", "function"):
+                calls.append(line_at(match.start()))
+            else:
+                calls.append(None)
+            parens += 1
+        elif text == ")":
+            if calls:
+                start = calls.pop()
+                if start is not None:
+                    signature, in_tail = start, False
+            parens = max(parens - 1, 0)
+        elif text == "{":
+            if signature is not None:
+                methods += 1
+                braces.append(signature)
+                signature, in_tail = None, False
+            elif arrow is not None:
+                braces.append(arrow)
+                arrow = None
+            elif function is not None and function[1] == parens:
+                braces.append(function[0])
+                function = None
+            elif prev == "switch":
+                braces.append("switch")  # C# switch expression
+            elif prev in _LITERAL_PREFIXES:
+                braces.append("literal")
+            else:
+                braces.append("do" if prev == "do" else "block")
+            if braces[-1] not in ("literal", "switch"):
+                depth += 1
+                max_depth = max(max_depth, depth)
+        elif text == "}":
+            if braces:
+                opened = braces.pop()
+                if opened not in ("literal", "switch"):
+                    depth -= 1
+                    if isinstance(opened, int):
+                        sizes.append(line_at(match.start()) - opened + 1)
+                    closed_do = opened == "do"
+        elif text == "=>":
+            if braces and braces[-1] == "switch":
+                decisions += 1  # a switch expression arm
+            else:
+                methods += 1
+                arrow = line_at(match.start())
+        elif text in ("&&", "||", "??"):
+            decisions += 1
+        elif text == ";":
+            function = None  # a declaration without body
+        
+        after_do = closed_do
+        prev2, prev, prev_word = prev, text, is_word
+        recent.append((text, is_word))
+    if arrow is not None:
+        sizes.append(1)
+    
+    if not methods:
+        average_method_size = 0.0
+    elif len(sizes) == methods and None not in sizes:
+        average_method_size = sum(sizes) / methods
+    else:
+        # Some bodies could not be measured: non-empty lines per method, as a rough estimate
+        non_empty_lines = sum(1 for code_line in code.split('\n') if code_line.strip())
+        average_method_size = non_empty_lines / methods
+    return {
+        "method_number": methods,
+        "number_of_ifs": ifs,
+        "number_of_loops": loops,
+        "cyclomatic_complexity": 1 + decisions,
+        "average_method_size": average_method_size,
+        "max_nesting": max_depth or _indentation_nesting(code),
+        "functions": [],  # no per-function breakdown without a syntax tree
+    }
+
+
+def _indentation_nesting(code: str) -> int:
+    """Nesting estimated from indentation: 2 columns (or tabs) per level, conservatively."""
+    max_indent = 0
+    for line in code.split('\n'):
+        if line.strip():  # Skip empty lines
+            indent = len(line) - len(line.lstrip())
+            max_indent = max(max_indent, indent // 2)
+    return max_indent
+
+
+def _method_lines(node) -> Dict[str, Any]:
+    """Name and line span of a function, from its first line to the end of its last body statement."""
+    start_line = node.lineno
+    end_line = 0
+    for child in node.body:
+        if hasattr(child, 'end_lineno') and child.end_lineno is not None:
+            end_line = max(end_line, child.end_lineno)
+        else:
+            # If end_lineno is not available, use lineno as a fallback
+            end_line = max(end_line, getattr(child, 'lineno', 0))
+    if end_line == 0:
+        end_line = start_line
+    return {
+        'name': node.name,
+        'start_line': start_line,
+        'end_line': end_line,
+        'line_count': end_line - start_line + 1
+    }
 
 def count_methods(code: str) -> Dict[str, any]:
     """
@@ -20,60 +254,17 @@ def count_methods(code: str) -> Dict[str, any]:
         # Collect function definitions and their line counts
         for node in ast.walk(tree):
             if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
-                # Calculate the number of lines in the function
-                start_line = node.lineno
-                end_line = 0
-                
-                # Find the last line of the function by examining the last node in the body
-                for child in node.body:
-                    # Get the end line of the child node
-                    if hasattr(child, 'end_lineno') and child.end_lineno is not None:
-                        end_line = max(end_line, child.end_lineno)
-                    else:
-                        # If end_lineno is not available, use lineno as a fallback
-                        end_line = max(end_line, getattr(child, 'lineno', 0))
-                
-                # If we couldn't determine the end line, use the start line
-                if end_line == 0:
-                    end_line = start_line
-                
-                # Calculate the number of lines
-                line_count = end_line - start_line + 1
-                
-                methods.append({
-                    'name': node.name,
-                    'start_line': start_line,
-                    'end_line': end_line,
-                    'line_count': line_count
-                })
+                methods.append(_method_lines(node))
                 
         return {
             'count': len(methods),
             'methods': methods
         }
     except SyntaxError:
-        # If the code is not valid Python, use regex as a fallback
-        # This is less accurate but can work for other languages
-        
-        # Pattern for common method/function definitions in various languages
-        # This covers Python, JavaScript, Java, C#, C++, etc.
-        patterns = [
-            # Python, JavaScript, etc.: def function_name or function function_name
-            r'(def|function)\s+\w+\s*\(',
-            # Java, C#, C++, etc.: return_type function_name
-            r'(\w+\s+)+\w+\s*\([^)]*\)\s*{',
-            # Arrow functions in JavaScript
-            r'(const|let|var)?\s*\w+\s*=\s*(\([^)]*\)|[^=]*)\s*=>\s*[{(]'
-        ]
-        
-        method_count = 0
-        for pattern in patterns:
-            method_count += len(re.findall(pattern, code))
-        
-        # For non-Python code, we can't easily determine method sizes
-        # So we'll just return the count and an empty methods list
+        # If the code is not valid Python, use the token scan as a fallback
+        # It does not collect per-method information, so the methods list is empty
         return {
-            'count': method_count,
+            'count': _scan_metrics(code)['method_number'],
             'methods': []
         }
 
@@ -99,25 +290,8 @@ def count_ifs(code: str) -> int:
                 
         return if_count
     except SyntaxError:
-        # If the code is not valid Python, use regex as a fallback
-        # This is less accurate but can work for other languages
-        
-        # Pattern for common if statements in various languages
-        # This covers Python, JavaScript, Java, C#, C++, etc.
-        patterns = [
-            # if statement with condition
-            r'if\s*\(',
-            r'if\s+[^(]',  # Python style if without parentheses
-            # else if, elif variations
-            r'else\s+if\s*\(',
-            r'elif\s+'
-        ]
-        
-        if_count = 0
-        for pattern in patterns:
-            if_count += len(re.findall(pattern, code))
-            
-        return if_count
+        # If the code is not valid Python, use the token scan as a fallback
+        return _scan_metrics(code)['number_of_ifs']
 
 def count_loops(code: str) -> int:
     """
@@ -141,32 +315,8 @@ def count_loops(code: str) -> int:
                 
         return loop_count
     except SyntaxError:
-        # If the code is not valid Python, use regex as a fallback
-        # This is less accurate but can work for other languages
-        
-        # Pattern for common loop statements in various languages
-        # This covers Python, JavaScript, Java, C#, C++, etc.
-        patterns = [
-            # for loops
-            r'for\s*\(',
-            r'for\s+[^(]',  # Python style for without parentheses
-            # while loops
-            r'while\s*\(',
-            r'while\s+[^(]',  # Python style while without parentheses
-            # do-while loops
-            r'do\s*{',
-            # forEach and other iterator methods in JavaScript
-            r'\.forEach\s*\(',
-            r'\.map\s*\(',
-            r'\.filter\s*\(',
-            r'\.reduce\s*\('
-        ]
-        
-        loop_count = 0
-        for pattern in patterns:
-            loop_count += len(re.findall(pattern, code))
-            
-        return loop_count
+        # If the code is not valid Python, use the token scan as a fallback
+        return _scan_metrics(code)['number_of_loops']
 
 class CyclomaticComplexityVisitor(ast.NodeVisitor):
     """
@@ -316,44 +466,11 @@ def calculate_cyclomatic_complexity(code: str) -> Dict[str, any]:
             "functions": visitor.functions
         }
     except SyntaxError:
-        # If the code is not valid Python, use regex as a fallback
-        # This is less accurate but can work for other languages
-        
-        # Pattern for decision points in various languages
-        patterns = [
-            # if statements
-            r'if\s*\(',
-            r'if\s+[^(]',  # Python style if without parentheses
-            # else if, elif variations
-            r'else\s+if\s*\(',
-            r'elif\s+',
-            # loops
-            r'for\s*\(',
-            r'for\s+[^(]',  # Python style for without parentheses
-            r'while\s*\(',
-            r'while\s+[^(]',  # Python style while without parentheses
-            r'do\s*{',
-            # try-catch
-            r'catch\s*\(',
-            r'except\s+',
-            # boolean operators (rough approximation)
-            r'\s+&&\s+',
-            r'\s+\|\|\s+',
-            r'\s+and\s+',
-            r'\s+or\s+'
-        ]
-        
-        # Count decision points
-        decision_points = 0
-        for pattern in patterns:
-            decision_points += len(re.findall(pattern, code))
-        
+        # If the code is not valid Python, use the token scan as a fallback
         # Cyclomatic complexity = 1 + decision points
-        complexity = 1 + decision_points
-        
         return {
-            "total": complexity,
-            "functions": []  # Can't determine per-function complexity with regex
+            "total": _scan_metrics(code)["cyclomatic_complexity"],
+            "functions": []  # Can't determine per-function complexity with the token scan
         }
 
 def calculate_average_method_size(code: str) -> float:
@@ -376,16 +493,8 @@ def calculate_average_method_size(code: str) -> float:
         total_lines = sum(method['line_count'] for method in methods_info['methods'])
         return total_lines / methods_info['count']
     
-    # For non-Python code, we can make a rough estimate
-    # by counting the total lines and dividing by the number of methods
-    lines = code.split('\n')
-    non_empty_lines = [line for line in lines if line.strip()]
-    
-    # Avoid division by zero
-    if methods_info['count'] == 0:
-        return 0.0
-    
-    return len(non_empty_lines) / methods_info['count']
+    # For non-Python code, the token scan measures method bodies up to their closing brace
+    return _scan_metrics(code)['average_method_size']
 
 class MaxNestingVisitor(ast.NodeVisitor):
     """
@@ -486,56 +595,270 @@ def calculate_max_nesting(code: str) -> int:
         
         return visitor.max_nesting
     except SyntaxError:
-        # If the code is not valid Python, use regex as a fallback
-        # This is less accurate but can work for other languages
-        
-        # We'll count indentation levels as a proxy for nesting
-        lines = code.split('\n')
-        max_indent = 0
-        
-        for line in lines:
-            if line.strip():  # Skip empty lines
-                # Count leading spaces/tabs
-                indent = len(line) - len(line.lstrip())
-                # Estimate the nesting level based on indentation
-                # Assuming 2-4 spaces or 1 tab per level
-                estimated_nesting = indent // 2  # Conservative estimate
-                max_indent = max(max_indent, estimated_nesting)
-        
-        return max_indent
+        # If the code is not valid Python, use the brace depth of the token scan
+        return _scan_metrics(code)['max_nesting']
+
+# Node kinds the metrics walker handles; every other node only has its children walked
+_FUNCTION, _CLASS, _IF, _FOR, _ASYNC_FOR, _WHILE, _TRY, _WITH, _BOOL_OP = range(9)
+_KINDS = {
+    ast.FunctionDef: _FUNCTION, ast.AsyncFunctionDef: _FUNCTION, ast.ClassDef: _CLASS,
+    ast.If: _IF, ast.For: _FOR, ast.AsyncFor: _ASYNC_FOR, ast.While: _WHILE, ast.Try: _TRY,
+    ast.With: _WITH, ast.AsyncWith: _WITH, ast.BoolOp: _BOOL_OP,
+}
+
+
+class MetricsWalker:
+    """
+    Computes every metric of calculate_metrics in one traversal of one parsed tree.
+    
+    The traversal uses an explicit stack of (node, nesting, function) entries instead of
+    recursive visitor calls, so trees of any depth (long generated expressions, deeply
+    nested blocks) are walked in linear time without hitting the recursion limit. Nodes
+    are visited in source order.
+    
+    It follows exactly what each single-metric function counts:
+    - methods: every function definition, at any depth (as count_methods)
+    - ifs / loops: every if, for and while statement (async for is not a loop there)
+    - cyclomatic complexity: the decision points CyclomaticComplexityVisitor reaches,
+      which skips function signatures/decorators and the target/iterable of for loops
+    - max nesting: the blocks MaxNestingVisitor counts (elif and else are blocks too)
+    
+    The same counts are kept per function in `functions` (one entry per method, in
+    source order): each decision point, if and loop belongs to the innermost function
+    around it, as in CyclomaticComplexityVisitor, and a function's max_nesting is measured
+    from its own body (a body without blocks is 1).
+    """
+    
+    def __init__(self):
+        self.methods: List[Dict[str, Any]] = []
+        self.ifs = 0
+        self.loops = 0
+        self.complexity = 1  # Start with 1 (base complexity)
+        self.max_nesting = 0
+    
+    @property
+    def functions(self) -> List[Dict[str, Any]]:
+        return [
+            {key: value for key, value in method.items() if key != 'nesting_base'}
+            for method in self.methods
+        ]
+    
+    def walk(self, tree: ast.AST) -> "MetricsWalker":
+        stack = [(tree, 0, None)]
+        push, pop = stack.append, stack.pop
+        
+        def block(body, nesting, function):
+            # A nested block (MaxNestingVisitor semantics): its statements are one level deeper
+            nesting += 1
+            if nesting > self.max_nesting:
+                self.max_nesting = nesting
+            if function is not None and nesting - function['nesting_base'] > function['max_nesting']:
+                function['max_nesting'] = nesting - function['nesting_base']
+            for child in reversed(body):
+                push((child, nesting, function))
+        
+        def nodes(children, nesting, function):
+            for child in reversed(children):
+                if child is not None:
+                    push((child, nesting, function))
+        
+        def decisions(function, count):
+            self.complexity += count
+            if function is not None:
+                function['cyclomatic_complexity'] += count
+        
+        # Children are pushed in reverse (last field first) so they are popped in source order
+        while stack:
+            node, nesting, function = pop()
+            kind = _KINDS.get(type(node))
+            if kind is None:
+                nodes(list(ast.iter_child_nodes(node)), nesting, function)
+            elif kind == _BOOL_OP:
+                # Each boolean operator (and, or) adds 1 to complexity due to short-circuit evaluation
+                decisions(function, len(node.values) - 1)
+                nodes(node.values, nesting, function)
+            elif kind == _IF:
+                self.ifs += 1
+                if function is not None:
+                    function['number_of_ifs'] += 1
+                decisions(function, 1)
+                if node.orelse:
+                    block(node.orelse, nesting, function)
+                block(node.body, nesting, function)
+                push((node.test, nesting, function))
+            elif kind == _FUNCTION:
+                method = _method_lines(node)
+                method.update(
+                    cyclomatic_complexity=1, max_nesting=0, number_of_ifs=0, number_of_loops=0,
+                    nesting_base=nesting,
+                )
+                self.methods.append(method)
+                # Only the body: decorators, arguments and annotations are not part of the complexity
+                block(node.body, nesting, method)
+            elif kind == _FOR or kind == _ASYNC_FOR:
+                if kind == _FOR:
+                    self.loops += 1
+                    if function is not None:
+                        function['number_of_loops'] += 1
+                decisions(function, 1)
+                # The loop target and iterable are not walked (no decision points counted there)
+                if node.orelse:
+                    block(node.orelse, nesting, function)
+                block(node.body, nesting, function)
+            elif kind == _WHILE:
+                self.loops += 1
+                if function is not None:
+                    function['number_of_loops'] += 1
+                decisions(function, 1)
+                if node.orelse:
+                    block(node.orelse, nesting, function)
+                block(node.body, nesting, function)
+                push((node.test, nesting, function))
+            elif kind == _TRY:
+                # Each except handler adds 1 to complexity
+                decisions(function, len(node.handlers))
+                if node.finalbody:
+                    block(node.finalbody, nesting, function)
+                if node.orelse:
+                    block(node.orelse, nesting, function)
+                for handler in reversed(node.handlers):
+                    block(handler.body, nesting, function)
+                    if handler.type is not None:
+                        push((handler.type, nesting, function))
+                block(node.body, nesting, function)
+            elif kind == _WITH:
+                block(node.body, nesting, function)
+                nodes(node.items, nesting, function)
+            else:  # _CLASS
+                block(node.body, nesting, function)
+                nodes(node.decorator_list, nesting, function)
+                nodes(node.keywords, nesting, function)
+                nodes(node.bases, nesting, function)
+        return self
+
+
+_STATEMENT_KEYWORDS = {"if", "elif", "for", "while", "def", "except"}
+
+
+def _token_metrics(code: str) -> Dict[str, Any]:
+    """
+    Partial metrics of Python code ast.parse could not build a tree for (expressions
+    nested too deep for the parser, inputs too large for memory). One linear scan of
+    Python's tokenizer, which skips strings and comments: statements are recognised by
+    their leading keyword, boolean operators anywhere, nesting by indentation and a
+    function's size by its indented body. Methods, ifs, loops and sizes match the AST
+    ones for ordinary code; complexity also counts boolean operators the AST walk skips
+    (signatures, loop iterables) and nesting ignores elif/else levels and one-line bodies.
+    """
+    ifs = loops = decisions = max_depth = depth = 0
+    sizes: List[int] = []
+    open_defs: List[List[int]] = []  # [indent depth of the def, def line, last line of its body]
+    line_start, previous, last_line = True, "", 0
+    for token in tokenize.generate_tokens(io.StringIO(code).readline):
+        kind, text = token.type, token.string
+        if kind == tokenize.INDENT:
+            depth += 1
+            max_depth = max(max_depth, depth)
+            continue
+        if kind == tokenize.DEDENT:
+            depth -= 1
+            while open_defs and open_defs[-1][0] >= depth:
+                sizes.append(open_defs[-1][2] - open_defs.pop()[1] + 1)
+            continue
+        if kind in (tokenize.NL, tokenize.COMMENT, tokenize.ENCODING, tokenize.ENDMARKER):
+            continue
+        if kind == tokenize.NEWLINE:
+            line_start = True
+            continue
+        last_line = token.end[0]
+        for open_def in open_defs:
+            open_def[2] = last_line
+        if kind == tokenize.NAME:
+            if (line_start or previous == "async") and text in _STATEMENT_KEYWORDS:
+                if text == "def":
+                    open_defs.append([depth, token.start[0], last_line])
+                else:
+                    decisions += 1
+                    if text in ("if", "elif"):
+                        ifs += 1
+                    elif text == "while" or (text == "for" and previous != "async"):
+                        loops += 1
+            elif text in ("and", "or"):
+                decisions += 1
+        line_start, previous = False, text
+    sizes.extend(end - start + 1 for _, start, end in open_defs)
+    return {
+        "method_number": len(sizes),
+        "number_of_ifs": ifs,
+        "number_of_loops": loops,
+        "cyclomatic_complexity": 1 + decisions,
+        "average_method_size": sum(sizes) / len(sizes) if sizes else 0.0,
+        "max_nesting": max_depth,
+        "functions": [],
+        "partial": True,
+    }
+
+
+def _partial_metrics(code: str) -> Dict[str, Any]:
+    """Metrics for Python code without a syntax tree: token scan, or indentation only if that fails too."""
+    try:
+        return _token_metrics(code)
+    except (tokenize.TokenError, SyntaxError, RecursionError, MemoryError, ValueError):
+        return {
+            "method_number": 0,
+            "number_of_ifs": 0,
+            "number_of_loops": 0,
+            "cyclomatic_complexity": 1,
+            "average_method_size": 0.0,
+            "max_nesting": _indentation_nesting(code),
+            "functions": [],
+            "partial": True,
+        }
+
 
 def calculate_metrics(code: str) -> Dict[str, Any]:
     """
     Calculate various metrics for a given code snippet.
     
+    The code is parsed once and every metric is computed in a single traversal
+    (MetricsWalker); the results are the same as calling count_methods, count_ifs,
+    count_loops, calculate_cyclomatic_complexity, calculate_average_method_size and
+    calculate_max_nesting one by one. "functions" breaks the same counts down per
+    function (name, line span, line_count, cyclomatic_complexity, max_nesting,
+    number_of_ifs, number_of_loops), computed in that same traversal; it is empty for
+    code without a syntax tree.
+    
+    Code that is not valid Python (SyntaxError) is measured by one pass of a tokenizer
+    for JavaScript/TypeScript/Java/C#-style code (_scan_metrics).
+    
+    Python the parser cannot build a tree for (RecursionError, MemoryError, ValueError
+    on huge or pathologically nested input) gets partial metrics from a token scan,
+    marked with "partial": True, instead of an exception.
+    
     Args:
         code (str): The code snippet to analyze
         
     Returns:
         Dict[str, Any]: A dictionary containing the calculated metrics
     """
-    metrics = {}
-    
-    # Count methods
-    methods_info = count_methods(code)
-    metrics["method_number"] = methods_info['count']
-    
-    # Count if statements
-    metrics["number_of_ifs"] = count_ifs(code)
-    
-    # Count loops
-    metrics["number_of_loops"] = count_loops(code)
-    
-    # Calculate cyclomatic complexity
-    complexity = calculate_cyclomatic_complexity(code)
-    metrics["cyclomatic_complexity"] = complexity["total"]
-    
-    # Calculate average method size
-    metrics["average_method_size"] = calculate_average_method_size(code)
-    
-    # Calculate maximum nesting level
-    metrics["max_nesting"] = calculate_max_nesting(code)
-    
-    # Additional metrics can be added here in the future
-    
-    return metrics
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return _scan_metrics(code)
+    except (RecursionError, MemoryError, ValueError) as e:
+        print(f"calculate_metrics: no syntax tree ({type(e).__name__}), using partial metrics")
+        return _partial_metrics(code)
+    
+    walker = MetricsWalker().walk(tree)
+    
+    method_count = len(walker.methods)
+    total_lines = sum(method['line_count'] for method in walker.methods)
+    return {
+        "method_number": method_count,
+        "number_of_ifs": walker.ifs,
+        "number_of_loops": walker.loops,
+        "cyclomatic_complexity": walker.complexity,
+        "average_method_size": total_lines / method_count if method_count else 0.0,
+        "max_nesting": walker.max_nesting,
+        "functions": walker.functions,
+    }
@@ -0,0 +1,228 @@
+# /src/service/prompt_builder.py
+from __future__ import annotations
+from typing import Optional, Dict, Any, List
+import ast
+import copy
+import re
+
+try:  # Optional: exact counts for OpenAI models
+    import tiktoken
+except ImportError:  # pragma: no cover - depends on the environment
+    tiktoken = None
+
+from src.service.telemetry import record_prompt_parts
+
+PROMPT_PARTS = ("code", "analysis", "context", "tests", "scope")
+
+# Tokens per part; None = no limit
+DEFAULT_PROMPT_BUDGETS: Dict[str, Optional[int]] = {
+    "code": 8000,
+    "analysis": 2000,
+    "context": 3000,
+    "tests": 3000,
+    "scope": 1500,  # outline of the rest of the module when improving one unit
+}
+
+CHUNK_SEPARATOR = "\n\n---\n\n"
+
+# Without tiktoken: words split in 4-char pieces plus each punctuation mark,
+# close to what BPE tokenizers produce for source code
+_APPROX_TOKEN = re.compile(r"\w{1,4}|[^\w\s]")
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Token counting
+# ─────────────────────────────────────────────────────────────────────────────
+class TokenCounter:
+    def __init__(self, model: Optional[str] = None):
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.encoding_for_model(model or "")
+            except KeyError:
+                self.encoding = tiktoken.get_encoding("o200k_base")
+
+    @property
+    def exact(self) -> bool:
+        return self.encoding is not None
+
+    def count(self, text: Optional[str]) -> int:
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return len(_APPROX_TOKEN.findall(text))
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Reductions
+# ─────────────────────────────────────────────────────────────────────────────
+def truncate_lines(text: str, budget: int, counter: TokenCounter, comment: str = "#") -> str:
+    """Keeps the leading lines that fit in `budget` tokens and marks the cut."""
+    lines = text.splitlines()
+    kept: List[str] = []
+    used = 0
+    for line in lines:
+        cost = counter.count(line) + 1
+        if used + cost > budget:
+            break
+        kept.append(line)
+        used += cost
+    if len(kept) == len(lines):
+        return text
+    kept.append(f"{comment} ... {len(lines) - len(kept)} more lines omitted to fit the prompt budget")
+    return "\n".join(kept)
+
+
+def summarize_tests(tests: str) -> Optional[str]:
+    """
+    Summarizes a Python test file to its imports and the signatures (with the first
+    docstring line) of its classes and functions. None if the file does not parse.
+    """
+    try:
+        tree = ast.parse(tests)
+    except (SyntaxError, ValueError):
+        return None
+
+    def stub(node: ast.AST) -> Optional[ast.AST]:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            return node
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            return None
+        node = copy.copy(node)
+        body: List[ast.stmt] = []
+        doc = ast.get_docstring(node)
+        if doc:
+            body.append(ast.Expr(ast.Constant(doc.strip().splitlines()[0])))
+        if isinstance(node, ast.ClassDef):
+            body.extend(s for s in (stub(child) for child in node.body) if s is not None)
+        if not body or not isinstance(node, ast.ClassDef):
+            body.append(ast.Expr(ast.Constant(Ellipsis)))
+        node.body = body
+        return node
+
+    module = ast.Module(body=[s for s in (stub(n) for n in tree.body) if s is not None], type_ignores=[])
+    return ast.unparse(module)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Assembler
+# ─────────────────────────────────────────────────────────────────────────────
+class PromptParts:
+    """Budgeted prompt parts for one LLM call, with their token counts and what was reduced."""
+
+    def __init__(self):
+        self.code = ""
+        self.analysis = ""
+        self.context = ""
+        self.tests = ""
+        self.scope = ""
+        self.chunks: List[Dict[str, Any]] = []
+        self.tokens: Dict[str, int] = {}
+        self.degraded: List[str] = []
+
+
+class PromptAssembler:
+    """
+    Fits the variable parts of a prompt (code, analysis, retrieved context, tests) into
+    per-part token budgets, degrading gracefully:
+        context  -> drop the lowest-scored chunks first, then cut the last one
+        tests    -> reduce to imports + signatures, then cut by lines
+        analysis -> cut by lines (leading sections are kept); same for scope
+        code     -> cut by lines, only for stages that do not rewrite it
+    Each call reports the final token count per part to the request trace and /metrics.
+    """
+
+    def __init__(self, budgets: Optional[Dict[str, Optional[int]]] = None, model: Optional[str] = None):
+        self.budgets = dict(DEFAULT_PROMPT_BUDGETS)
+        self.budgets.update(budgets or {})
+        self.counter = TokenCounter(model)
+
+    def count(self, text: Optional[str]) -> int:
+        return self.counter.count(text)
+
+    def build(
+        self,
+        stage: str,
+        code: Optional[str] = None,
+        analysis: Optional[str] = None,
+        chunks: Optional[List[Dict[str, Any]]] = None,
+        tests: Optional[str] = None,
+        truncate_code: bool = True,
+        scope: Optional[str] = None
+    ) -> PromptParts:
+        parts = PromptParts()
+        if code is not None:
+            parts.code = self._fit_code(code, truncate_code, parts)
+        if analysis is not None:
+            parts.analysis = self._fit_text("analysis", analysis, parts)
+        if chunks is not None:
+            parts.chunks = self._fit_chunks(chunks, parts)
+            parts.context = CHUNK_SEPARATOR.join(c["text"] for c in parts.chunks)
+        if tests:
+            parts.tests = self._fit_tests(tests, parts)
+        if scope:
+            parts.scope = self._fit_text("scope", scope, parts)
+
+        for name in PROMPT_PARTS:
+            value = getattr(parts, name)
+            if value:
+                parts.tokens[name] = self.count(value)
+        record_prompt_parts(stage, parts.tokens, parts.degraded)
+        return parts
+
+    def _over(self, part: str, text: str) -> bool:
+        budget = self.budgets.get(part)
+        return budget is not None and self.count(text) > budget
+
+    def _fit_code(self, code: str, truncate: bool, parts: PromptParts) -> str:
+        if not self._over("code", code):
+            return code
+        if not truncate:
+            # The model has to return the whole file, so the code is sent in full
+            parts.degraded.append("code:over_budget")
+            return code
+        parts.degraded.append("code:truncated")
+        return truncate_lines(code, self.budgets["code"], self.counter)
+
+    def _fit_text(self, part: str, text: str, parts: PromptParts) -> str:
+        if not self._over(part, text):
+            return text
+        parts.degraded.append(f"{part}:truncated")
+        return truncate_lines(text, self.budgets[part], self.counter, comment="")
+
+    def _fit_chunks(self, chunks: List[Dict[str, Any]], parts: PromptParts) -> List[Dict[str, Any]]:
+        budget = self.budgets.get("context")
+        ranked = sorted(chunks, key=lambda c: c.get("score", 0.0), reverse=True)
+        if budget is None:
+            return ranked
+        kept: List[Dict[str, Any]] = []
+        used = 0
+        separator = self.count(CHUNK_SEPARATOR)
+        for chunk in ranked:
+            cost = self.count(chunk["text"]) + (separator if kept else 0)
+            if used + cost > budget:
+                break
+            kept.append(chunk)
+            used += cost
+        if len(kept) < len(ranked):
+            parts.degraded.append("context:dropped_chunks")
+        if not kept and ranked:
+            # Even the best chunk is too big: keep its beginning
+            parts.degraded.append("context:truncated")
+            best = dict(ranked[0])
+            best["text"] = truncate_lines(best["text"], budget, self.counter, comment="")
+            kept = [best]
+        return kept
+
+    def _fit_tests(self, tests: str, parts: PromptParts) -> str:
+        if not self._over("tests", tests):
+            return tests
+        signatures = summarize_tests(tests)
+        if signatures is not None:
+            parts.degraded.append("tests:signatures")
+            tests = signatures
+            if not self._over("tests", tests):
+                return tests
+        parts.degraded.append("tests:truncated")
+        return truncate_lines(tests, self.budgets["tests"], self.counter)
@@ -0,0 +1,112 @@
+# /src/service/query_builder.py
+from __future__ import annotations
+from typing import Dict, Any, List, Optional, Iterable
+import ast
+import re
+
+# Terms that carry no retrieval signal (keywords, builtins, generic names)
+_STOPWORDS = {
+    "self", "cls", "args", "kwargs", "none", "true", "false", "return", "def", "class",
+    "import", "from", "for", "while", "if", "else", "elif", "in", "is", "not", "and", "or",
+    "try", "except", "finally", "with", "as", "pass", "print", "len", "range", "str", "int",
+    "float", "dict", "list", "set", "tuple", "var", "let", "const", "function", "new", "this",
+    "public", "private", "static", "void", "the", "to", "of", "a", "an", "i", "j", "k", "x", "y",
+}
+
+# AST node type -> phrase that matches how the knowledge base talks about it
+_NODE_PHRASES = {
+    ast.ClassDef: "class design responsibilities",
+    ast.For: "loops iteration",
+    ast.While: "while loop termination",
+    ast.Try: "exception handling error handling",
+    ast.With: "context manager resource handling",
+    ast.Lambda: "lambda functions",
+    ast.ListComp: "list comprehension",
+    ast.DictComp: "dict comprehension",
+    ast.GeneratorExp: "generator expressions",
+    ast.Global: "global variables mutable state",
+    ast.Raise: "raising exceptions",
+    ast.AsyncFunctionDef: "async functions concurrency",
+    ast.Yield: "generators yield",
+}
+
+# (metric, threshold, phrase): smells inferred from calculate_metrics
+_SMELL_RULES = (
+    ("max_nesting", 4, "deeply nested code guard clauses early return"),
+    ("number_of_ifs", 5, "many if statements conditional logic simplify conditionals"),
+    ("cyclomatic_complexity", 10, "high cyclomatic complexity extract method"),
+    ("average_method_size", 30, "long methods functions should do one thing"),
+    ("number_of_loops", 4, "many loops nested loops helper functions"),
+)
+
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_CAMEL_BOUNDARY = re.compile(r"(?<=[a-z0-9])(?=[A-Z])|(?<=[A-Z])(?=[A-Z][a-z])")
+
+
+def split_identifier(name: str) -> List[str]:
+    """Splits snake_case / camelCase / PascalCase names into lowercase words."""
+    words = []
+    for part in name.split("_"):
+        words.extend(w.lower() for w in _CAMEL_BOUNDARY.split(part) if w)
+    return words
+
+
+def _unique_terms(names: Iterable[str], limit: int) -> List[str]:
+    terms: List[str] = []
+    for name in names:
+        for word in split_identifier(name):
+            if len(word) > 1 and not word.isdigit() and word not in _STOPWORDS and word not in terms:
+                terms.append(word)
+                if len(terms) >= limit:
+                    return terms
+    return terms
+
+
+def _python_names(tree: ast.AST) -> List[str]:
+    # Definitions first: function/class names describe the code better than locals
+    definitions, others = [], []
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            definitions.append(node.name)
+        elif isinstance(node, ast.arg):
+            others.append(node.arg)
+        elif isinstance(node, ast.Name):
+            others.append(node.id)
+        elif isinstance(node, ast.Attribute):
+            others.append(node.attr)
+    return definitions + others
+
+
+def build_code_queries(code: str, metrics: Optional[Dict[str, Any]] = None, max_terms: int = 24) -> List[str]:
+    """
+    Builds retrieval queries straight from the code, without waiting for the LLM analysis:
+        1) identifiers split into words (function/class names first)
+        2) kinds of constructs found in the AST (loops, try/except, classes...)
+        3) smells inferred from calculate_metrics (deep nesting, many ifs, long methods...)
+    Non-Python code (SyntaxError) falls back to regex identifiers and metric smells only.
+    Empty queries are omitted.
+    """
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        tree = None
+
+    if tree is not None:
+        names = _python_names(tree)
+        seen_types = {type(node) for node in ast.walk(tree)}
+        structure = [phrase for node_type, phrase in _NODE_PHRASES.items() if node_type in seen_types]
+    else:
+        names = _IDENTIFIER.findall(code)
+        structure = []
+
+    smells = [
+        phrase for metric, threshold, phrase in _SMELL_RULES
+        if metrics and (metrics.get(metric) or 0) >= threshold
+    ]
+
+    queries = [
+        " ".join(_unique_terms(names, max_terms)),
+        " ".join(structure),
+        " ".join(smells),
+    ]
+    return [q for q in queries if q]
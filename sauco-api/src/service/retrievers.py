@@ -0,0 +1,368 @@
+# /src/service/retrievers.py
+from __future__ import annotations
+from abc import ABC, abstractmethod
+from typing import Optional, Dict, Any, List, Tuple, Union, Sequence, TYPE_CHECKING
+import hashlib
+import threading
+import time
+
+import numpy as np
+
+from src.service.cache_service import TTLCache
+from src.service.sparse_index import BM25Index, SparseIndex
+from src.service.tfidf_artifact import TfidfQueryEncoder
+from src.service.telemetry import (
+    RETRIEVAL_CACHE_INVALIDATIONS, RETRIEVAL_CACHE_LOOKUPS, RETRIEVAL_CACHE_SAVED_SECONDS, timed
+)
+
+if TYPE_CHECKING:  # heavy import, only needed when Qdrant is used
+    from qdrant_client import QdrantClient
+
+# qdrant: TF-IDF sparse search in the Qdrant collection (one batched request)
+# memory: TF-IDF sparse search in an in-process inverted index loaded from a snapshot
+# bm25:   Okapi BM25 over an in-process index of term counts (same vocabulary as TF-IDF)
+RETRIEVERS = ("qdrant", "memory", "bm25")
+
+SPARSE_VECTOR_NAME = "text"  # Debe coincidir con tu sparse_vectors_config
+
+Hit = Dict[str, Any]  # score, page, chunk_id, text
+TopK = Union[int, Sequence[int]]
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Helper: TF-IDF sparse search in Qdrant
+# ─────────────────────────────────────────────────────────────────────────────
+def encode_queries(vectorizer, queries: List[str]) -> List[Tuple[List[int], List[float]]]:
+    """
+    Encodes every query with a single vectorizer.transform call and returns
+    one (indices, values) sparse pair per query, in the same order.
+    """
+    with timed("vectorizer_transform"):
+        matrix = vectorizer.transform(queries)
+    return sparse_pairs(matrix)
+
+
+def sparse_pairs(matrix) -> List[Tuple[List[int], List[float]]]:
+    """One (indices, values) pair per row of a CSR-shaped matrix."""
+    encoded = []
+    for i in range(matrix.shape[0]):
+        start, end = matrix.indptr[i], matrix.indptr[i + 1]
+        encoded.append((matrix.indices[start:end].tolist(), matrix.data[start:end].tolist()))
+    return encoded
+
+
+def _limits(top_k: TopK, n: int) -> List[int]:
+    return [top_k] * n if isinstance(top_k, int) else list(top_k)
+
+
+def query_qdrant_batch(
+    client: QdrantClient,
+    collection_name: str,
+    encoded: List[Tuple[List[int], List[float]]],
+    top_k: TopK = 5
+) -> List[List[Any]]:
+    """
+    Sends every encoded query to Qdrant in one query_batch_points request.
+    Returns one list of scored points per query, in the same order.
+    """
+    from qdrant_client import models
+
+    # Queries without known terms produce empty vectors; there is nothing to search for them
+    requests = []
+    positions = []
+    for position, ((idx, vals), limit) in enumerate(zip(encoded, _limits(top_k, len(encoded)))):
+        if not idx or limit <= 0:
+            continue
+        positions.append(position)
+        requests.append(
+            models.QueryRequest(
+                query=models.SparseVector(indices=idx, values=vals),
+                using=SPARSE_VECTOR_NAME,
+                limit=limit,
+                with_payload=True
+            )
+        )
+
+    results: List[List[Any]] = [[] for _ in encoded]
+    if not requests:
+        return results
+
+    with timed("qdrant_search"):
+        responses = client.query_batch_points(collection_name=collection_name, requests=requests)
+    for position, response in zip(positions, responses):
+        results[position] = list(response.points)
+    return results
+
+
+def search_tfidf_batch(
+    client: QdrantClient,
+    collection_name: str,
+    queries: List[str],
+    vectorizer,
+    top_k: int = 5
+) -> List[List[Any]]:
+    """
+    Runs several TF-IDF sparse searches in one round-trip: all queries are encoded
+    together and sent to Qdrant as one query_batch_points request.
+    Returns one list of scored points per query, in the same order as `queries`.
+    """
+    if client is None or vectorizer is None or not queries:
+        return [[] for _ in queries]
+    return query_qdrant_batch(client, collection_name, encode_queries(vectorizer, queries), top_k)
+
+
+def search_tfidf(
+    client: QdrantClient,
+    collection_name: str,
+    query: str,
+    vectorizer,
+    top_k: int = 5
+):
+    if client is None or vectorizer is None:
+        return []
+    return search_tfidf_batch(client, collection_name, [query], vectorizer, top_k)[0]
+
+
+def _hit(score: float, payload: Dict[str, Any]) -> Hit:
+    return {
+        "score": score,
+        "page": payload.get("page"),
+        "chunk_id": payload.get("chunk_id"),
+        "text": payload.get("text") or "",
+    }
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Retrievers
+# ─────────────────────────────────────────────────────────────────────────────
+class Retriever(ABC):
+    """
+    Sparse retrieval backend behind ImprovementService._retrieve_context.
+    Queries are encoded first (`encode`) and then searched (`search_encoded`), so
+    callers can work with the sparse vectors in between. `version` identifies the
+    indexed data and the encoder, for anything cached on top of the results.
+    """
+
+    name = "base"
+
+    def __init__(self, vectorizer):
+        self.vectorizer = vectorizer
+
+    @property
+    @abstractmethod
+    def version(self) -> str:
+        ...
+
+    def encode(self, queries: List[str]) -> List[Tuple[List[int], List[float]]]:
+        return encode_queries(self.vectorizer, queries)
+
+    @abstractmethod
+    def search_encoded(self, encoded: List[Tuple[List[int], List[float]]], top_k: TopK) -> List[List[Hit]]:
+        ...
+
+    def search(self, queries: List[str], top_k: TopK = 3) -> List[List[Hit]]:
+        """Best hits per query, best first; `top_k` is an int or one int per query."""
+        if not queries:
+            return []
+        return self.search_encoded(self.encode(queries), top_k)
+
+
+class QdrantRetriever(Retriever):
+    name = "qdrant"
+
+    def __init__(
+        self,
+        client: QdrantClient,
+        collection: str,
+        vectorizer,
+        kb_version: str = "",
+        stamp_seconds: float = 30.0,
+        clock=time.monotonic
+    ):
+        super().__init__(vectorizer)
+        self.client = client
+        self.collection = collection
+        # The collection can be re-ingested under the same name: the deployment's
+        # knowledge base version (KNOWLEDGE_BASE_VERSION) tells the contents apart
+        self.kb_version = kb_version
+        # ...and so does a stamp read from the collection itself, refreshed at most every stamp_seconds
+        self.stamp_seconds = stamp_seconds
+        self._clock = clock
+        self._stamp = ""
+        self._stamp_at: Optional[float] = None
+        self._stamp_lock = threading.Lock()
+
+    @property
+    def version(self) -> str:
+        return (
+            f"qdrant:{self.collection}:{self.kb_version}:{self.collection_stamp()}:"
+            f"{getattr(self.vectorizer, 'fingerprint', '')}"
+        )
+
+    def collection_stamp(self) -> str:
+        """
+        Points count of the collection (one cheap get_collection call), so a re-ingest
+        changes the version without bumping KNOWLEDGE_BASE_VERSION. Cached for
+        stamp_seconds; when Qdrant cannot be reached the last stamp is kept.
+        """
+        with self._stamp_lock:
+            now = self._clock()
+            if self._stamp_at is not None and now - self._stamp_at < self.stamp_seconds:
+                return self._stamp
+            self._stamp_at = now
+            try:
+                info = self.client.get_collection(collection_name=self.collection)
+                self._stamp = f"points={getattr(info, 'points_count', None)}"
+            except Exception as e:
+                print(f"Collection stamp of {self.collection} unavailable - {type(e).__name__}: {e}")
+            return self._stamp
+
+    def search_encoded(self, encoded, top_k: TopK) -> List[List[Hit]]:
+        batch = query_qdrant_batch(self.client, self.collection, encoded, top_k)
+        return [
+            [_hit(getattr(r, "score", 0.0), getattr(r, "payload", {}) or {}) for r in results]
+            for results in batch
+        ]
+
+
+class InMemoryRetriever(Retriever):
+    """Same TF-IDF dot-product search as Qdrant, over a SparseIndex held in this process."""
+
+    name = "memory"
+
+    index_class = SparseIndex
+
+    def __init__(self, index: SparseIndex, vectorizer):
+        super().__init__(vectorizer)
+        self.index = index
+
+    @classmethod
+    def load(cls, path: str, vectorizer, **params) -> "InMemoryRetriever":
+        return cls(cls.index_class.load(path, **params), vectorizer)
+
+    @property
+    def version(self) -> str:
+        return f"{self.name}:{self.index.fingerprint}:{getattr(self.vectorizer, 'fingerprint', '')}"
+
+    def search_encoded(self, encoded, top_k: TopK) -> List[List[Hit]]:
+        with timed(f"{self.name}_search"):
+            results = self.index.search(encoded, top_k)
+        return [[_hit(score, self.index.chunks[doc]) for doc, score in hits] for hits in results]
+
+
+class BM25Retriever(InMemoryRetriever):
+    """BM25 over a BM25Index; queries are encoded as term counts with the TF-IDF vocabulary."""
+
+    name = "bm25"
+    index_class = BM25Index
+
+    def __init__(self, index: BM25Index, vectorizer):
+        super().__init__(index, TfidfQueryEncoder.wrap(vectorizer))
+
+    def encode(self, queries: List[str]) -> List[Tuple[List[int], List[float]]]:
+        with timed("vectorizer_transform"):
+            counts = self.vectorizer.counts(queries)
+        return sparse_pairs(counts)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Retrieval cache
+# ─────────────────────────────────────────────────────────────────────────────
+def query_key(indices: Sequence[int], values: Sequence[float], top_k: int) -> str:
+    """Hash of one encoded query: its exact (indices, values) pair and the number of hits."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.asarray(indices, dtype=np.int64).tobytes())
+    digest.update(b"\x1f")
+    digest.update(np.asarray(values, dtype=np.float64).tobytes())
+    digest.update(f"\x1f{int(top_k)}".encode("ascii"))
+    return digest.hexdigest()
+
+
+class RetrievalCache:
+    """
+    Hits of already searched queries, keyed by query_key. The entries belong to one
+    retriever version (collection or snapshot + vectorizer): a lookup with another
+    version empties the cache first. Every entry keeps the search time it cost, which
+    is what a hit on it saves.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = 600.0, clock=time.monotonic):
+        self._entries = TTLCache(maxsize, ttl, clock)
+        self._lock = threading.Lock()
+        self.version: Optional[str] = None
+        self.invalidations = 0
+        self.saved_seconds = 0.0
+
+    def _use_version(self, version: str) -> None:
+        with self._lock:
+            if version == self.version:
+                return
+            if self.version is not None:
+                self._entries.clear()
+                self.invalidations += 1
+                RETRIEVAL_CACHE_INVALIDATIONS.inc()
+            self.version = version
+
+    def get(self, version: str, key: str) -> Optional[List[Hit]]:
+        self._use_version(version)
+        entry = self._entries.get(key)
+        if entry is None:
+            RETRIEVAL_CACHE_LOOKUPS.inc(("miss",))
+            return None
+        hits, seconds = entry
+        with self._lock:
+            self.saved_seconds += seconds
+        RETRIEVAL_CACHE_LOOKUPS.inc(("hit",))
+        RETRIEVAL_CACHE_SAVED_SECONDS.inc(amount=seconds)
+        return [dict(hit) for hit in hits]  # callers may modify their hits
+
+    def set(self, version: str, key: str, hits: List[Hit], seconds: float) -> None:
+        if version == self.version:
+            self._entries.set(key, ([dict(hit) for hit in hits], seconds))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._entries.stats(),
+            "version": self.version,
+            "invalidations": self.invalidations,
+            "saved_seconds": round(self.saved_seconds, 6),
+        }
+
+
+class CachedRetriever(Retriever):
+    """Wraps a retriever: only the queries the cache does not have reach its search, in one batch."""
+
+    def __init__(self, inner: Retriever, cache: RetrievalCache):
+        super().__init__(inner.vectorizer)
+        self.inner = inner
+        self.cache = cache
+        self.name = inner.name
+
+    @property
+    def version(self) -> str:
+        return self.inner.version
+
+    def encode(self, queries: List[str]) -> List[Tuple[List[int], List[float]]]:
+        return self.inner.encode(queries)
+
+    def search_encoded(self, encoded, top_k: TopK) -> List[List[Hit]]:
+        version = self.inner.version
+        limits = _limits(top_k, len(encoded))
+        keys = [query_key(idx, vals, limit) for (idx, vals), limit in zip(encoded, limits)]
+        results: List[Optional[List[Hit]]] = [self.cache.get(version, key) for key in keys]
+
+        # Repeated queries of the same batch are searched once
+        missing: Dict[str, int] = {}
+        for position, (key, hits) in enumerate(zip(keys, results)):
+            if hits is None:
+                missing.setdefault(key, position)
+        if missing:
+            positions = list(missing.values())
+            start = time.perf_counter()
+            fresh = self.inner.search_encoded([encoded[p] for p in positions], [limits[p] for p in positions])
+            per_query = (time.perf_counter() - start) / len(positions)
+            for position, hits in zip(positions, fresh):
+                self.cache.set(version, keys[position], hits, per_query)
+            by_key = dict(zip(missing, fresh))
+            results = [hits if hits is not None else [dict(h) for h in by_key[key]] for key, hits in zip(keys, results)]
+        return results
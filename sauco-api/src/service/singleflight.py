@@ -0,0 +1,49 @@
+# /src/service/singleflight.py
+from __future__ import annotations
+from typing import Any, Awaitable, Callable, Dict, Tuple
+import asyncio
+
+
+class SingleFlight:
+    """
+    In-flight de-duplication for coroutines: while a call for `key` is running,
+    identical calls await the same task instead of starting their own.
+
+    The work runs in its own task and callers await it through asyncio.shield, so a
+    caller that disconnects (and gets cancelled) does not cancel the work for the others.
+    Coalescing is per event loop, i.e. per uvicorn worker process.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Returns (result, shared). `shared` is True when the result came from a call
+        that another request had already started.
+        """
+        task = self._inflight.get(key)
+        shared = task is not None
+        if shared:
+            self.coalesced += 1
+        else:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        return await asyncio.shield(task), shared
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark the exception as retrieved even if every waiter was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": len(self._inflight), "leaders": self.leaders, "coalesced": self.coalesced}
@@ -0,0 +1,249 @@
+# /src/service/sparse_index.py
+"""
+In-memory inverted index over the knowledge-base chunk vectors, for sparse retrieval
+without a network hop to Qdrant.
+
+A snapshot is a directory:
+    meta.json     n_docs, n_terms, fingerprint, where it was built from
+    indptr.npy    int64, n_terms + 1: postings of term t are [indptr[t], indptr[t + 1])
+    docs.npy      int32, chunk id of each posting (ascending within a term)
+    weights.npy   float32, the chunk's vector value for the term (what Qdrant stores)
+    chunks.json   payload of every chunk (text, page, chunk_id, source), by chunk id
+
+The arrays are memory-mapped; scoring a batch of queries is a dot product computed
+with one gather over their postings and one bincount, like Qdrant's sparse search.
+
+A BM25 snapshot (meta "weighting": "bm25") has the same layout with raw term counts
+as weights, plus what BM25 needs precomputed at ingest:
+    doc_lengths.npy  float32, n_docs: number of vocabulary n-grams in each chunk
+    idf.npy          float32, n_terms: log(1 + (N - df + 0.5) / (df + 0.5))
+"""
+from __future__ import annotations
+from typing import Optional, Dict, Any, List, Sequence, Tuple
+import hashlib
+import json
+import os
+
+import numpy as np
+
+SNAPSHOT_FORMAT = "sauco-sparse-index"
+SNAPSHOT_VERSION = 1
+
+SparseVector = Tuple[Sequence[int], Sequence[float]]
+
+
+def is_snapshot(path: Optional[str]) -> bool:
+    return bool(path) and os.path.isfile(os.path.join(path, "meta.json"))
+
+
+def gather_postings(indptr: np.ndarray, terms: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Positions of all postings of `terms`, concatenated, and for each position the
+    index (into `terms`) of the term it belongs to. Vectorized: no loop per term.
+    """
+    starts = indptr[terms]
+    lengths = indptr[terms + 1] - starts
+    owner = np.repeat(np.arange(len(terms)), lengths)
+    positions = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths) + starts[owner]
+    return positions, owner
+
+
+def scroll_points(client, collection: str, with_vectors, batch_size: int = 256):
+    """Every point of a Qdrant collection, page by page."""
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection, limit=batch_size, offset=offset,
+            with_payload=True, with_vectors=with_vectors
+        )
+        yield from points
+        if offset is None:
+            return
+
+
+def build_postings(vectors: List[SparseVector], n_terms: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(indptr, docs, weights) of the term-major postings of one (indices, values) vector per chunk."""
+    lengths = [len(idx) for idx, _ in vectors]
+    doc_of = np.repeat(np.arange(len(vectors), dtype=np.int32), lengths)
+    terms = np.concatenate([np.asarray(idx, dtype=np.int64) for idx, _ in vectors]) if vectors else np.zeros(0, np.int64)
+    values = np.concatenate([np.asarray(v, dtype=np.float32) for _, v in vectors]) if vectors else np.zeros(0, np.float32)
+    n_terms = max(n_terms or 0, int(terms.max()) + 1 if len(terms) else 0)
+    order = np.lexsort((doc_of, terms))  # term-major, chunk order within a term
+    indptr = np.zeros(n_terms + 1, dtype=np.int64)
+    np.cumsum(np.bincount(terms, minlength=n_terms), out=indptr[1:])
+    return indptr, doc_of[order], values[order]
+
+
+def snapshot_meta(arrays: List[np.ndarray], chunks: List[Dict[str, Any]], source: str, **extra) -> Dict[str, Any]:
+    digest = hashlib.sha256()
+    for array in arrays:
+        digest.update(array.tobytes())
+    digest.update(json.dumps(chunks, sort_keys=True, default=str).encode("utf-8"))
+    return {
+        "format": SNAPSHOT_FORMAT,
+        "version": SNAPSHOT_VERSION,
+        "n_docs": len(chunks),
+        "n_terms": len(arrays[0]) - 1,
+        "source": source,
+        "fingerprint": digest.hexdigest()[:16],
+        **extra,
+    }
+
+
+def top_k_rows(scores: np.ndarray, top_k: Sequence[int]) -> List[List[Tuple[int, float]]]:
+    """(doc, score) pairs of the best `top_k[i]` positive scores of each row, best first."""
+    results = []
+    for row, k in zip(scores, top_k):
+        k = min(int(k), len(row))
+        if k <= 0:
+            results.append([])
+            continue
+        best = np.argpartition(-row, k - 1)[:k]
+        best = best[np.lexsort((best, -row[best]))]  # score desc, then chunk order
+        results.append([(int(d), float(row[d])) for d in best if row[d] > 0])
+    return results
+
+
+class SparseIndex:
+    WEIGHTING = "tfidf"  # weights are the chunks' TF-IDF vector values
+    ARRAYS = ("indptr", "docs", "weights")
+
+    def __init__(self, meta: Dict[str, Any], indptr: np.ndarray, docs: np.ndarray,
+                 weights: np.ndarray, chunks: List[Dict[str, Any]]):
+        self.meta = meta
+        self.indptr = indptr
+        self.docs = docs
+        self.weights = weights
+        self.chunks = chunks
+
+    @property
+    def n_docs(self) -> int:
+        return len(self.chunks)
+
+    @property
+    def n_terms(self) -> int:
+        return len(self.indptr) - 1
+
+    @property
+    def fingerprint(self) -> str:
+        return self.meta.get("fingerprint", "")
+
+    # -------------------- Building --------------------
+    @classmethod
+    def from_vectors(cls, vectors: List[SparseVector], chunks: List[Dict[str, Any]],
+                     n_terms: Optional[int] = None, source: str = "vectors") -> "SparseIndex":
+        """Builds the index from one (indices, values) vector per chunk, in chunk order."""
+        indptr, docs, weights = build_postings(vectors, n_terms)
+        meta = snapshot_meta([indptr, docs, weights], chunks, source, weighting=cls.WEIGHTING)
+        return cls(meta, indptr, docs, weights, chunks)
+
+    @classmethod
+    def from_qdrant(cls, client, collection: str, vector_name: str, batch_size: int = 256) -> "SparseIndex":
+        """Snapshot of a Qdrant collection: every point's sparse vector and payload."""
+        vectors: List[SparseVector] = []
+        chunks: List[Dict[str, Any]] = []
+        for point in scroll_points(client, collection, [vector_name], batch_size):
+            vector = (point.vector or {}).get(vector_name)
+            if vector is None:
+                continue
+            vectors.append((vector.indices, vector.values))
+            chunks.append(dict(point.payload or {}))
+        return cls.from_vectors(vectors, chunks, source=f"qdrant:{collection}")
+
+    # -------------------- Persistence --------------------
+    def save(self, path: str) -> None:
+        os.makedirs(path, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(path, "chunks.json"), "w", encoding="utf-8") as f:
+            json.dump(self.chunks, f, ensure_ascii=False)
+        # meta.json last: a directory without it is not a (complete) snapshot
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, indent=2)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True, **params) -> "SparseIndex":
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format") != SNAPSHOT_FORMAT or meta.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"{path} is not a {SNAPSHOT_FORMAT} v{SNAPSHOT_VERSION} snapshot")
+        if meta.get("weighting", "tfidf") != cls.WEIGHTING:
+            raise ValueError(f"{path} is a {meta.get('weighting', 'tfidf')} snapshot, expected {cls.WEIGHTING}")
+        mode = "r" if mmap else None
+        arrays = [np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode) for name in cls.ARRAYS]
+        with open(os.path.join(path, "chunks.json"), encoding="utf-8") as f:
+            chunks = json.load(f)
+        return cls(meta, *arrays[:3], chunks, *arrays[3:], **params)
+
+    # -------------------- Scoring --------------------
+    def score(self, queries: List[SparseVector]) -> np.ndarray:
+        """Score of every chunk for every query: (n_queries, n_docs) float64."""
+        lengths = [len(idx) for idx, _ in queries]
+        terms = np.concatenate([np.asarray(idx, dtype=np.int64) for idx, _ in queries]) if queries else np.zeros(0, np.int64)
+        values = np.concatenate([np.asarray(v, dtype=np.float64) for _, v in queries]) if queries else np.zeros(0)
+        query_of = np.repeat(np.arange(len(queries)), lengths)
+        known = (terms >= 0) & (terms < self.n_terms)  # terms the knowledge base never uses
+        terms, values, query_of = terms[known], values[known], query_of[known]
+
+        positions, owner = gather_postings(self.indptr, terms)
+        docs = self.docs[positions]
+        contributions = self._contributions(terms[owner], values[owner], docs, positions)
+        cells = query_of[owner] * self.n_docs + docs
+        scores = np.bincount(cells, weights=contributions, minlength=len(queries) * self.n_docs)
+        return scores.reshape(len(queries), self.n_docs)
+
+    def _contributions(self, terms: np.ndarray, values: np.ndarray, docs: np.ndarray, positions: np.ndarray) -> np.ndarray:
+        """Per gathered posting: what it adds to its (query, chunk) score. Dot product here."""
+        return values * self.weights[positions]
+
+    def search(self, queries: List[SparseVector], top_k) -> List[List[Tuple[int, float]]]:
+        """Best (chunk id, score) pairs per query; `top_k` is an int or one int per query."""
+        if not queries or self.n_docs == 0:
+            return [[] for _ in queries]
+        limits = [top_k] * len(queries) if isinstance(top_k, int) else list(top_k)
+        return top_k_rows(self.score(queries), limits)
+
+
+class BM25Index(SparseIndex):
+    """
+    Okapi BM25 over the same postings, with raw term counts as weights. Document
+    lengths and IDF are computed once at ingest and stored in the snapshot; k1 and b
+    are applied at query time, so they can be tuned without rebuilding it.
+    A query's values are its term counts, so repeated terms weigh more.
+    """
+
+    WEIGHTING = "bm25"
+    ARRAYS = SparseIndex.ARRAYS + ("doc_lengths", "idf")
+
+    def __init__(self, meta: Dict[str, Any], indptr: np.ndarray, docs: np.ndarray, weights: np.ndarray,
+                 chunks: List[Dict[str, Any]], doc_lengths: np.ndarray, idf: np.ndarray,
+                 k1: float = 1.2, b: float = 0.75):
+        super().__init__(meta, indptr, docs, weights, chunks)
+        self.doc_lengths = doc_lengths
+        self.idf = idf
+        self.k1 = k1
+        self.b = b
+        avgdl = float(meta.get("avgdl") or 1.0)
+        # k1 * (1 - b + b * |d| / avgdl), per chunk: the length part of the denominator
+        self._length_norm = k1 * (1.0 - b + b * np.asarray(doc_lengths, dtype=np.float64) / avgdl)
+
+    @property
+    def fingerprint(self) -> str:
+        return f"{self.meta.get('fingerprint', '')}:k1={self.k1:g}:b={self.b:g}"
+
+    @classmethod
+    def from_counts(cls, counts: List[SparseVector], chunks: List[Dict[str, Any]], n_terms: Optional[int] = None,
+                    source: str = "counts", **params) -> "BM25Index":
+        """Builds the index from the term counts of each chunk, in chunk order."""
+        indptr, docs, weights = build_postings(counts, n_terms)
+        n_docs = len(chunks)
+        doc_lengths = np.bincount(docs, weights=weights, minlength=n_docs).astype(np.float32)
+        df = np.diff(indptr).astype(np.float64)
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        avgdl = float(doc_lengths.mean()) if n_docs else 0.0
+        meta = snapshot_meta([indptr, docs, weights], chunks, source, weighting=cls.WEIGHTING, avgdl=avgdl or 1.0)
+        return cls(meta, indptr, docs, weights, chunks, doc_lengths, idf, **params)
+
+    def _contributions(self, terms, values, docs, positions):
+        tf = self.weights[positions].astype(np.float64)
+        return values * self.idf[terms] * tf * (self.k1 + 1.0) / (tf + self._length_norm[docs])
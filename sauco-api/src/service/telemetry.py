@@ -0,0 +1,263 @@
+# /src/service/telemetry.py
+from __future__ import annotations
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, Dict, Any, Tuple, Iterator, List, Sequence
+import bisect
+import threading
+import time
+
+# Seconds; LLM stages live in the upper buckets, metrics/vectorizer in the lower ones
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Prometheus-style metric types
+# ─────────────────────────────────────────────────────────────────────────────
+class Counter:
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Sequence[str] = (), amount: float = 1.0) -> None:
+        key = tuple(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, labels: Sequence[str] = ()) -> float:
+        return self._values.get(tuple(labels), 0.0)
+
+    def total(self) -> float:
+        """Sum over every label combination."""
+        with self._lock:
+            return sum(self._values.values())
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, labels: Sequence[str], value: float) -> None:
+        with self._lock:
+            self._values[tuple(labels)] = value
+
+    def value(self, labels: Sequence[str] = ()) -> float:
+        return self._values.get(tuple(labels), 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> (per-bucket counts, sum, count)
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Sequence[str], value: float) -> None:
+        key = tuple(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, labels: Sequence[str] = ()) -> int:
+        series = self._series.get(tuple(labels))
+        return series[2] if series else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (bucket_counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    cumulative += bucket_count
+                    le = _format_labels(self.label_names, labels, ("le", _format_value(bound)))
+                    lines.append(f"{self.name}_bucket{le} {cumulative}")
+                le = _format_labels(self.label_names, labels, ("le", "+Inf"))
+                lines.append(f"{self.name}_bucket{le} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {_format_value(total)}")
+                lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {count}")
+        return lines
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Process-wide registry (one per uvicorn worker)
+# ─────────────────────────────────────────────────────────────────────────────
+STAGE_SECONDS = Histogram(
+    "sauco_stage_duration_seconds",
+    "Duration of each /improve pipeline stage.",
+    ("stage",),
+)
+LLM_TOKENS = Counter(
+    "sauco_llm_tokens_total",
+    "OpenAI tokens reported in completion usage, by stage and kind.",
+    ("stage", "kind"),
+)
+LLM_REQUESTS = Counter(
+    "sauco_llm_requests_total",
+    "OpenAI chat completion calls, by stage.",
+    ("stage",),
+)
+PROMPT_TOKENS = Counter(
+    "sauco_prompt_part_tokens_total",
+    "Tokens of each prompt part (code, analysis, context, tests) after budgeting, by stage.",
+    ("stage", "part"),
+)
+PROMPT_DEGRADATIONS = Counter(
+    "sauco_prompt_degradations_total",
+    "Prompt parts reduced to fit their token budget, by stage, part and action.",
+    ("stage", "part", "action"),
+)
+LLM_RETRIES = Counter(
+    "sauco_llm_retries_total",
+    "OpenAI attempts that failed with a retryable error, by reason.",
+    ("reason",),
+)
+LLM_CIRCUIT_REJECTIONS = Counter(
+    "sauco_llm_circuit_rejections_total",
+    "OpenAI calls rejected without reaching the provider because the circuit was open.",
+)
+LLM_CONCURRENCY_LIMIT = Gauge(
+    "sauco_llm_concurrency_limit",
+    "Current adaptive (AIMD) limit of concurrent OpenAI requests.",
+)
+LLM_IN_FLIGHT = Gauge(
+    "sauco_llm_in_flight",
+    "OpenAI requests currently in flight.",
+)
+LLM_CIRCUIT_STATE = Gauge(
+    "sauco_llm_circuit_state",
+    "OpenAI circuit breaker state: 0 closed, 1 half-open, 2 open.",
+)
+RETRIEVAL_CACHE_LOOKUPS = Counter(
+    "sauco_retrieval_cache_lookups_total",
+    "Retrieval cache lookups of encoded queries, by result (hit, miss).",
+    ("result",),
+)
+RETRIEVAL_CACHE_SAVED_SECONDS = Counter(
+    "sauco_retrieval_cache_saved_seconds_total",
+    "Search time avoided by retrieval cache hits (the original search time of each hit entry).",
+)
+RETRIEVAL_CACHE_INVALIDATIONS = Counter(
+    "sauco_retrieval_cache_invalidations_total",
+    "Times the retrieval cache was emptied because the retriever version changed.",
+)
+
+REGISTRY: List[Any] = [
+    STAGE_SECONDS, LLM_TOKENS, LLM_REQUESTS, PROMPT_TOKENS, PROMPT_DEGRADATIONS,
+    LLM_RETRIES, LLM_CIRCUIT_REJECTIONS, LLM_CONCURRENCY_LIMIT, LLM_IN_FLIGHT, LLM_CIRCUIT_STATE,
+    RETRIEVAL_CACHE_LOOKUPS, RETRIEVAL_CACHE_SAVED_SECONDS, RETRIEVAL_CACHE_INVALIDATIONS,
+]
+
+
+def render_prometheus() -> str:
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Per-request trace
+# ─────────────────────────────────────────────────────────────────────────────
+_current_trace: ContextVar[Optional[Dict[str, Any]]] = ContextVar("sauco_trace", default=None)
+
+
+def start_trace() -> Dict[str, Any]:
+    """
+    Starts collecting timings/tokens for the current request. Tasks and to_thread
+    calls started afterwards inherit the context, so they add to the same trace.
+    """
+    trace: Dict[str, Any] = {"stages": {}, "tokens": {}, "prompt": {}, "degraded": {}}
+    _current_trace.set(trace)
+    return trace
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Times the block into the stage histogram and, if any, the current request trace."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe((stage,), elapsed)
+        trace = _current_trace.get()
+        if trace is not None:
+            # Stages that run several times per request (e.g. one search per unit) are summed
+            trace["stages"][stage] = trace["stages"].get(stage, 0.0) + elapsed
+
+
+def record_usage(stage: str, usage: Any) -> None:
+    """Records an OpenAI `usage` object (prompt/completion/total tokens) for a stage."""
+    LLM_REQUESTS.inc((stage,))
+    if usage is None:
+        return
+    trace = _current_trace.get()
+    for kind in ("prompt_tokens", "completion_tokens", "total_tokens"):
+        amount = getattr(usage, kind, None)
+        if amount is None:
+            continue
+        LLM_TOKENS.inc((stage, kind.replace("_tokens", "")), amount)
+        if trace is not None:
+            stage_tokens = trace["tokens"].setdefault(stage, {})
+            stage_tokens[kind] = stage_tokens.get(kind, 0) + amount
+
+
+def record_prompt_parts(stage: str, tokens: Dict[str, int], degraded: Sequence[str] = ()) -> None:
+    """Records the budgeted token count of each prompt part and any "part:action" reduction."""
+    for part, amount in tokens.items():
+        PROMPT_TOKENS.inc((stage, part), amount)
+    for reduction in degraded:
+        part, _, action = reduction.partition(":")
+        PROMPT_DEGRADATIONS.inc((stage, part, action))
+    trace = _current_trace.get()
+    if trace is not None:
+        # Last call wins: a stage builds its prompt once per request
+        trace["prompt"][stage] = dict(tokens)
+        if degraded:
+            trace["degraded"][stage] = list(degraded)
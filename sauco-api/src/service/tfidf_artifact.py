@@ -0,0 +1,371 @@
+# /src/service/tfidf_artifact.py
+"""
+Compact on-disk form of a fitted TfidfVectorizer, read without sklearn or pickle.
+
+An artifact is a directory:
+    meta.json     analyzer settings (token_pattern, ngram_range, lowercase, norm...)
+    terms.npy     uint8, the vocabulary as UTF-8 bytes, concatenated in sorted order
+    offsets.npy   uint32, n_terms + 1 offsets into terms.npy
+    columns.npy   int32, vector column of each sorted term; omitted when the columns
+                  are already in term order (sklearn's default)
+    hash.npy      int32 open-addressing table (crc32 of the term -> sorted position,
+                  -1 = empty) for vectorized lookups of a whole batch of n-grams
+    idf.npy       float32 IDF weight per column (float64 with idf_dtype="float64")
+
+All arrays are opened with np.load(mmap_mode="r"): API workers on the same host
+share the page cache instead of each unpickling its own copy of the vocabulary.
+"""
+from __future__ import annotations
+from bisect import bisect_left
+from typing import Optional, Dict, Any, List, Sequence
+import hashlib
+import json
+import os
+import re
+import threading
+import zlib
+
+import numpy as np
+
+ARTIFACT_FORMAT = "sauco-tfidf"
+ARTIFACT_VERSION = 1
+_FILES = ("terms", "offsets", "columns", "idf", "hash")
+
+
+def is_artifact(path: Optional[str]) -> bool:
+    return bool(path) and os.path.isfile(os.path.join(path, "meta.json"))
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Export
+# ─────────────────────────────────────────────────────────────────────────────
+def _hash_index(encoded_terms: List[bytes]) -> np.ndarray:
+    """Linear-probing table at load factor <= 0.5: lookups take ~1.5 probes on average."""
+    size = 1 << max(4, (2 * len(encoded_terms) - 1).bit_length())
+    table = np.full(size, -1, dtype=np.int32)
+    mask = size - 1
+    for position, term in enumerate(encoded_terms):
+        slot = zlib.crc32(term) & mask
+        while table[slot] >= 0:
+            slot = (slot + 1) & mask
+        table[slot] = position
+    return table
+
+
+def _artifact_parts(vectorizer, idf_dtype: str):
+    """(meta, arrays) of a fitted TfidfVectorizer; arrays["columns"] is None in term order."""
+    for attr in ("analyzer", "preprocessor", "tokenizer"):
+        value = getattr(vectorizer, attr, None)
+        if (attr == "analyzer" and value != "word") or (attr != "analyzer" and value is not None):
+            raise ValueError(f"Unsupported vectorizer setting {attr}={value!r}: only the default word analyzer can be exported")
+    if getattr(vectorizer, "strip_accents", None) is not None:
+        raise ValueError("Unsupported vectorizer setting strip_accents: re-fit without it or keep the pickle")
+
+    vocabulary: Dict[str, int] = vectorizer.vocabulary_
+    ordered = sorted((term.encode("utf-8"), column) for term, column in vocabulary.items())
+    encoded = [term for term, _ in ordered]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint32)
+    np.cumsum([len(term) for term in encoded], out=offsets[1:])
+    terms = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    columns = np.asarray([column for _, column in ordered], dtype=np.int32)
+    if np.array_equal(columns, np.arange(len(columns))):
+        columns = None
+    if getattr(vectorizer, "use_idf", True):
+        idf = np.asarray(vectorizer.idf_, dtype=idf_dtype)
+    else:
+        idf = np.ones(len(vocabulary), dtype=idf_dtype)
+
+    stop_words = vectorizer.get_stop_words()
+    meta = {
+        "format": ARTIFACT_FORMAT,
+        "version": ARTIFACT_VERSION,
+        "n_terms": len(encoded),
+        "lowercase": bool(vectorizer.lowercase),
+        "token_pattern": vectorizer.token_pattern,
+        "ngram_range": list(vectorizer.ngram_range),
+        "stop_words": sorted(stop_words) if stop_words is not None else None,
+        "binary": bool(vectorizer.binary),
+        "sublinear_tf": bool(vectorizer.sublinear_tf),
+        "use_idf": bool(vectorizer.use_idf),
+        "norm": vectorizer.norm,
+        "idf_dtype": idf.dtype.name,
+        "sorted_columns": columns is None,
+    }
+    arrays = {"terms": terms, "offsets": offsets, "columns": columns, "idf": idf, "hash": _hash_index(encoded)}
+    digest = hashlib.sha256(json.dumps(meta, sort_keys=True).encode("utf-8"))
+    for array in arrays.values():
+        if array is not None:
+            digest.update(array.tobytes())
+    meta["fingerprint"] = digest.hexdigest()[:16]
+    return meta, arrays
+
+
+def export_vectorizer(vectorizer, path: str, idf_dtype: str = "float32") -> Dict[str, Any]:
+    """
+    Writes a fitted TfidfVectorizer as an artifact directory at `path` and returns
+    its meta. Only the default word analyzer is supported (custom callables
+    cannot be serialized without pickle).
+    """
+    meta, arrays = _artifact_parts(vectorizer, idf_dtype)
+    os.makedirs(path, exist_ok=True)
+    for name, array in arrays.items():
+        target = os.path.join(path, f"{name}.npy")
+        if array is not None:
+            np.save(target, array)
+        elif os.path.exists(target):
+            os.remove(target)  # left over from a previous export
+    # meta.json last: a directory without it is not a (complete) artifact
+    with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Reading
+# ─────────────────────────────────────────────────────────────────────────────
+class _SortedTerms(Sequence):
+    """The sorted term table as a sequence of bytes, for bisect on the mapped arrays."""
+
+    def __init__(self, terms: np.ndarray, offsets: np.ndarray):
+        self._terms = terms
+        self._offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i: int) -> bytes:
+        return self._terms[self._offsets[i]:self._offsets[i + 1]].tobytes()
+
+
+class TfidfArtifact:
+    def __init__(self, meta: Dict[str, Any], terms: np.ndarray, offsets: np.ndarray,
+                 columns: Optional[np.ndarray], idf: np.ndarray, hash_index: np.ndarray):
+        self.meta = meta
+        self.terms = _SortedTerms(terms, offsets)
+        self.columns = columns
+        self.idf = idf
+        self._term_bytes = terms
+        # Kept as mapped uint32: only the gathered slices are widened in lookup
+        self._offsets = offsets
+        self._hash = hash_index
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "TfidfArtifact":
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format") != ARTIFACT_FORMAT or meta.get("version") != ARTIFACT_VERSION:
+            raise ValueError(f"{path} is not a {ARTIFACT_FORMAT} v{ARTIFACT_VERSION} artifact")
+        mode = "r" if mmap else None
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode)
+            for name in _FILES if not (name == "columns" and meta.get("sorted_columns"))
+        }
+        return cls(meta, arrays["terms"], arrays["offsets"], arrays.get("columns"), arrays["idf"], arrays["hash"])
+
+    @classmethod
+    def from_vectorizer(cls, vectorizer, idf_dtype: str = "float64") -> "TfidfArtifact":
+        """In-memory artifact of a fitted vectorizer (float64 IDF: identical vectors)."""
+        meta, arrays = _artifact_parts(vectorizer, idf_dtype)
+        return cls(meta, arrays["terms"], arrays["offsets"], arrays["columns"], arrays["idf"], arrays["hash"])
+
+    @property
+    def fingerprint(self) -> str:
+        return self.meta.get("fingerprint", "")
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def column(self, term: str) -> int:
+        """Vector column of `term`, or -1 when it is not in the vocabulary."""
+        key = term.encode("utf-8")
+        i = bisect_left(self.terms, key)
+        if i < len(self.terms) and self.terms[i] == key:
+            return i if self.columns is None else int(self.columns[i])
+        return -1
+
+    def lookup(self, terms: List[str]) -> np.ndarray:
+        """
+        Vector columns of many terms at once (-1 = not in the vocabulary). All terms
+        probe the hash table together; candidates are confirmed by comparing their
+        bytes with the term table, and collisions move to the next slot.
+        """
+        encoded = [t.encode("utf-8") for t in terms]
+        found = np.full(len(encoded), -1, dtype=np.int64)
+        if not encoded:
+            return found
+        mask = len(self._hash) - 1
+        slots = np.fromiter((zlib.crc32(b) for b in encoded), dtype=np.int64, count=len(encoded)) & mask
+        lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+        query_bytes = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        query_offsets = np.zeros(len(encoded), dtype=np.int64)
+        np.cumsum(lengths[:-1], out=query_offsets[1:])
+
+        pending = np.arange(len(encoded))
+        while pending.size:
+            candidates = self._hash[slots[pending]].astype(np.int64)
+            occupied = candidates >= 0
+            pending, candidates = pending[occupied], candidates[occupied]  # empty slot: not found
+            starts = self._offsets[candidates].astype(np.int64)
+            same = (self._offsets[candidates + 1].astype(np.int64) - starts) == lengths[pending]
+            # Byte-by-byte comparison of the same-length candidates, all at once
+            sizes = lengths[pending[same]]
+            owner = np.repeat(np.arange(len(sizes)), sizes)
+            within = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+            equal = self._term_bytes[starts[same][owner] + within] == \
+                query_bytes[query_offsets[pending[same]][owner] + within]
+            mismatches = np.bincount(owner, weights=~equal, minlength=len(sizes))
+            matched = np.zeros(len(pending), dtype=bool)
+            matched[np.flatnonzero(same)[mismatches == 0]] = True
+            positions = candidates[matched]
+            found[pending[matched]] = positions if self.columns is None else self.columns[positions]
+            pending = pending[~matched]
+            slots[pending] = (slots[pending] + 1) & mask
+        return found
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Query encoder
+# ─────────────────────────────────────────────────────────────────────────────
+class SparseRows:
+    """CSR-shaped result (indptr/indices/data/shape), what encode_queries reads from a transform."""
+
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray, data: np.ndarray, n_features: int):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.shape = (len(indptr) - 1, n_features)
+
+
+class TfidfQueryEncoder:
+    """
+    NumPy replacement for TfidfVectorizer.transform on a TfidfArtifact. A batch of
+    queries is encoded in one vectorized pass: tokenization and vocabulary lookups
+    are per distinct n-gram, then counting, TF, IDF and normalization run on flat
+    arrays for the whole batch. The operations follow sklearn's order (counts ->
+    log+1 -> *idf -> sequential row norm), so with the same IDF dtype the output is
+    bit-identical to the vectorizer's.
+    """
+
+    def __init__(self, artifact: TfidfArtifact, cache_size: int = 65536):
+        self.artifact = artifact
+        # n-gram -> column (-1 = unknown) for the terms seen recently; bounded, per process
+        self.cache_size = cache_size
+        self._column_cache: Dict[str, int] = {}
+        self._cache_lock = threading.Lock()  # encoders are shared by asyncio.to_thread workers
+        meta = artifact.meta
+        self._token = re.compile(meta["token_pattern"])
+        self._lowercase = meta["lowercase"]
+        self._ngram_range = tuple(meta["ngram_range"])
+        self._stop_words = frozenset(meta["stop_words"]) if meta.get("stop_words") else None
+        self._binary = meta["binary"]
+        self._sublinear_tf = meta["sublinear_tf"]
+        self._norm = meta["norm"]
+        self._n_features = len(artifact.idf)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "TfidfQueryEncoder":
+        return cls(TfidfArtifact.load(path, mmap=mmap))
+
+    @classmethod
+    def from_vectorizer(cls, vectorizer) -> "TfidfQueryEncoder":
+        return cls(TfidfArtifact.from_vectorizer(vectorizer))
+
+    @property
+    def fingerprint(self) -> str:
+        return self.artifact.fingerprint
+
+    def analyze(self, text: str) -> List[str]:
+        """Word n-grams exactly as sklearn's word analyzer builds them."""
+        if self._lowercase:
+            text = text.lower()
+        tokens = self._token.findall(text)
+        if self._stop_words is not None:
+            tokens = [t for t in tokens if t not in self._stop_words]
+        min_n, max_n = self._ngram_range
+        if max_n == 1:
+            return tokens
+        grams = list(tokens) if min_n == 1 else []
+        for n in range(max(min_n, 2), min(max_n + 1, len(tokens) + 1)):
+            # Same order as sklearn's nested loop: every n-gram starting at 0, 1, 2...
+            grams.extend(map(" ".join, zip(*(tokens[i:] for i in range(n)))))
+        return grams
+
+    def encode(self, text: str):
+        """(indices, values) of one query, indices ascending."""
+        rows = self.transform([text])
+        return rows.indices, rows.data
+
+    @classmethod
+    def wrap(cls, vectorizer) -> "TfidfQueryEncoder":
+        """The encoder itself, or one built from a fitted TfidfVectorizer."""
+        return vectorizer if isinstance(vectorizer, cls) else cls.from_vectorizer(vectorizer)
+
+    def counts(self, queries: List[str]) -> SparseRows:
+        """Raw term counts per query (CountVectorizer.transform), indices ascending."""
+        # 1) n-grams -> columns: cached n-grams are a dict hit, the distinct misses of
+        #    the batch are looked up together in the artifact
+        grams: List[str] = []
+        lengths: List[int] = []
+        for query in queries:
+            query_grams = self.analyze(query)
+            lengths.append(len(query_grams))
+            grams.extend(query_grams)
+        cache = self._column_cache
+        with self._cache_lock:
+            columns = [cache.get(g, -2) for g in grams]
+        if -2 in columns:
+            missing = list({g for g, c in zip(grams, columns) if c == -2})
+            found = dict(zip(missing, self.artifact.lookup(missing).tolist()))
+            with self._cache_lock:
+                if len(cache) + len(found) > self.cache_size:
+                    cache.clear()
+                cache.update(found)
+            # From this call's own hits and lookups: an eviction may have dropped the hits from the cache
+            columns = [found[g] if c == -2 else c for g, c in zip(grams, columns)]
+        columns = np.asarray(columns, dtype=np.int64)
+        row_ids = np.repeat(np.arange(len(queries), dtype=np.int64), lengths)
+        known = columns >= 0
+        row_ids, col_ids = row_ids[known], columns[known]
+
+        # 2) term counts per (row, column), sorted by row then column like sklearn's CSR
+        keys = row_ids * self._n_features + col_ids
+        keys, counts = np.unique(keys, return_counts=True)
+        rows = keys // self._n_features
+        indices = (keys % self._n_features).astype(np.int32)
+        indptr = np.zeros(len(queries) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(queries)), out=indptr[1:])
+        return SparseRows(indptr, indices, counts.astype(np.float64), self._n_features)
+
+    def transform(self, queries: List[str]) -> SparseRows:
+        counted = self.counts(queries)
+        indptr, indices, data = counted.indptr, counted.indices, counted.data
+        rows = np.repeat(np.arange(len(queries), dtype=np.int64), np.diff(indptr))
+
+        # 3) TF -> IDF -> row normalization, vectorized over the batch
+        if self._binary:
+            data[:] = 1.0
+        if self._sublinear_tf:
+            np.log(data, out=data)
+            data += 1.0
+        data *= self.artifact.idf[indices]
+        if self._norm in ("l1", "l2"):
+            norms = self._row_norms(data, rows, indptr)
+            nonzero = norms[rows] != 0.0
+            data[nonzero] /= norms[rows][nonzero]
+        return SparseRows(indptr, indices, data, self._n_features)
+
+    def _row_norms(self, data: np.ndarray, rows: np.ndarray, indptr: np.ndarray) -> np.ndarray:
+        """
+        Per-row L2 (or L1) norm, summed left to right like sklearn's Cython loop.
+        np.add.reduceat uses pairwise summation, which can differ in the last bit,
+        so the rows are laid out in a zero-padded matrix and its columns are added
+        one at a time: a loop of max-terms-per-query steps over the whole batch.
+        """
+        terms = data * data if self._norm == "l2" else np.abs(data)
+        lengths = np.diff(indptr)
+        padded = np.zeros((len(lengths), int(lengths.max(initial=0))))
+        padded[rows, np.arange(len(data)) - indptr[rows]] = terms
+        sums = np.zeros(len(lengths))
+        for j in range(padded.shape[1]):
+            sums += padded[:, j]
+        return np.sqrt(sums) if self._norm == "l2" else sums
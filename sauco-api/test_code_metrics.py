@@ -0,0 +1,105 @@
+import asyncio
+from concurrent.futures.process import BrokenProcessPool
+
+import httpx
+
+import api
+from src.service.metrics_pool import MetricsPool, split_by_size
+from src.domain.models import MAX_METRICS_CODE_LENGTH
+from src.service.metrics_service import calculate_metrics
+from test_metrics_engine import JAVASCRIPT, SNIPPETS
+
+FILES = [{"Path": f"src/module_{i}.py", "Code": code} for i, code in enumerate(SNIPPETS + [JAVASCRIPT])]
+
+
+def _post(path, body):
+    async def run():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post(path, json=body)
+    return asyncio.run(run())
+
+
+def test_code_metrics_endpoint_does_not_call_the_llm():
+    code = SNIPPETS[5]
+    service = api._service
+    api._service = None  # any use of the improvement pipeline would fail
+    try:
+        response = _post("/code_metrics", {"Code": code})
+    finally:
+        api._service = service
+
+    assert response.status_code == 200
+    assert response.json() == {**calculate_metrics(code), "partial": False}
+    assert response.json()["functions"][0]["name"] == "m"
+
+
+def test_batch_endpoint_spreads_large_batches_across_processes():
+    pool = api._metrics_pool
+    api._metrics_pool = MetricsPool(workers=2, min_pool_bytes=0)
+    try:
+        response = _post("/code_metrics/batch", {"Files": FILES})
+        started = api._metrics_pool._executor is not None
+    finally:
+        api._metrics_pool.shutdown()
+        api._metrics_pool = pool
+
+    assert response.status_code == 200
+    assert started
+    results = response.json()["Results"]
+    assert [r["Path"] for r in results] == [f["Path"] for f in FILES]
+    for result, file in zip(results, FILES):
+        expected = {**calculate_metrics(file["Code"]), "partial": False}
+        assert result["metrics"] == expected, file["Path"]
+
+
+def test_small_batches_are_measured_in_process():
+    pool = MetricsPool(workers=4)
+
+    measured = asyncio.run(pool.measure([f["Code"] for f in FILES]))
+
+    assert pool._executor is None
+    assert measured == [calculate_metrics(f["Code"]) for f in FILES]
+
+
+def test_split_by_size_keeps_order_and_balances_chunks():
+    codes = ["x" * n for n in (50, 10, 10, 10, 10, 10, 100, 1)]
+
+    chunks = split_by_size(codes, 3)
+
+    assert [i for chunk in chunks for i in chunk] == list(range(len(codes)))
+    assert len(chunks) == 3
+    assert [sum(len(codes[i]) for i in chunk) for chunk in chunks] == [70, 130, 1]
+    assert split_by_size(codes[:2], 8) == [[0], [1]]
+
+
+class BrokenExecutor:
+    """Stands in for a pool whose worker died: every submit fails."""
+
+    def __init__(self):
+        self.shut_down = False
+
+    def submit(self, fn, *args):
+        raise BrokenProcessPool("A child process terminated abruptly")
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+def test_broken_pool_is_dropped_and_the_batch_measured_in_process():
+    pool = MetricsPool(workers=2, min_pool_bytes=0)
+    broken = pool._executor = BrokenExecutor()
+
+    measured = asyncio.run(pool.measure([f["Code"] for f in FILES]))
+
+    assert measured == [calculate_metrics(f["Code"]) for f in FILES]
+    assert broken.shut_down and pool._executor is None
+
+
+def test_code_over_the_size_limit_is_rejected():
+    code = "x = 1\n" * (MAX_METRICS_CODE_LENGTH // 6 + 1)
+
+    single = _post("/code_metrics", {"Code": code})
+    batch = _post("/code_metrics/batch", {"Files": [{"Code": "x = 1"}, {"Code": code}]})
+
+    assert single.status_code == batch.status_code == 422
@@ -0,0 +1,97 @@
+import asyncio
+import time
+
+from fake_llm import FakeLLM
+from src.service.improvement_service import ImprovementService
+from src.service.metrics_service import calculate_metrics
+from src.service.query_builder import build_code_queries, split_identifier
+
+LLM_LATENCY = 0.2
+SEARCH_LATENCY = 0.2
+
+nested_code = """
+class OrderProcessor:
+    def processPendingOrders(self, order_list):
+        for order in order_list:
+            if order.is_valid:
+                for item in order.items:
+                    if item.stock_count > 0:
+                        while item.retry_count < 3:
+                            try:
+                                item.reserve()
+                            except ValueError:
+                                item.retry_count += 1
+"""
+
+
+def test_split_identifier_handles_snake_and_camel_case():
+    assert split_identifier("processPendingOrders") == ["process", "pending", "orders"]
+    assert split_identifier("HTTPResponse_code") == ["http", "response", "code"]
+
+
+def test_build_code_queries_uses_identifiers_node_kinds_and_smells():
+    identifiers, structure, smells = build_code_queries(nested_code, calculate_metrics(nested_code))
+
+    assert identifiers.startswith("order processor process pending orders")
+    assert "stock" in identifiers and "self" not in identifiers
+    assert "class design" in structure and "exception handling" in structure
+    assert "deeply nested code" in smells
+
+
+def test_build_code_queries_falls_back_for_non_python_code():
+    queries = build_code_queries("function computeTotal(items) { return items.length; }", {"max_nesting": 1})
+    assert queries == ["compute total items length"]
+
+
+class SlowSearchService(ImprovementService):
+    """Replaces Qdrant with a fixed-latency search that records the queries it gets."""
+
+    def __init__(self, analysis_latency=SEARCH_LATENCY, **kwargs):
+        super().__init__("test-model", None, None, None,
+                         llm_client=FakeLLM(delay=LLM_LATENCY, describe="## Purpose\nProcesses orders."), **kwargs)
+        self.analysis_latency = analysis_latency
+        self.searches = []
+
+    def _retrieve_context(self, query_text):
+        from_analysis = query_text == ["Purpose\nProcesses orders."]
+        self.searches.append("analysis" if from_analysis else "code")
+        time.sleep(self.analysis_latency if from_analysis else SEARCH_LATENCY)
+        chunk = {"score": 0.9 if from_analysis else 0.5, "page": 1,
+                 "chunk_id": "a" if from_analysis else "c", "text": "analysis chunk" if from_analysis else "code chunk"}
+        return chunk["text"], [chunk]
+
+
+async def _time_to_context(service, mode):
+    start = time.perf_counter()
+    async for event, data in service.stream_workflow(nested_code, retrieval_mode=mode):
+        if event == "context":
+            return time.perf_counter() - start, data
+
+
+def test_code_mode_overlaps_retrieval_with_describe():
+    analysis_service, code_service = SlowSearchService(), SlowSearchService()
+    analysis_elapsed, analysis_context = asyncio.run(_time_to_context(analysis_service, "analysis"))
+    code_elapsed, code_context = asyncio.run(_time_to_context(code_service, "code"))
+
+    assert analysis_service.searches == ["analysis"]
+    assert code_service.searches == ["code"]
+    assert [c["chunk_id"] for c in code_context] == ["c"]
+    # Sequential: describe + search. Parallel: max(describe, search)
+    assert analysis_elapsed >= LLM_LATENCY + SEARCH_LATENCY
+    assert code_elapsed < LLM_LATENCY + SEARCH_LATENCY / 2
+
+
+def test_hybrid_mode_merges_analysis_results_within_budget():
+    service = SlowSearchService(analysis_latency=0.01, analysis_retrieval_budget=0.5)
+    _, context = asyncio.run(_time_to_context(service, "hybrid"))
+
+    assert sorted(service.searches) == ["analysis", "code"]
+    assert [c["chunk_id"] for c in context] == ["a", "c"]
+
+
+def test_hybrid_mode_skips_analysis_results_over_budget():
+    service = SlowSearchService(analysis_latency=0.5, analysis_retrieval_budget=0.05)
+    elapsed, context = asyncio.run(_time_to_context(service, "hybrid"))
+
+    assert [c["chunk_id"] for c in context] == ["c"]
+    assert elapsed < LLM_LATENCY + 0.5
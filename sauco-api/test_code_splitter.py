@@ -0,0 +1,141 @@
+import asyncio
+import re
+from types import SimpleNamespace
+
+from fake_llm import FakeLLM
+from src.service.code_splitter import split_module
+from src.service.improvement_service import ImprovementService
+
+LLM_LATENCY = 0.05
+
+module_code = '''"""Small math module."""
+import os
+
+SCALE = 10
+
+
+@cache
+def double(x):
+    return x * 2
+def triple(x):
+    return x * 3
+
+
+class Counter:
+    def __init__(self):
+        self.n = 0
+
+
+def square(x):
+    return x * x
+
+
+def execute(x, verbose=False):
+    return double(x) + triple(x) + square(x)
+
+
+if __name__ == "__main__":
+    print(execute(2))
+'''
+
+
+def test_split_keeps_segments_and_reassembles_verbatim():
+    split = split_module(module_code)
+
+    assert [u.name for u in split.units] == ["double", "triple", "Counter", "square", "execute"]
+    assert [u.name for u in split.improvable_units] == ["double", "triple", "Counter", "square"]
+    assert split.units[0].source.startswith("@cache\ndef double")
+    assert split.reassemble({}) == module_code
+    assert split_module("function f() { return 1; }") is None
+
+    outline = split.outline(exclude="square")
+    assert "SCALE = 10" in outline and "def execute(x, verbose=False):\n    ..." in outline
+    assert "x * x" not in outline and "return double(x)" not in outline
+
+
+def test_reassemble_hoists_imports_and_rejects_interface_changes():
+    split = split_module(module_code)
+
+    code = split.reassemble({
+        "square": "import math\nimport os\n\ndef square(x):\n    return math.pow(x, 2)",
+        "triple": "def triple(x, factor=3):\n    return x * factor",  # parameters changed
+        "double": "def double(x):\n    return x + x",  # decorator dropped
+        "Counter": "class Counter(:",  # does not parse
+    })
+
+    assert code.startswith('"""Small math module."""\nimport os\nimport math\n\nSCALE = 10')
+    assert code.count("import os") == 1
+    assert "def square(x):\n    return math.pow(x, 2)\n" in code
+    assert "@cache\ndef double(x):\n    return x * 2" in code
+    assert "def triple(x):\n    return x * 3" in code
+    assert "def execute(x, verbose=False):\n    return double(x) + triple(x) + square(x)" in code
+    compile(code, "<reassembled>", "exec")
+
+
+
+def test_reassemble_keeps_the_original_unit_when_its_helpers_clash():
+    split = split_module(module_code)
+
+    code = split.reassemble({
+        "double": "@cache\ndef double(x):\n    return _h(x)\n\ndef _h(x):\n    return x * 2",
+        "triple": "def _h(x):\n    return x * 3\n\ndef triple(x):\n    return _h(x)",  # same helper name
+        "square": "SCALE = 2\n\ndef square(x):\n    return x * x",  # rebinds a module global
+    })
+
+    assert code.count("def _h(") == 1
+    assert "def _h(x):\n    return x * 2" in code
+    assert "def triple(x):\n    return x * 3" in code
+    assert "SCALE = 2" not in code
+    namespace = {"cache": lambda f: f}
+    exec(compile(code.replace('if __name__ == "__main__"', "if False"), "<reassembled>", "exec"), namespace)
+    assert namespace["double"](5) == 10 and namespace["triple"](5) == 15
+
+def _unit_name(prompt):
+    return re.search(r"top-level \w+ `(\w+)`", prompt).group(1)
+
+
+def _improved_unit(prompt):
+    name = _unit_name(prompt)
+    if name == "Counter":
+        return 'class Counter:\n    """Counts."""\n\n    def __init__(self):\n        self.n = 0'
+    original = next(u.source for u in split_module(module_code).units if u.name == name)
+    return "import math\n\n" + original.replace("):\n", '):\n    """Improved."""\n', 1)
+
+
+async def _run_split(service):
+    return [(event, data) async for event, data in service.stream_workflow(module_code, stream_code=False)]
+
+
+def test_split_mode_improves_units_concurrently_and_keeps_execute():
+    described = []
+
+    def describe(prompt):
+        described.append(_unit_name(prompt))
+        return f"## Purpose\n{described[-1]} helper."
+
+    llm = FakeLLM(delay=LLM_LATENCY, describe=describe, refactor=_improved_unit,
+                  recommendations=lambda prompt: f"- Document {_unit_name(prompt)}")
+    service = ImprovementService("test-model", None, None, None, llm_client=llm,
+                                 split_mode="units", split_concurrency=2)
+
+    events = asyncio.run(_run_split(service))
+    data = dict(events)
+    code = data["code"]
+
+    assert sorted(described) == ["Counter", "double", "square", "triple"]
+    assert llm.max_active == 2
+    assert [name for name, _ in events].count("unit") == 4
+    assert data["recommendations"].startswith("## double\n- Document double")
+    assert code.count("import math") == 1 and code.startswith('"""Small math module."""\nimport os\nimport math\n')
+    assert code.count('"""Improved."""') == 3 and '"""Counts."""' in code
+    assert "def execute(x, verbose=False):\n    return double(x) + triple(x) + square(x)" in code
+    assert data["metrics_after"]["method_number"] == data["metrics_before"]["method_number"]
+    compile(code, "<split>", "exec")
+
+
+def test_auto_split_leaves_small_files_whole():
+    service = ImprovementService("test-model", None, None, None, llm_client=SimpleNamespace(),
+                                 split_mode="auto", split_min_tokens=10_000)
+    assert service._split_for(module_code, "auto") is None
+    assert service._split_for(module_code, "units") is not None
+    assert service._split_for("def execute():\n    return 1\n", "units") is None
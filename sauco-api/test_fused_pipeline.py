@@ -0,0 +1,100 @@
+import asyncio
+import json
+from collections import Counter
+
+import httpx
+
+import api
+from fake_llm import FakeLLM
+from src.service.cache_service import ResponseCache
+from src.service.improvement_service import ImprovementService
+
+sample_code = """
+def area(w, h):
+    return w * h
+"""
+
+improved_code = '''def area(w, h):
+    """Rectangle area."""
+    return w * h'''
+
+
+fused_answer = json.dumps(
+    {"recommendations": ["Add a docstring", "- Use descriptive names"], "code": f"```python\n{improved_code}\n```"}
+)
+
+
+def _fake_llm(fused=fused_answer):
+    return FakeLLM(describe="## Purpose\nComputes an area.", refactor=improved_code, fused=fused)
+
+
+def _service(llm, **kwargs):
+    return ImprovementService("test-model", None, None, None, llm_client=llm, **kwargs)
+
+
+async def _events(service, **kwargs):
+    return [(event, data) async for event, data in service.stream_workflow(sample_code, **kwargs)]
+
+
+def test_fused_mode_uses_one_call_for_recommendations_and_code():
+    llm = _fake_llm()
+    service = _service(llm, pipeline_mode="fused")
+
+    events = asyncio.run(_events(service))
+    data = dict(events)
+
+    assert llm.calls == Counter({"describe": 1, "fused": 1})
+    assert sample_code.strip() in llm.prompts["fused"]
+    assert data["recommendations"] == "- Add a docstring\n- Use descriptive names"
+    assert data["code"] == improved_code
+    assert [e for e, _ in events if e == "code_delta"] == ["code_delta"]
+    assert data["metrics_after"]["method_number"] == 1
+
+    # Memoized as a whole: a second run makes no LLM call
+    asyncio.run(_events(service))
+    assert llm.calls == Counter({"describe": 1, "fused": 1})
+
+
+def test_request_mode_overrides_the_service_default():
+    llm = _fake_llm()
+    service = _service(llm)
+
+    asyncio.run(_events(service, pipeline_mode="fused"))
+    asyncio.run(_events(service, stream_code=False))
+
+    assert llm.calls == Counter({"describe": 1, "fused": 1, "recommendations": 1, "refactor": 1})
+
+
+def test_malformed_fused_answer_falls_back_to_staged_calls():
+    llm = _fake_llm(fused="Sure! Here is the code: def area(w, h): ...")
+    service = _service(llm, pipeline_mode="fused")
+
+    data = dict(asyncio.run(_events(service, stream_code=False)))
+
+    assert llm.calls == Counter({"describe": 1, "fused": 1, "recommendations": 1, "refactor": 1})
+    assert data["code"] == improved_code
+
+
+async def _post_both_modes():
+    # Own service: the shared one keeps stage-cache counters other tests assert on
+    api._service = _service(_fake_llm())
+    api._cache = ResponseCache(memory_size=8)
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        staged = await client.post("/improve", json={"Code": sample_code, "PipelineMode": "staged"})
+        fused = await client.post("/improve", json={"Code": sample_code, "PipelineMode": "fused"})
+        invalid = await client.post("/improve", json={"Code": sample_code, "PipelineMode": "parallel"})
+    return staged.json(), fused.json(), invalid
+
+
+def test_pipeline_mode_is_part_of_the_response_cache_key():
+    shared_service = api._service
+    try:
+        staged, fused, invalid = asyncio.run(_post_both_modes())
+    finally:
+        api._service = shared_service
+
+    assert staged["cache"]["status"] == "miss" and fused["cache"]["status"] == "miss"
+    assert staged["cache"]["key"] != fused["cache"]["key"]
+    assert fused["Code"] == improved_code
+    assert invalid.status_code == 422
@@ -0,0 +1,67 @@
+import asyncio
+import time
+
+import httpx
+
+import api
+from fake_llm import FakeLLM
+
+# Simulated OpenAI latency per chat completion
+LLM_LATENCY = 0.2
+CONCURRENT_REQUESTS = 10
+
+sample_code = """
+def fibonacci(n):
+    if n <= 0:
+        return []
+    fib = [0, 1]
+    for i in range(2, n):
+        fib.append(fib[i-1] + fib[i-2])
+    return fib[:n]
+"""
+
+
+async def _post_improve(client, request_id):
+    # A distinct statement per request keeps the response and stage caches out of the measurement
+    code = f"REQUEST_ID = {request_id!r}\n{sample_code}"
+    response = await client.post("/improve", json={"Code": code})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+async def _run_load():
+    # Sleeps like a real network call
+    api._service.client = FakeLLM(
+        delay=LLM_LATENCY, refactor=sample_code,
+        describe="## Purpose\nComputes fibonacci numbers.\n\n## Public API\nfibonacci(n)",
+    )
+    api._service.qdrant = None  # retrieval is not under test here
+
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        start = time.perf_counter()
+        await _post_improve(client, "single")
+        single = time.perf_counter() - start
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*[_post_improve(client, i) for i in range(CONCURRENT_REQUESTS)])
+        burst = time.perf_counter() - start
+
+    return single, burst, results
+
+
+def test_concurrent_improve_does_not_block_event_loop():
+    single, burst, results = asyncio.run(_run_load())
+
+    print(f"1 request: {single:.2f}s - {CONCURRENT_REQUESTS} concurrent requests: {burst:.2f}s")
+
+    assert len(results) == CONCURRENT_REQUESTS
+    assert all(r["Code"].strip() == sample_code.strip() for r in results)
+    assert api._service.stage_cache_stats()["describe"]["hits"] == 0
+    assert all(r["cache"]["status"] == "miss" for r in results)
+    # Blocking stages would take CONCURRENT_REQUESTS * single; async stages overlap
+    assert burst < single * 2
+
+
+if __name__ == "__main__":
+    test_concurrent_improve_does_not_block_event_loop()
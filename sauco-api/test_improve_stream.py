@@ -0,0 +1,88 @@
+import asyncio
+import json
+import time
+
+import httpx
+
+import api
+from fake_llm import FakeLLM
+from src.service.improvement_service import ImprovementService
+
+LLM_LATENCY = 0.2
+
+sample_code = """
+def factorial(n):
+    result = 1
+    for i in range(2, n + 1):
+        result *= i
+    return result
+"""
+
+improved_code = '''def factorial(n):
+    """Return n!."""
+    result = 1
+    for i in range(2, n + 1):
+        result *= i
+    return result
+'''
+
+
+def _fake_llm():
+    return FakeLLM(delay=LLM_LATENCY, refactor=improved_code,
+                   describe="## Purpose\nComputes n!.\n\n## Loops\nOne for loop.")
+
+
+def _parse_sse(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+async def _collect_service_events():
+    service = ImprovementService("test-model", None, None, None, llm_client=_fake_llm())
+    start = time.perf_counter()
+    events = []
+    async for event, data in service.stream_workflow(sample_code):
+        events.append((event, data, time.perf_counter() - start))
+    return events
+
+
+def test_stream_workflow_emits_metrics_before_any_llm_call():
+    events = asyncio.run(_collect_service_events())
+    names = [name for name, _, _ in events]
+
+    assert names[0] == "metrics_before"
+    assert names[1:4] == ["analysis", "context", "recommendations"]
+    assert names[-2:] == ["code", "metrics_after"]
+    assert set(names[4:-2]) == {"code_delta"}
+
+    # First useful byte only costs the metrics calculation, not an LLM round-trip
+    assert events[0][2] < LLM_LATENCY / 2
+    assert events[0][1]["number_of_loops"] == 1
+
+    deltas = "".join(data for name, data, _ in events if name == "code_delta")
+    code = next(data for name, data, _ in events if name == "code")
+    assert deltas.startswith("```python")
+    assert code == improved_code.strip()
+
+
+async def _post_stream():
+    api._service.client = _fake_llm()
+    api._service.qdrant = None
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.post("/improve/stream", json={"Code": sample_code})
+
+
+def test_improve_stream_endpoint_sends_sse_events():
+    response = asyncio.run(_post_stream())
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = _parse_sse(response.text)
+    assert events[0][0] == "metrics_before"
+    assert events[-1][0] == "metrics_after"
+    assert events[-1][1]["method_number"] == 1
+    assert dict(events)["code"] == improved_code.strip()
@@ -0,0 +1,278 @@
+import asyncio
+import sqlite3
+import time
+
+import httpx
+
+import api
+from fake_llm import FakeLLM
+from src.service.cache_service import ResponseCache
+from src.service.job_queue import JobQueue, JobWorkerPool, SqliteJobQueue, create_job_queue
+
+sample_code = "def square(x):\n    return x * x\n"
+
+
+def test_claim_hands_each_job_to_one_worker(tmp_path):
+    queue = SqliteJobQueue(str(tmp_path / "jobs.sqlite3"))
+    first = queue.enqueue({"Code": "a"})
+    second = queue.enqueue({"Code": "b"})
+
+    claimed = queue.claim("w1")
+    assert claimed["id"] == first["id"] and claimed["status"] == "running"
+    assert queue.claim("w2")["id"] == second["id"]
+    assert queue.claim("w3") is None
+
+    assert queue.complete(first["id"], {"Code": "A"})
+    assert queue.get(first["id"])["result"] == {"Code": "A"}
+    assert queue.get(first["id"])["status"] == "succeeded"
+
+
+def test_cancelled_job_is_not_claimed_and_late_result_is_dropped(tmp_path):
+    queue = SqliteJobQueue(str(tmp_path / "jobs.sqlite3"))
+    queued = queue.enqueue({"Code": "a"})
+    assert queue.cancel(queued["id"])["status"] == "cancelled"
+    assert queue.claim("w1") is None
+
+    running = queue.enqueue({"Code": "b"})
+    queue.claim("w1")
+    queue.cancel(running["id"])
+    assert not queue.complete(running["id"], {"Code": "B"})
+    assert queue.get(running["id"])["result"] is None
+
+
+def test_expired_lease_goes_back_to_the_queue(tmp_path):
+    queue = SqliteJobQueue(str(tmp_path / "jobs.sqlite3"), lease_seconds=-1, max_attempts=2)
+    job = queue.enqueue({"Code": "a"})
+
+    assert queue.claim("crashed-worker")["attempts"] == 1
+    assert queue.claim("w2")["attempts"] == 2
+    # Out of attempts: the next claim fails the job instead of retrying forever
+    assert queue.claim("w3") is None
+    assert queue.get(job["id"])["status"] == "failed"
+
+
+def test_heartbeat_keeps_a_long_job_from_being_claimed_twice(tmp_path):
+    queue = SqliteJobQueue(str(tmp_path / "jobs.sqlite3"), lease_seconds=0.2)
+    job = queue.enqueue({"Code": "a"})
+    queue.claim("w1")
+
+    time.sleep(0.3)
+    assert queue.heartbeat(job["id"], "w1")
+    assert queue.claim("w2") is None
+    assert not queue.heartbeat(job["id"], "w2")
+
+
+def test_worker_that_lost_its_lease_cannot_finish_the_job(tmp_path):
+    queue = SqliteJobQueue(str(tmp_path / "jobs.sqlite3"), lease_seconds=-1)
+    job = queue.enqueue({"Code": "a"})
+    queue.claim("stale-worker")
+    queue.claim("w2")
+
+    assert not queue.heartbeat(job["id"], "stale-worker")
+    assert not queue.complete(job["id"], {"Code": "stale"}, "stale-worker")
+    assert not queue.requeue(job["id"], "stale-worker")
+    assert queue.complete(job["id"], {"Code": "A"}, "w2")
+    assert queue.get(job["id"])["result"] == {"Code": "A"}
+
+
+def test_pool_renews_the_lease_of_a_running_job(tmp_path):
+    queue = SqliteJobQueue(str(tmp_path / "jobs.sqlite3"), lease_seconds=0.2)
+
+    async def scenario():
+        async def slow_handler(payload):
+            await asyncio.sleep(0.6)
+            return {"Code": "done"}
+
+        pool = JobWorkerPool(queue, slow_handler, concurrency=1, poll_interval=0.02, heartbeat_interval=0.05)
+        job = queue.enqueue({"Code": "a"})
+        pool.start()
+        await asyncio.sleep(0.4)
+        stolen = await asyncio.to_thread(queue.claim, "w2")
+        for _ in range(100):
+            if queue.status(job["id"]) == "succeeded":
+                break
+            await asyncio.sleep(0.02)
+        await pool.stop()
+        return stolen, queue.get(job["id"])
+
+    stolen, job = asyncio.run(scenario())
+    assert stolen is None
+    assert job["status"] == "succeeded" and job["attempts"] == 1
+
+
+
+class ProviderDown(Exception):
+    pass
+
+
+def _run_with_failures(queue, failures, **pool_args):
+    """Runs one job whose handler raises ProviderDown `failures` times, then succeeds."""
+    calls = []
+
+    async def flaky_handler(payload):
+        calls.append(1)
+        if len(calls) <= failures:
+            raise ProviderDown("circuit open")
+        return {"Code": "done"}
+
+    async def scenario():
+        pool = JobWorkerPool(queue, flaky_handler, concurrency=1, poll_interval=0.01,
+                             retry_on=(ProviderDown,), **pool_args)
+        job = queue.enqueue({"Code": "a"})
+        pool.start()
+        for _ in range(200):
+            if queue.status(job["id"]) in ("succeeded", "failed"):
+                break
+            await asyncio.sleep(0.01)
+        await pool.stop()
+        return queue.get(job["id"])
+
+    return asyncio.run(scenario()), len(calls)
+
+
+def test_transient_errors_are_retried_with_backoff(tmp_path):
+    queue = SqliteJobQueue(str(tmp_path / "jobs.sqlite3"), max_attempts=3)
+
+    job, calls = _run_with_failures(queue, failures=2, retry_backoff=0.02)
+
+    assert job["status"] == "succeeded" and job["attempts"] == 3 and calls == 3
+
+
+def test_transient_errors_fail_the_job_after_max_attempts(tmp_path):
+    queue = SqliteJobQueue(str(tmp_path / "jobs.sqlite3"), max_attempts=2)
+
+    job, calls = _run_with_failures(queue, failures=5, retry_backoff=0.02)
+
+    assert job["status"] == "failed" and job["error"] == "circuit open" and calls == 2
+
+
+def test_requeued_job_waits_for_its_delay(tmp_path):
+    queue = SqliteJobQueue(str(tmp_path / "jobs.sqlite3"))
+    job = queue.enqueue({"Code": "a"})
+    queue.claim("w1")
+
+    assert queue.requeue(job["id"], "w1", delay=60)
+    assert queue.status(job["id"]) == "queued"
+    assert queue.claim("w2") is None
+
+
+def test_worker_survives_a_failing_claim(tmp_path):
+    queue = SqliteJobQueue(str(tmp_path / "jobs.sqlite3"))
+    claim, failures = queue.claim, []
+
+    def locked_once(worker_id):
+        if not failures:
+            failures.append(1)
+            raise sqlite3.OperationalError("database is locked")
+        return claim(worker_id)
+
+    queue.claim = locked_once
+
+    async def scenario():
+        async def handler(payload):
+            return {"Code": "done"}
+
+        pool = JobWorkerPool(queue, handler, concurrency=1, poll_interval=0.01)
+        job = queue.enqueue({"Code": "a"})
+        pool.start()
+        for _ in range(100):
+            if queue.status(job["id"]) == "succeeded":
+                break
+            await asyncio.sleep(0.01)
+        await pool.stop()
+        return queue.status(job["id"])
+
+    assert asyncio.run(scenario()) == "succeeded" and failures == [1]
+
+
+def test_queue_files_without_run_after_are_migrated(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            "CREATE TABLE jobs (id TEXT PRIMARY KEY, status TEXT NOT NULL, payload TEXT NOT NULL, result TEXT, "
+            "error TEXT, attempts INTEGER NOT NULL DEFAULT 0, worker_id TEXT, lease_until REAL, "
+            "created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+        )
+    conn.close()
+
+    queue = SqliteJobQueue(path)
+    job = queue.enqueue({"Code": "a"})
+    assert queue.claim("w1")["id"] == job["id"]
+
+def test_create_job_queue_parses_sqlite_urls(tmp_path):
+    queue = create_job_queue(f"sqlite:///{tmp_path}/jobs.sqlite3")
+    assert queue.path == f"{tmp_path}/jobs.sqlite3"
+
+
+def test_pool_cancels_running_handler(tmp_path):
+    queue = SqliteJobQueue(str(tmp_path / "jobs.sqlite3"))
+
+    async def scenario():
+        handler_started = asyncio.Event()
+
+        async def slow_handler(payload):
+            handler_started.set()
+            await asyncio.sleep(10)
+            return {}
+
+        pool = JobWorkerPool(queue, slow_handler, concurrency=1, poll_interval=0.02)
+        job = queue.enqueue({"Code": "a"})
+        pool.start()
+        await asyncio.wait_for(handler_started.wait(), 2)
+        queue.cancel(job["id"])
+        await asyncio.sleep(0.1)
+        await pool.stop()
+        return queue.get(job["id"])
+
+    job = asyncio.run(scenario())
+    assert job["status"] == "cancelled"
+
+
+async def _submit_and_wait(tmp_path):
+    api._service.client = FakeLLM(delay=0.01, describe="## Purpose\nSquares x.", refactor=sample_code)
+    api._service.qdrant = None
+    api._cache = ResponseCache(memory_size=8)
+    api._jobs = SqliteJobQueue(str(tmp_path / "jobs.sqlite3"))
+
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        created = await client.post("/jobs", json={"Code": sample_code})
+        job_id = created.json()["id"]
+        queued = (await client.get(f"/jobs/{job_id}")).json()
+
+        pool = JobWorkerPool(api._jobs, api._run_improve_job, concurrency=2, poll_interval=0.02)
+        pool.start()
+        for _ in range(100):
+            done = (await client.get(f"/jobs/{job_id}")).json()
+            if done["status"] == "succeeded":
+                break
+            await asyncio.sleep(0.02)
+        await pool.stop()
+
+        missing = await client.get("/jobs/unknown")
+        conflict = await client.delete(f"/jobs/{job_id}")
+    return created, queued, done, missing, conflict
+
+
+def test_job_endpoints_enqueue_and_return_result(tmp_path):
+    created, queued, done, missing, conflict = asyncio.run(_submit_and_wait(tmp_path))
+
+    assert created.status_code == 202
+    assert queued["status"] == "queued"
+    assert done["status"] == "succeeded"
+    assert done["result"]["Code"] == sample_code.strip()
+    assert done["result"]["metrics"]["before"]["method_number"] == 1
+    assert missing.status_code == 404
+    assert conflict.status_code == 409
+
+
+def test_incomplete_backend_fails_at_instantiation():
+    class HalfQueue(JobQueue):
+        def enqueue(self, payload):
+            return {}
+
+    try:
+        HalfQueue()
+        assert False, "expected TypeError"
+    except TypeError as e:
+        assert "claim" in str(e)
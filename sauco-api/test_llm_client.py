@@ -0,0 +1,232 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import httpx
+import openai
+from openai import AsyncOpenAI
+
+import api
+from src.service.cache_service import ResponseCache
+from src.service.improvement_service import ImprovementService
+from src.service.llm_client import (
+    AdaptiveConcurrencyLimiter, CircuitBreaker, CircuitOpenError, LLMUnavailableError, ResilientLLMClient,
+    create_llm_client
+)
+from src.service.telemetry import LLM_RETRIES
+
+
+def _completion(content="ok"):
+    return {
+        "id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": "test-model",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": 3, "completion_tokens": 1, "total_tokens": 4},
+    }
+
+
+class FlakyProvider:
+    """Local OpenAI-compatible endpoint that answers with a scripted list of failures first."""
+
+    def __init__(self, failures=(), latency=0.0, rate_limit_above=None):
+        self.failures = list(failures)
+        self.latency = latency
+        self.rate_limit_above = rate_limit_above
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            if self.rate_limit_above is not None and self.in_flight > self.rate_limit_above:
+                return httpx.Response(429, json={"error": {"message": "slow down"}})
+            if self.failures:
+                failure = self.failures.pop(0)
+                if failure == "timeout":
+                    raise httpx.ReadTimeout("provider timed out", request=request)
+                return httpx.Response(failure, json={"error": {"message": f"status {failure}"}},
+                                      headers={"retry-after": "0"})
+            return httpx.Response(200, json=_completion())
+        finally:
+            self.in_flight -= 1
+
+
+def _client(provider, **kwargs):
+    inner = AsyncOpenAI(
+        api_key="test-key", base_url="http://provider.test/v1", max_retries=0,
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(provider)),
+    )
+    kwargs.setdefault("backoff_base", 0.001)
+    return ResilientLLMClient(inner, **kwargs)
+
+
+async def _ask(client):
+    response = await client.chat.completions.create(model="test-model", messages=[{"role": "user", "content": "hi"}])
+    return response.choices[0].message.content
+
+
+def test_retryable_failures_are_retried_until_success():
+    provider = FlakyProvider(failures=[429, 500, "timeout", 503])
+    client = _client(provider)
+    before = LLM_RETRIES.value(("timeout",))
+
+    assert asyncio.run(_ask(client)) == "ok"
+    assert provider.calls == 5
+    assert LLM_RETRIES.value(("timeout",)) == before + 1
+    assert client.breaker.state == "closed"
+    assert client.limiter.in_flight == 0
+
+
+def test_client_errors_are_not_retried():
+    provider = FlakyProvider(failures=[400])
+    client = _client(provider)
+
+    try:
+        asyncio.run(_ask(client))
+        assert False, "expected BadRequestError"
+    except openai.BadRequestError:
+        pass
+    assert provider.calls == 1
+
+
+def test_exhausted_retries_raise_llm_unavailable():
+    provider = FlakyProvider(failures=[500] * 3)
+    client = _client(provider, max_retries=2, breaker=CircuitBreaker(failure_threshold=10))
+
+    try:
+        asyncio.run(_ask(client))
+        assert False, "expected LLMUnavailableError"
+    except LLMUnavailableError as e:
+        assert isinstance(e.__cause__, openai.InternalServerError)
+    assert provider.calls == 3
+
+
+def test_circuit_opens_fails_fast_and_recovers_half_open():
+    provider = FlakyProvider(failures=[503] * 3)
+    client = _client(provider, max_retries=5, breaker=CircuitBreaker(failure_threshold=3, reset_timeout=0.2))
+
+    async def scenario():
+        try:
+            await _ask(client)
+            assert False, "expected the circuit to open"
+        except CircuitOpenError as e:
+            assert e.retry_after > 0
+        calls_when_open = provider.calls
+        # Fails fast: the provider is not called while the circuit is open
+        try:
+            await _ask(client)
+            assert False, "expected CircuitOpenError"
+        except CircuitOpenError:
+            pass
+        assert provider.calls == calls_when_open == 3
+        await asyncio.sleep(0.25)
+        # Half-open probe succeeds and closes the circuit
+        assert await _ask(client) == "ok"
+        assert client.breaker.state == "closed"
+
+    asyncio.run(scenario())
+
+
+def test_half_open_probe_failure_reopens_the_circuit():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+    assert breaker.state == "open"
+    breaker.before_call()
+    assert breaker.state == "half_open"
+    try:
+        breaker.before_call()
+        assert False, "only one probe may be in flight"
+    except CircuitOpenError:
+        pass
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+
+def test_adaptive_limit_caps_concurrency_and_backs_off_on_429():
+    provider = FlakyProvider(latency=0.01, rate_limit_above=3)
+    limiter = AdaptiveConcurrencyLimiter(initial=8, max_limit=8, decrease_interval=0.0)
+    client = _client(provider, limiter=limiter, max_retries=20)
+
+    async def burst():
+        return await asyncio.gather(*(_ask(client) for _ in range(24)))
+
+    assert asyncio.run(burst()) == ["ok"] * 24
+    assert provider.max_in_flight <= 8
+    assert limiter.limit < 8
+    assert limiter.in_flight == 0
+
+
+def test_additive_increase_is_bounded():
+    limiter = AdaptiveConcurrencyLimiter(initial=2, max_limit=3)
+
+    async def run():
+        for _ in range(50):
+            await limiter.acquire()
+            limiter.release()
+
+    asyncio.run(run())
+    assert limiter.limit == 3
+    limiter.in_flight = 1
+    limiter.release(overloaded=True)
+    assert limiter.limit == 1.5
+
+
+
+def test_concurrency_limit_never_exceeds_the_connection_pool():
+    client = create_llm_client(
+        max_connections=4, limiter=AdaptiveConcurrencyLimiter(initial=8, max_limit=32)
+    )
+
+    assert client.limiter.max_limit == client.limiter.limit == 4
+    assert create_llm_client(max_connections=20).limiter.max_limit == 20
+
+def test_stream_holds_its_slot_until_consumed():
+    class StreamingCompletions:
+        async def create(self, **kwargs):
+            async def chunks():
+                for piece in ("a", "b"):
+                    yield piece
+            return chunks()
+
+    limiter = AdaptiveConcurrencyLimiter(initial=1)
+    client = ResilientLLMClient(SimpleNamespace(chat=SimpleNamespace(completions=StreamingCompletions())),
+                                limiter=limiter)
+
+    async def run():
+        stream = await client.chat.completions.create(model="m", messages=[], stream=True)
+        assert limiter.in_flight == 1
+        pieces = [piece async for piece in stream]
+        return pieces
+
+    assert asyncio.run(run()) == ["a", "b"]
+    assert limiter.in_flight == 0
+
+
+async def _post_improve():
+    api._service = ImprovementService(
+        "test-model", None, None, None,
+        llm_client=_client(FlakyProvider(failures=[503] * 10), max_retries=1,
+                           breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60)),
+    )
+    api._cache = ResponseCache(memory_size=8)
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        exhausted = await client.post("/improve", json={"Code": "def f():\n    return 1\n"})
+        rejected = await client.post("/improve", json={"Code": "def g():\n    return 2\n"})
+    return exhausted, rejected
+
+
+def test_improve_returns_503_when_the_provider_is_unavailable():
+    shared_service = api._service
+    try:
+        exhausted, rejected = asyncio.run(_post_improve())
+    finally:
+        api._service = shared_service
+
+    assert exhausted.status_code == 503
+    assert rejected.status_code == 503
+    assert "circuit" in json.loads(rejected.text)["detail"]
+    assert int(rejected.headers["retry-after"]) >= 1
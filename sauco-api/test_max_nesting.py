@@ -59,7 +59,7 @@ test_cases = [
     ("Triple nested if (expected nesting: 3)", test_code_2),
     ("Complex nesting (expected nesting: 5)", test_code_3),
     ("Class with methods (expected nesting: 3)", test_code_4),
-    ("JavaScript code (expected nesting via indentation)", test_code_5)
+    ("JavaScript code (expected nesting: 4)", test_code_5)
 ]
 
 print("Testing max_nesting calculation:")
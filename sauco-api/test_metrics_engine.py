@@ -0,0 +1,280 @@
+import asyncio
+import glob
+import os
+
+from src.service.metrics_service import (
+    _token_metrics,
+    calculate_average_method_size,
+    calculate_cyclomatic_complexity,
+    calculate_max_nesting,
+    calculate_metrics,
+    count_ifs,
+    count_loops,
+    count_methods,
+)
+from fake_llm import FakeLLM
+from test_stage_memo import sample_code
+from src.service.improvement_service import ImprovementService
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SNIPPETS = [
+    "",
+    "x = 1\n",
+    # elif/else chains count as nested blocks; boolean operators in conditions
+    "def f(a, b):\n    if a and b or a:\n        return 1\n    elif b:\n        return 2\n    else:\n        return 3\n",
+    # Decision points the complexity visitor does not reach: for target/iterable, decorators, defaults
+    "@decorate(a or b)\ndef f(x=a and b):\n    for i in (y for y in x if y and i or y):\n        pass\n",
+    "async def f(items):\n    async for item in items:\n        async with lock as l:\n            await item\n",
+    "class A(Base if a or b else Other):\n    def m(self):\n        while self.a and self.b:\n            try:\n                pass\n"
+    "            except (ValueError, TypeError):\n                pass\n            except Exception:\n                pass\n"
+    "            else:\n                pass\n            finally:\n                pass\n",
+    "try:\n    pass\nexcept* ValueError:\n    if x:\n        pass\n",
+    "match command:\n    case [x] if x and y:\n        for a in b:\n            pass\n    case _:\n        pass\n",
+    "f = lambda a, b: a and b or (lambda: c or d)()\nxs = [i for i in range(3) if i and i % 2]\n",
+    "def outer():\n    def inner():\n        def innermost():\n            return x or y\n        return innermost\n    return inner\n",
+    "for i in range(3):\n    pass\nelse:\n    while x:\n        pass\n    else:\n        pass\n",
+    # Not Python: regex and indentation fallbacks
+    "function add(a, b) {\n  if (a > b && b > 0) {\n    for (let i = 0; i < a; i++) { total += i; }\n  }\n  return a + b;\n}\n",
+    "public int Sum(int[] xs) {\n    int s = 0;\n    foreach (var x in xs) { if (x > 0 || x < -5) s += x; }\n    return s;\n}\n",
+]
+
+
+def metrics_one_by_one(code):
+    """calculate_metrics as it was computed before: each metric parses the code on its own."""
+    return {
+        "method_number": count_methods(code)["count"],
+        "number_of_ifs": count_ifs(code),
+        "number_of_loops": count_loops(code),
+        "cyclomatic_complexity": calculate_cyclomatic_complexity(code)["total"],
+        "average_method_size": calculate_average_method_size(code),
+        "max_nesting": calculate_max_nesting(code),
+    }
+
+
+def aggregates(metrics):
+    return {key: value for key, value in metrics.items() if key != "functions"}
+
+
+def test_single_pass_matches_the_individual_metrics_on_edge_cases():
+    for code in SNIPPETS:
+        assert aggregates(calculate_metrics(code)) == metrics_one_by_one(code), code
+
+
+def test_single_pass_matches_the_individual_metrics_on_real_modules():
+    paths = glob.glob(os.path.join(HERE, "src", "**", "*.py"), recursive=True)
+    paths += glob.glob(os.path.join(HERE, "..", "evals", "src", "**", "*.py"), recursive=True)
+    assert paths
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            code = f.read()
+        assert aggregates(calculate_metrics(code)) == metrics_one_by_one(code), path
+        # The per-function breakdown agrees with what the individual metrics collect per function
+        functions = calculate_metrics(code)["functions"]
+        assert sorted((f["name"], f["start_line"], f["cyclomatic_complexity"]) for f in functions) == sorted(
+            (f["name"], f["lineno"], f["complexity"]) for f in calculate_cyclomatic_complexity(code)["functions"]
+        ), path
+        assert sorted((f["name"], f["start_line"], f["end_line"], f["line_count"]) for f in functions) == sorted(
+            (m["name"], m["start_line"], m["end_line"], m["line_count"]) for m in count_methods(code)["methods"]
+        ), path
+
+
+def test_deep_trees_are_walked_without_recursion():
+    # Parses fine, but is far deeper than a recursive visitor can go
+    code = "def f(a, b):\n    return " + " + ".join(["(a and b)"] * 700) + "\n"
+
+    metrics = calculate_metrics(code)
+
+    assert metrics["cyclomatic_complexity"] == 701
+    assert metrics["method_number"] == 1
+    assert "partial" not in metrics
+
+
+def test_code_without_a_syntax_tree_gets_partial_metrics():
+    body = " + ".join(["a"] * 100000)  # too deep for ast.parse: RecursionError
+    code = (
+        "def f(a):\n    if a and a:\n        return " + body + "\n"
+        "\nasync def g(items):\n    async for x in items:\n        while x:\n            x -= 1\n"
+    )
+
+    metrics = calculate_metrics(code)
+
+    assert metrics == {
+        "method_number": 2,
+        "number_of_ifs": 1,
+        "number_of_loops": 1,
+        "cyclomatic_complexity": 5,
+        "average_method_size": 3.5,
+        "max_nesting": 3,
+        "functions": [],
+        "partial": True,
+    }
+
+
+def test_token_scan_agrees_with_the_tree_on_ordinary_code():
+    code = SNIPPETS[2] + SNIPPETS[5] + SNIPPETS[9] + SNIPPETS[10]
+
+    expected = calculate_metrics(code)
+    scanned = _token_metrics(code)
+
+    for key in ("method_number", "number_of_ifs", "number_of_loops", "cyclomatic_complexity", "average_method_size"):
+        assert scanned[key] == expected[key], key
+
+
+JAVASCRIPT = """
+// if (commented out) { for }
+function add(a, b) {
+  if (a > b && b > 0) {
+    for (let i = 0; i < a; i++) { total += i; }
+  } else if (a) {
+    return "if (x) while (y)";
+  }
+  return a + b;
+}
+const double = (x) => x * 2;
+const handler = async (req) => {
+  const options = { retry: { times: 1 }, codes: [1, 2] };
+  items.forEach(item => console.log(`${item} for`));
+  do { n--; } while (n > 0 || pending);
+};
+"""
+
+JAVA = """
+public class Accounts {
+    @Override
+    public int sum(int[] xs) throws IOException {
+        int s = 0;
+        for (int x : xs) { if (x > 0 || x < -5) s += x; }
+        try { s++; } catch (Exception e) { s--; }
+        switch (s) { case 1: s = 2; break; default: break; }
+        return s;
+    }
+    Accounts() { this(1); }
+    abstract void noBody(int a);
+}
+"""
+
+CSHARP = """
+#if DEBUG
+namespace App {
+    public class Totals {
+        public string Name { get; set; }
+        public int Sum(int[] xs) {
+            var s = @"if (""quoted"")";
+            foreach (var x in xs) { if (x > 0) s += x; }
+            var label = s switch { 1 => "one", _ => "many" };
+            return xs.Where(x => x > 0).Count();
+        }
+    }
+}
+"""
+
+
+def test_code_that_is_not_python_is_measured_in_one_scan():
+    # Strings, template literals and comments are skipped; else-if and do-while count once
+    assert calculate_metrics(JAVASCRIPT) == {
+        "method_number": 4,  # add, double, handler and the forEach callback
+        "number_of_ifs": 2,
+        "number_of_loops": 3,  # for, forEach, do-while
+        "cyclomatic_complexity": 7,
+        "average_method_size": (8 + 1 + 5 + 1) / 4,
+        "max_nesting": 3,
+        "functions": [],
+    }
+    # Declarations without a body, attributes and constructor calls are not methods
+    assert calculate_metrics(JAVA) == {
+        "method_number": 2,
+        "number_of_ifs": 1,
+        "number_of_loops": 1,
+        "cyclomatic_complexity": 6,  # for, if, ||, catch, case
+        "average_method_size": (7 + 1) / 2,
+        "max_nesting": 3,
+        "functions": [],
+    }
+    # Switch expression arms are decisions, not lambdas; properties are not methods
+    assert calculate_metrics(CSHARP) == {
+        "method_number": 2,
+        "number_of_ifs": 1,
+        "number_of_loops": 1,
+        "cyclomatic_complexity": 5,
+        "average_method_size": (6 + 1) / 2,
+        "max_nesting": 4,
+        "functions": [],
+    }
+
+
+def test_token_scan_matches_the_individual_metrics():
+    for code in (JAVASCRIPT, JAVA, CSHARP):
+        assert aggregates(calculate_metrics(code)) == metrics_one_by_one(code)
+
+
+
+GENERICS = """
+public class Repository
+{
+    public List<int> N<T>(T t) where T : class
+    {
+        return new List<int>(Count<T>(t));
+    }
+
+    Dictionary<string, List<int>> Load<TKey, TValue>(TKey key) {
+        if (size > (limit)) { return null; }
+        return cache.Get<int>(key);
+    }
+}
+function identity<T>(x: T): T {
+  return a < b > (c) ? x : x;
+}
+"""
+
+
+def test_generic_method_declarations_are_counted():
+    # Constructor and generic calls (new List<int>(...), cache.Get<int>(...)) are not methods
+    metrics = calculate_metrics(GENERICS)
+
+    assert metrics["method_number"] == 3
+    assert metrics["average_method_size"] == (4 + 4 + 3) / 3
+    assert aggregates(metrics) == metrics_one_by_one(GENERICS)
+
+def test_metrics_are_broken_down_per_function():
+    code = (
+        "import os\n"
+        "\n"
+        "class Repository:\n"
+        "    def load(self, paths):\n"
+        "        for path in paths:\n"
+        "            if path and os.path.exists(path):\n"
+        "                while self.busy:\n"
+        "                    pass\n"
+        "\n"
+        "        def parse(line):\n"
+        "            return line or None\n"
+        "        return parse\n"
+        "\n"
+        "if os.name == 'nt':\n"
+        "    pass\n"
+    )
+
+    metrics = calculate_metrics(code)
+
+    assert metrics["functions"] == [
+        {"name": "load", "start_line": 4, "end_line": 12, "line_count": 9, "cyclomatic_complexity": 5,
+         "max_nesting": 4, "number_of_ifs": 1, "number_of_loops": 2},
+        # A nested function is reported on its own, and its decisions are not the outer function's
+        {"name": "parse", "start_line": 10, "end_line": 11, "line_count": 2, "cyclomatic_complexity": 2,
+         "max_nesting": 1, "number_of_ifs": 0, "number_of_loops": 0},
+    ]
+    # Module-level decisions only count for the file
+    assert metrics["cyclomatic_complexity"] == 1 + (5 - 1) + (2 - 1) + 1
+    assert metrics["number_of_ifs"] == 2
+
+
+def test_workflow_metrics_include_the_per_function_breakdown():
+    llm = FakeLLM(refactor=sample_code)
+    service = ImprovementService("test-model", None, None, None, llm_client=llm)
+
+    _, _, _, metrics = asyncio.run(service.run_workflow(sample_code))
+
+    assert [(f.name, f.start_line, f.line_count) for f in metrics.before.functions] == [("is_even", 2, 2)]
+    assert metrics.after.functions[0].cyclomatic_complexity == 1
+    assert metrics.model_dump()["before"]["functions"][0]["max_nesting"] == 1
@@ -0,0 +1,88 @@
+import asyncio
+
+from fake_llm import FakeLLM
+from src.service.improvement_service import ImprovementService
+from src.service.prompt_builder import PromptAssembler, summarize_tests
+from src.service.telemetry import start_trace
+
+chunks = [
+    {"score": 0.2, "chunk_id": "low", "text": "weak match " * 40},
+    {"score": 0.9, "chunk_id": "best", "text": "Prefer guard clauses over nested ifs."},
+    {"score": 0.5, "chunk_id": "mid", "text": "Extract helper functions " * 10},
+]
+
+tests = '''
+import unittest
+from calc import execute
+
+class TestCalc(unittest.TestCase):
+    def test_adds(self):
+        """Adds two numbers."""
+        values = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
+        for v in values:
+            self.assertEqual(execute(v, v), v + v)
+
+    def test_handles_none(self):
+        with self.assertRaises(TypeError):
+            execute(None, 1)
+'''
+
+long_code = "\n".join(f"def f{i}(x):\n    return x + {i}\n" for i in range(200))
+
+
+def test_context_drops_lowest_scored_chunks_first():
+    assembler = PromptAssembler({"context": 100})
+    parts = assembler.build("recommendations", chunks=chunks)
+
+    assert [c["chunk_id"] for c in parts.chunks] == ["best", "mid"]
+    assert parts.degraded == ["context:dropped_chunks"]
+    assert parts.tokens["context"] <= 100
+
+
+def test_tests_are_reduced_to_signatures_before_truncating():
+    summary = summarize_tests(tests)
+    assert "def test_adds(self):\n        \"\"\"Adds two numbers.\"\"\"\n        ..." in summary
+    assert "from calc import execute" in summary
+    assert "assertEqual" not in summary
+
+    assembler = PromptAssembler({"tests": 80})
+    parts = assembler.build("refactor", tests=tests)
+    assert parts.degraded == ["tests:signatures"]
+    assert parts.tests == summary
+
+    parts = PromptAssembler({"tests": 15}).build("refactor", tests=tests)
+    assert parts.degraded == ["tests:signatures", "tests:truncated"]
+    assert parts.tests.endswith("more lines omitted to fit the prompt budget")
+
+
+def test_code_is_only_truncated_for_stages_that_do_not_rewrite_it():
+    assembler = PromptAssembler({"code": 100})
+
+    describe = assembler.build("describe", code=long_code)
+    refactor = assembler.build("refactor", code=long_code, truncate_code=False)
+
+    assert describe.degraded == ["code:truncated"] and describe.tokens["code"] <= 110
+    assert refactor.degraded == ["code:over_budget"] and refactor.code == long_code
+
+
+async def _run_with_trace(service):
+    trace = start_trace()
+    await service.run_workflow("def execute(a, b):\n    return a+b\n", tests)
+    return trace
+
+
+def test_workflow_reports_prompt_part_tokens_per_stage():
+    recorder = FakeLLM(describe="## Purpose\nAdds numbers.", refactor="def execute(a, b):\n    return a + b")
+    service = ImprovementService("test-model", None, None, None, llm_client=recorder,
+                                 prompt_budgets={"tests": 80})
+    service._retrieve_context = lambda queries: ("", chunks)
+
+    trace = asyncio.run(_run_with_trace(service))
+
+    assert set(trace["prompt"]) == {"describe", "recommendations", "refactor"}
+    assert set(trace["prompt"]["recommendations"]) == {"code", "analysis", "context"}
+    assert set(trace["prompt"]["refactor"]) == {"code", "context", "tests"}
+    assert trace["degraded"] == {"refactor": ["tests:signatures"]}
+    # The refactor prompt carries the code it has to rewrite and the summarized tests
+    assert "return a+b" in recorder.prompts["refactor"]
+    assert "assertEqual" not in recorder.prompts["refactor"]
@@ -0,0 +1,121 @@
+import asyncio
+
+import httpx
+
+import api
+from fake_llm import FakeLLM
+from src.service.cache_service import LRUCache, ResponseCache
+
+sample_code = "def add(a, b):\n    return a + b\n"
+
+
+def test_key_ignores_trailing_whitespace_and_line_endings():
+    base = ResponseCache.make_key(sample_code, None, "o3-mini", "kb1")
+
+    assert ResponseCache.make_key("\n" + sample_code.replace("\n", "  \r\n"), None, "o3-mini", "kb1") == base
+    assert ResponseCache.make_key(sample_code, "assert add(1, 2) == 3", "o3-mini", "kb1") != base
+    assert ResponseCache.make_key(sample_code, None, "gpt-4o-mini", "kb1") != base
+    assert ResponseCache.make_key(sample_code, None, "o3-mini", "kb2") != base
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    first = ResponseCache(memory_size=4, disk_path=path)
+    first.set("key", '{"value": 1}')
+
+    # A new instance (restart or another worker) only shares the SQLite file
+    second = ResponseCache(memory_size=4, disk_path=path)
+    assert second.get("key") == ('{"value": 1}', "disk")
+    assert second.get("key") == ('{"value": 1}', "memory")
+    assert second.get("missing") == (None, None)
+    assert second.stats()["disk_hits"] == 1 and second.stats()["misses"] == 1
+
+
+def test_disk_tier_is_size_bounded(tmp_path):
+    cache = ResponseCache(memory_size=0, disk_path=str(tmp_path / "cache.sqlite3"), disk_max_entries=3)
+    for i in range(5):
+        cache.set(f"k{i}", str(i))
+
+    assert len(cache.disk) == 3
+
+
+def _fake_llm():
+    return FakeLLM(describe="## Purpose\nAdds numbers.", refactor=sample_code)
+
+
+async def _post_twice(tmp_path):
+    llm = api._service.client = _fake_llm()
+    api._service.qdrant = None
+    api._cache = ResponseCache(memory_size=8, disk_path=str(tmp_path / "api_cache.sqlite3"))
+
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        first = (await client.post("/improve", json={"Code": sample_code})).json()
+        calls_after_first = llm.calls.total()
+        second = (await client.post("/improve", json={"Code": sample_code + "\n\n"})).json()
+        stats = (await client.get("/cache/stats")).json()
+    return first, second, calls_after_first, llm.calls.total(), stats
+
+
+def test_improve_serves_repeated_code_from_cache(tmp_path):
+    first, second, calls_after_first, total_calls, stats = asyncio.run(_post_twice(tmp_path))
+
+    assert first["cache"]["status"] == "miss"
+    assert second["cache"] == {"status": "hit", "tier": "memory", "key": first["cache"]["key"]}
+    assert second["Code"] == first["Code"] and second["metrics"] == first["metrics"]
+    assert total_calls == calls_after_first == 3
+    assert stats["response_cache"]["hits"] == 1 and stats["response_cache"]["misses"] == 1
+
+
+async def _post_with_leading_blank_lines(tmp_path):
+    api._service.client = _fake_llm()
+    api._service.qdrant = None
+    api._cache = ResponseCache(memory_size=8, disk_path=str(tmp_path / "api_cache.sqlite3"))
+
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        first = (await client.post("/improve", json={"Code": sample_code})).json()
+        second = (await client.post("/improve", json={"Code": "\n\n" + sample_code})).json()
+    return first, second
+
+
+def test_cache_hit_reports_function_lines_of_the_callers_code(tmp_path):
+    first, second = asyncio.run(_post_with_leading_blank_lines(tmp_path))
+
+    assert second["cache"]["status"] == "hit"
+    before, shifted = first["metrics"]["before"]["functions"][0], second["metrics"]["before"]["functions"][0]
+    assert (shifted["start_line"], shifted["end_line"]) == (before["start_line"] + 2, before["end_line"] + 2)
+    assert second["metrics"]["after"] == first["metrics"]["after"]
+
+
+async def _post_with_budgets(tmp_path, budgets):
+    api._service.client = _fake_llm()
+    api._service.qdrant = None
+    api._cache = ResponseCache(memory_size=8, disk_path=str(tmp_path / "api_cache.sqlite3"))
+    saved = api.PROMPT_BUDGETS_KEY
+    api.PROMPT_BUDGETS_KEY = budgets
+    try:
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return (await client.post("/improve", json={"Code": sample_code})).json()
+    finally:
+        api.PROMPT_BUDGETS_KEY = saved
+
+
+def test_prompt_budgets_are_part_of_the_key(tmp_path):
+    default = asyncio.run(_post_with_budgets(tmp_path, api.PROMPT_BUDGETS_KEY))
+    smaller = asyncio.run(_post_with_budgets(tmp_path, '{"code": 100}'))
+
+    assert smaller["cache"]["status"] == "miss"
+    assert smaller["cache"]["key"] != default["cache"]["key"]
@@ -0,0 +1,116 @@
+from types import SimpleNamespace
+
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from src.service.improvement_service import ImprovementService, search_tfidf_batch
+
+corpus = [
+    "Functions should do one thing and do it well.",
+    "Long methods with many if statements are hard to read.",
+    "Prefer descriptive variable names over abbreviations.",
+    "Deeply nested loops can often be replaced by helper functions.",
+]
+
+
+class CountingVectorizer:
+    """Wraps a fitted TfidfVectorizer and counts transform calls."""
+
+    def __init__(self):
+        self.inner = TfidfVectorizer(ngram_range=(1, 2), lowercase=True).fit(corpus)
+        self.calls = 0
+
+    def transform(self, queries):
+        self.calls += 1
+        return self.inner.transform(queries)
+
+
+class FakeQdrant:
+    """Records batched requests and answers each one with the matching corpus chunk."""
+
+    def __init__(self):
+        self.batch_calls = []
+
+    def query_batch_points(self, collection_name, requests):
+        self.batch_calls.append(requests)
+        responses = []
+        for request in requests:
+            chunk_id = request.query.indices[0] % len(corpus)
+            point = SimpleNamespace(
+                score=sum(request.query.values),
+                payload={"text": corpus[chunk_id], "chunk_id": f"c{chunk_id}", "page": 1},
+            )
+            responses.append(SimpleNamespace(points=[point]))
+        return responses
+
+
+def test_search_tfidf_batch_uses_one_transform_and_one_request():
+    vectorizer = CountingVectorizer()
+    qdrant = FakeQdrant()
+    queries = ["long methods", "nested loops", "variable names", "zzz unknown words"]
+
+    results = search_tfidf_batch(qdrant, "code_knowledge", queries, vectorizer, top_k=3)
+
+    assert vectorizer.calls == 1
+    assert len(qdrant.batch_calls) == 1
+    # The query without known terms is not sent to Qdrant but keeps its slot
+    assert len(qdrant.batch_calls[0]) == 3
+    assert [len(r) for r in results] == [1, 1, 1, 0]
+    assert all(req.limit == 3 and req.using == "text" for req in qdrant.batch_calls[0])
+
+
+def test_retrieve_context_searches_all_sections_in_one_batch():
+    vectorizer = CountingVectorizer()
+    qdrant = FakeQdrant()
+    # Without the retrieval cache: sections that encode to the same vector are not deduped
+    service = ImprovementService("test-model", qdrant, "code_knowledge", vectorizer, retrieval_cache_size=0)
+    sections = [f"Section {i}: long methods with nested loops and names" for i in range(12)]
+
+    text, chunks = service._retrieve_context(sections)
+
+    assert vectorizer.calls == 1
+    assert len(qdrant.batch_calls) == 1
+    assert len(qdrant.batch_calls[0]) == len(sections)
+    assert 0 < len(chunks) <= 5
+    assert chunks == sorted(chunks, key=lambda c: c["score"], reverse=True)
+    assert text.split("\n\n---\n\n") == [c["text"] for c in chunks]
+
+
+def test_batch_endpoint_encodes_and_searches_all_queries_together():
+    import asyncio
+    import httpx
+
+    import api
+
+    vectorizer = CountingVectorizer()
+    qdrant = FakeQdrant()
+    original = api._service
+    api._service = ImprovementService("test-model", qdrant, "code_knowledge", vectorizer)
+    body = {
+        "TopK": 4,
+        "Queries": [
+            {"QueryId": "q001", "Query": "long methods", "TopK": 2},
+            {"QueryId": "q002", "Query": "nested loops"},
+            {"QueryId": "q003", "Query": "variable names", "TopK": 0},
+            {"Query": "zzz unknown words"},
+        ],
+    }
+
+    async def call():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/retrieve_context/batch", json=body)
+
+    try:
+        response = asyncio.run(call())
+    finally:
+        api._service = original
+
+    assert response.status_code == 200
+    results = response.json()["Results"]
+    assert [r["QueryId"] for r in results] == ["q001", "q002", "q003", None]
+    assert [len(r["RetrievedContext"]) for r in results] == [1, 1, 0, 0]
+    assert results[0]["RetrievedContext"][0]["chunk_id"].startswith("c")
+    # One encoder pass and one batched request, with each query's own limit
+    assert vectorizer.calls == 1
+    assert len(qdrant.batch_calls) == 1
+    assert [r.limit for r in qdrant.batch_calls[0]] == [2, 4]
@@ -0,0 +1,307 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+
+from src.service.improvement_service import ImprovementService
+from src.service.retrievers import (
+    BM25Retriever, CachedRetriever, InMemoryRetriever, QdrantRetriever, RetrievalCache, Retriever, encode_queries, sparse_pairs
+)
+from src.service.sparse_index import BM25Index, SparseIndex, is_snapshot
+from src.service.tfidf_artifact import TfidfQueryEncoder
+from test_retrieval_batch import FakeQdrant, corpus
+
+queries = ["long methods with if statements", "nested loops helper functions", "zzz unknown words"]
+
+
+def _build():
+    vectorizer = TfidfVectorizer(ngram_range=(1, 2), lowercase=True).fit(corpus)
+    chunks = [{"text": text, "chunk_id": f"c{i}", "page": 1} for i, text in enumerate(corpus)]
+    index = SparseIndex.from_vectors(encode_queries(vectorizer, corpus), chunks)
+    return vectorizer, index
+
+
+def test_memory_search_matches_brute_force_dot_product():
+    vectorizer, index = _build()
+    docs = vectorizer.transform(corpus).toarray().astype(np.float32)
+    query_matrix = vectorizer.transform(queries).toarray()
+
+    results = index.search(encode_queries(vectorizer, queries), top_k=2)
+
+    for row, hits in zip(query_matrix @ docs.T.astype(np.float64), results):
+        expected = [d for d in np.argsort(-row, kind="stable") if row[d] > 0][:2]
+        assert [doc for doc, _ in hits] == expected
+        assert np.allclose([score for _, score in hits], row[expected])
+    # No known terms: no hits rather than arbitrary zero-score chunks
+    assert results[2] == []
+
+
+def test_per_query_top_k():
+    vectorizer, index = _build()
+    encoded = encode_queries(vectorizer, ["functions", "functions", "functions"])
+
+    results = index.search(encoded, top_k=[1, 3, 0])
+
+    assert [len(r) for r in results] == [1, 2, 0]  # only two chunks mention "functions"
+
+
+def test_snapshot_round_trip_is_memory_mapped(tmp_path):
+    vectorizer, index = _build()
+    index.save(str(tmp_path))
+
+    assert is_snapshot(str(tmp_path))
+    loaded = SparseIndex.load(str(tmp_path))
+    assert isinstance(loaded.weights, np.memmap)
+    assert loaded.fingerprint == index.fingerprint
+    assert loaded.chunks == index.chunks
+    encoded = encode_queries(vectorizer, queries)
+    assert loaded.search(encoded, 3) == index.search(encoded, 3)
+
+
+def test_snapshot_from_qdrant_scroll():
+    vectorizer, expected = _build()
+    vectors = encode_queries(vectorizer, corpus)
+
+    class ScrollingQdrant:
+        def scroll(self, collection_name, limit, offset, with_payload, with_vectors):
+            start = offset or 0
+            points = [
+                SimpleNamespace(
+                    vector={"text": SimpleNamespace(indices=vectors[i][0], values=vectors[i][1])},
+                    payload=expected.chunks[i],
+                )
+                for i in range(start, min(start + limit, len(corpus)))
+            ]
+            following = start + limit
+            return points, (following if following < len(corpus) else None)
+
+    index = SparseIndex.from_qdrant(ScrollingQdrant(), "code_knowledge", "text", batch_size=3)
+
+    assert index.chunks == expected.chunks
+    assert index.fingerprint == expected.fingerprint
+
+
+def test_service_uses_the_configured_retriever():
+    vectorizer, index = _build()
+    service = ImprovementService(
+        "gpt-4o-mini", None, "code_knowledge", vectorizer, retriever=InMemoryRetriever(index, vectorizer)
+    )
+
+    context, chunks = service._retrieve_context(["long methods with many if statements", "nested loops"])
+
+    assert "Long methods with many if statements" in context
+    assert {c["chunk_id"] for c in chunks} >= {"c1", "c3"}
+    assert service.retriever.version.startswith("memory:")
+
+
+def test_default_retriever_is_qdrant():
+    vectorizer, _ = _build()
+    service = ImprovementService("gpt-4o-mini", FakeQdrant(), "code_knowledge", vectorizer)
+
+    assert isinstance(service.retriever, QdrantRetriever)
+    service.qdrant = None
+    assert service.retriever is None
+
+
+
+def test_qdrant_version_changes_with_the_knowledge_base_version():
+    vectorizer, _ = _build()
+    service = ImprovementService("gpt-4o-mini", FakeQdrant(), "code_knowledge", vectorizer, knowledge_base_version="kb1")
+    reingested = ImprovementService("gpt-4o-mini", FakeQdrant(), "code_knowledge", vectorizer, knowledge_base_version="kb2")
+
+    assert service.retriever.version.startswith("qdrant:code_knowledge:kb1:")
+    assert service.retriever.version != reingested.retriever.version
+
+
+class StampedQdrant(FakeQdrant):
+    """FakeQdrant that also answers get_collection, with a points count the test can change."""
+
+    def __init__(self, points_count):
+        super().__init__()
+        self.points_count = points_count
+        self.info_calls = 0
+
+    def get_collection(self, collection_name):
+        self.info_calls += 1
+        return SimpleNamespace(points_count=self.points_count)
+
+
+def test_qdrant_version_follows_a_reingest_of_the_collection():
+    vectorizer, _ = _build()
+    qdrant, now = StampedQdrant(points_count=4), [0.0]
+    retriever = QdrantRetriever(qdrant, "code_knowledge", vectorizer, "kb1", stamp_seconds=30, clock=lambda: now[0])
+    before = retriever.version
+
+    # Re-ingested under the same name and KNOWLEDGE_BASE_VERSION: seen once the stamp is re-read
+    qdrant.points_count = 5
+    now[0] = 10.0
+    assert retriever.version == before
+    now[0] = 31.0
+    assert retriever.version != before
+    assert qdrant.info_calls == 2
+
+
+def test_qdrant_version_keeps_the_last_stamp_when_the_collection_is_unreachable():
+    vectorizer, _ = _build()
+    qdrant = StampedQdrant(points_count=4)
+    retriever = QdrantRetriever(qdrant, "code_knowledge", vectorizer, stamp_seconds=0)
+    before = retriever.version
+
+    def unreachable(collection_name):
+        raise ConnectionError("qdrant down")
+
+    qdrant.get_collection = unreachable
+    assert retriever.version == before
+
+
+def test_service_reuses_the_qdrant_retriever():
+    vectorizer, _ = _build()
+    qdrant = StampedQdrant(points_count=4)
+    service = ImprovementService("gpt-4o-mini", qdrant, "code_knowledge", vectorizer)
+
+    assert service.retriever is service.retriever
+    assert service.retriever.version == service.retriever.version
+    # The collection stamp is rate-limited across requests, not re-read per access
+    assert qdrant.info_calls == 1
+
+
+def _build_bm25(**params):
+    encoder = TfidfQueryEncoder.from_vectorizer(_build()[0])
+    counts = encoder.counts(corpus)
+    chunks = [{"text": text, "chunk_id": f"c{i}"} for i, text in enumerate(corpus)]
+    return encoder, BM25Index.from_counts(sparse_pairs(counts), chunks, n_terms=counts.shape[1], **params)
+
+
+def test_encoder_counts_match_count_vectorizer():
+    vectorizer, _ = _build()
+    encoder = TfidfQueryEncoder.from_vectorizer(vectorizer)
+    expected = CountVectorizer(ngram_range=(1, 2), vocabulary=vectorizer.vocabulary_).transform(queries)
+
+    counts = encoder.counts(queries)
+
+    assert counts.indptr.tolist() == expected.indptr.tolist()
+    assert counts.indices.tolist() == expected.indices.tolist()
+    assert counts.data.tolist() == expected.data.tolist()
+
+
+def test_bm25_scores_match_the_formula():
+    k1, b = 1.5, 0.6
+    encoder, index = _build_bm25(k1=k1, b=b)
+    doc_tf = np.zeros((len(corpus), index.n_terms))
+    for d, (idx, vals) in enumerate(sparse_pairs(encoder.counts(corpus))):
+        doc_tf[d, idx] = vals
+    lengths = doc_tf.sum(axis=1)
+    df = (doc_tf > 0).sum(axis=0)
+    idf = np.log(1 + (len(corpus) - df + 0.5) / (df + 0.5))
+
+    retriever = BM25Retriever(index, encoder)
+    encoded = retriever.encode(queries)
+    scores = index.score(encoded)
+
+    for q, (idx, vals) in enumerate(encoded):
+        for d in range(len(corpus)):
+            t = doc_tf[d, idx]
+            expected = np.sum(np.asarray(vals) * idf[idx] * t * (k1 + 1) / (t + k1 * (1 - b + b * lengths[d] / lengths.mean())))
+            assert np.isclose(scores[q, d], expected, rtol=1e-5)
+    hits = retriever.search(["long methods with many if statements"], top_k=1)[0]
+    assert hits[0]["chunk_id"] == "c1"
+
+
+def test_bm25_snapshot_round_trip_with_tuned_parameters(tmp_path):
+    encoder, index = _build_bm25()
+    index.save(str(tmp_path))
+
+    loaded = BM25Retriever.load(str(tmp_path), encoder, k1=0.9, b=0.4)
+
+    assert isinstance(loaded.index.idf, np.memmap)
+    assert np.array_equal(loaded.index.doc_lengths, index.doc_lengths)
+    # k1 and b change the ranking, so they are part of the cache version
+    assert loaded.version != BM25Retriever(index, encoder).version
+    assert loaded.version.startswith("bm25:")
+    # A TF-IDF snapshot is not silently scored as BM25 (and vice versa)
+    with pytest.raises(ValueError):
+        SparseIndex.load(str(tmp_path))
+
+
+class CountingRetriever(InMemoryRetriever):
+    def __init__(self, index, vectorizer):
+        super().__init__(index, vectorizer)
+        self.searched = []
+
+    def search_encoded(self, encoded, top_k):
+        self.searched.append(len(encoded))
+        return super().search_encoded(encoded, top_k)
+
+
+def test_retrieval_cache_serves_repeated_queries_without_searching():
+    vectorizer, index = _build()
+    inner = CountingRetriever(index, vectorizer)
+    cache = RetrievalCache(maxsize=16, ttl=None)
+    retriever = CachedRetriever(inner, cache)
+
+    first = retriever.search(["long methods", "nested loops", "long methods"], top_k=2)
+    second = retriever.search(["nested loops", "variable names"], top_k=2)
+
+    assert inner.searched == [2, 1]  # duplicates searched once, cached queries not at all
+    assert first[0] == first[2] == inner.search(["long methods"], top_k=2)[0]
+    assert second[0] == first[1]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 4)
+    assert stats["saved_seconds"] > 0
+    # A different top_k is a different entry
+    retriever.search(["long methods"], top_k=1)
+    assert inner.searched[-1] == 1
+
+
+def test_retrieval_cache_expires_and_evicts():
+    vectorizer, index = _build()
+    inner = CountingRetriever(index, vectorizer)
+    now = [0.0]
+    cache = RetrievalCache(maxsize=2, ttl=10, clock=lambda: now[0])
+    retriever = CachedRetriever(inner, cache)
+
+    retriever.search(["long methods"])
+    now[0] = 11
+    retriever.search(["long methods"])  # expired
+    retriever.search(["nested loops"])
+    retriever.search(["variable names"])  # evicts the least recently used
+    retriever.search(["long methods"])
+
+    assert inner.searched == [1, 1, 1, 1, 1]
+    assert cache.stats()["expired"] == 1
+
+
+def test_retrieval_cache_is_invalidated_when_the_version_changes(tmp_path):
+    vectorizer, index = _build()
+    cache = RetrievalCache(maxsize=16, ttl=None)
+    old = CountingRetriever(index, vectorizer)
+    CachedRetriever(old, cache).search(["long methods"])
+
+    reindexed = SparseIndex.from_vectors(encode_queries(vectorizer, corpus[:2]), index.chunks[:2])
+    new = CountingRetriever(reindexed, vectorizer)
+    CachedRetriever(new, cache).search(["long methods"])
+
+    assert new.searched == [1]
+    assert cache.stats()["invalidations"] == 1
+    assert cache.version == new.version
+
+
+def test_cached_hits_are_copies():
+    vectorizer, index = _build()
+    retriever = CachedRetriever(InMemoryRetriever(index, vectorizer), RetrievalCache(16, None))
+
+    retriever.search(["long methods"])[0][0]["text"] = "changed"
+
+    assert retriever.search(["long methods"])[0][0]["text"] == corpus[1]
+
+
+def test_retriever_without_search_fails_at_instantiation():
+    class VersionOnly(Retriever):
+        version = "v1"
+
+    try:
+        VersionOnly(None)
+        assert False, "expected TypeError"
+    except TypeError as e:
+        assert "search_encoded" in str(e)
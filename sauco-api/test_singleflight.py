@@ -0,0 +1,94 @@
+import asyncio
+
+import httpx
+
+import api
+from fake_llm import FakeLLM
+from src.service.cache_service import ResponseCache
+from src.service.singleflight import SingleFlight
+
+BURST = 8
+
+sample_code = """
+def hanoi(n, source, target, spare, moves):
+    if n == 0:
+        return
+    hanoi(n - 1, source, spare, target, moves)
+    moves.append((source, target))
+    hanoi(n - 1, spare, target, source, moves)
+"""
+
+
+def test_concurrent_calls_share_one_execution():
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def burst():
+        flight = SingleFlight()
+        results = await asyncio.gather(*[flight.do("key", work) for _ in range(BURST)])
+        return flight, results
+
+    flight, results = asyncio.run(burst())
+
+    assert calls == 1
+    assert [shared for _, shared in results].count(False) == 1
+    assert all(value == "result" for value, _ in results)
+    assert flight.stats() == {"in_flight": 0, "leaders": 1, "coalesced": BURST - 1}
+
+
+def test_errors_reach_every_waiter_and_are_not_remembered():
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise ValueError("provider down")
+
+    async def scenario():
+        flight = SingleFlight()
+        outcomes = await asyncio.gather(*[flight.do("key", failing) for _ in range(3)], return_exceptions=True)
+        retry, shared = await flight.do("key", lambda: asyncio.sleep(0, result="ok"))
+        return outcomes, retry, shared
+
+    outcomes, retry, shared = asyncio.run(scenario())
+
+    assert all(isinstance(o, ValueError) for o in outcomes)
+    assert (retry, shared) == ("ok", False)
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    async def scenario():
+        flight = SingleFlight()
+        leader = asyncio.ensure_future(flight.do("key", lambda: asyncio.sleep(0.05, result="done")))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do("key", lambda: asyncio.sleep(0, result="other")))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(scenario()) == ("done", True)
+
+
+async def _classroom_burst():
+    llm = FakeLLM(delay=0.1, describe="## Purpose\nSolves hanoi.", refactor=sample_code)
+    api._service.client = llm
+    api._service.qdrant = None
+    api._cache = ResponseCache(memory_size=8)
+
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        responses = await asyncio.gather(
+            *[client.post("/improve", json={"Code": sample_code}) for _ in range(BURST)]
+        )
+    return llm.calls.total(), [r.json() for r in responses]
+
+
+def test_identical_improve_burst_runs_workflow_once():
+    llm_calls, bodies = asyncio.run(_classroom_burst())
+
+    statuses = sorted(body["cache"]["status"] for body in bodies)
+    assert llm_calls == 3
+    assert statuses == ["coalesced"] * (BURST - 1) + ["miss"]
+    assert len({body["Code"] for body in bodies}) == 1
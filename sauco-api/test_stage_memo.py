@@ -0,0 +1,42 @@
+import asyncio
+
+from fake_llm import FakeLLM
+from src.service.cache_service import code_fingerprint
+from src.service.improvement_service import ImprovementService
+
+sample_code = """
+def is_even(n):
+    return n % 2 == 0
+"""
+
+# Same AST: only comments and whitespace differ
+reformatted_code = """
+# Checks parity
+def is_even(n):
+
+    return n % 2 == 0   # modulo
+"""
+
+
+def test_fingerprint_ignores_comments_and_whitespace():
+    assert code_fingerprint(sample_code) == code_fingerprint(reformatted_code)
+    assert code_fingerprint(sample_code) != code_fingerprint(sample_code.replace("2", "3"))
+    # Non-Python code falls back to whitespace-insensitive text
+    assert code_fingerprint("function f() {  return 1; }") == code_fingerprint("function f() {\n return 1;\n}")
+
+
+def test_only_refactor_reruns_when_tests_change():
+    llm = FakeLLM(describe="## Purpose\nChecks parity.", refactor=sample_code)
+    service = ImprovementService("test-model", None, None, None, llm_client=llm)
+
+    asyncio.run(service.run_workflow(sample_code, "assert is_even(2)"))
+    asyncio.run(service.run_workflow(reformatted_code, "assert is_even(2)"))
+    assert llm.calls == {"describe": 1, "recommendations": 1, "refactor": 1}
+
+    asyncio.run(service.run_workflow(reformatted_code, "assert not is_even(3)"))
+    assert llm.calls == {"describe": 1, "recommendations": 1, "refactor": 2}
+
+    stats = service.stage_cache_stats()
+    assert stats["describe"]["hits"] == 2 and stats["describe"]["misses"] == 1
+    assert stats["recommendations"]["hit_rate"] == 2 / 3
+    assert stats["refactor"]["hits"] == 1 and stats["refactor"]["misses"] == 2
@@ -0,0 +1,147 @@
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+from types import SimpleNamespace
+
+import httpx
+
+import api
+from src.service.lazy_resource import LazyResource, aresolve
+from test_retrievers import _build
+
+
+def test_importing_api_does_not_load_heavy_dependencies():
+    script = "import sys, api; print(' '.join(m for m in ('openai', 'qdrant_client', 'sklearn') if m in sys.modules))"
+    env = dict(os.environ, JOB_WORKERS="0")
+    result = subprocess.run([sys.executable, "-c", script], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            env=env, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ""
+
+
+def test_lazy_resource_builds_once_and_retries_after_a_failure():
+    attempts = []
+
+    def factory():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise OSError("not yet")
+        return "vectorizer"
+
+    resource = LazyResource("vectorizer", factory)
+    assert resource.state == "cold"
+    try:
+        resource.get()
+        assert False, "expected OSError"
+    except OSError:
+        pass
+    assert resource.status()["state"] == "error"
+    assert resource.get() == resource.get() == "vectorizer"
+    assert len(attempts) == 2
+    assert resource.state == "ready"
+    assert LazyResource("qdrant", None).get() is None
+
+
+def _probe(fail):
+    def check(_):
+        if fail:
+            raise ConnectionError("connection refused")
+    return check
+
+
+async def _ready_before_and_after_warm_up():
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        before = await client.get("/ready")
+        await api.warm_up()
+        after = await client.get("/ready")
+    return before, after
+
+
+def _with_resources(qdrant_fails):
+    saved = api._vectorizer, api._qdrant, api._llm_client
+    try:
+        api._vectorizer = LazyResource("vectorizer", lambda: "vectorizer")
+        api._qdrant = LazyResource("qdrant", lambda: "client", check=_probe(qdrant_fails))
+        api._llm_client = SimpleNamespace(inner=LazyResource("llm_client", lambda: "openai"))
+        return asyncio.run(_ready_before_and_after_warm_up())
+    finally:
+        api._vectorizer, api._qdrant, api._llm_client = saved
+
+
+def test_ready_reports_503_until_warm_then_200():
+    before, after = _with_resources(qdrant_fails=False)
+
+    assert before.status_code == 503
+    assert before.json()["components"]["qdrant"]["state"] == "cold"
+    assert after.status_code == 200
+    assert set(after.json()["components"]) == {"vectorizer", "qdrant", "llm_client"}
+    assert all(c["state"] == "ready" for c in after.json()["components"].values())
+
+
+def test_ready_surfaces_a_missing_qdrant():
+    _, after = _with_resources(qdrant_fails=True)
+
+    assert after.status_code == 503
+    qdrant = after.json()["components"]["qdrant"]
+    assert qdrant["state"] == "error" and "connection refused" in qdrant["error"]
+
+
+def test_snapshot_retriever_without_a_vectorizer_is_disabled(tmp_path):
+    _build()[1].save(str(tmp_path))
+    script = (
+        "import api; print(api._retriever.status()['state'], "
+        "api._service.retrieve_batch(['long methods'], top_k=3), api._service.retriever)"
+    )
+    env = dict(os.environ, JOB_WORKERS="0", RETRIEVER="memory", RETRIEVER_SNAPSHOT_PATH=str(tmp_path))
+    env.pop("TFIDF_VECTORIZER_PATH", None)
+    result = subprocess.run([sys.executable, "-c", script], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            env=env, capture_output=True, text=True, timeout=120)
+
+    assert result.returncode == 0, result.stderr
+    # /ready does not wait for a retriever that could never search; /improve runs without context
+    assert result.stdout.strip().splitlines()[-1] == "disabled [[]] None"
+    assert "needs TFIDF_VECTORIZER_PATH" in result.stdout
+
+
+def test_ready_recovers_when_qdrant_comes_back():
+    down = [True]
+
+    def check(_):
+        if down[0]:
+            raise ConnectionError("connection refused")
+
+    resource = LazyResource("qdrant", lambda: "client", check=check, recheck_seconds=0)
+    assert resource.warm_sync() is False
+    assert resource.status()["state"] == "error"
+
+    down[0] = False
+    assert resource.status() == {"state": "ready", "load_seconds": resource.load_seconds}
+
+
+def test_failed_probe_is_rechecked_at_most_every_interval():
+    calls = []
+
+    def check(_):
+        calls.append(1)
+        raise ConnectionError("connection refused")
+
+    resource = LazyResource("qdrant", lambda: "client", check=check, recheck_seconds=60)
+    resource.warm_sync()
+    resource.status()
+    resource.status()
+    assert len(calls) == 1
+
+
+def test_first_build_of_the_llm_client_runs_off_the_event_loop():
+    built_in = []
+    resource = LazyResource("llm_client", lambda: built_in.append(threading.current_thread()) or "openai")
+
+    async def run():
+        return await aresolve(resource), threading.current_thread()
+
+    value, loop_thread = asyncio.run(run())
+    assert value == "openai" and built_in[0] is not loop_thread
+    assert asyncio.run(aresolve("plain")) == "plain"
@@ -0,0 +1,65 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+
+import api
+from fake_llm import FakeLLM
+from src.service.cache_service import ResponseCache
+from src.service.telemetry import Counter, Histogram
+
+sample_code = "def cube(x):\n    return x * x * x\n"
+
+
+def test_histogram_renders_cumulative_prometheus_buckets():
+    histogram = Histogram("demo_seconds", "Demo.", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        histogram.observe(("describe",), value)
+
+    text = "\n".join(histogram.render())
+
+    assert '# TYPE demo_seconds histogram' in text
+    assert 'demo_seconds_bucket{stage="describe",le="0.1"} 1' in text
+    assert 'demo_seconds_bucket{stage="describe",le="1.0"} 3' in text
+    assert 'demo_seconds_bucket{stage="describe",le="+Inf"} 4' in text
+    assert 'demo_seconds_count{stage="describe"} 4' in text
+
+
+
+def test_counter_total_sums_every_label():
+    counter = Counter("demo_total", "Demo.", ("stage",))
+    counter.inc(("describe",))
+    counter.inc(("refactor",), 2)
+
+    assert counter.total() == 3
+    assert counter.value(("refactor",)) == 2
+
+async def _improve_with_timings():
+    usage = SimpleNamespace(prompt_tokens=100, completion_tokens=20, total_tokens=120)
+    api._service.client = FakeLLM(usage=usage, describe="## Purpose\nCubes x.", refactor=sample_code)
+    api._service.qdrant = None
+    api._cache = ResponseCache(memory_size=8)
+
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        timed = (await client.post("/improve", json={"Code": sample_code, "IncludeTimings": True})).json()
+        plain = (await client.post("/improve", json={"Code": sample_code})).json()
+        metrics = await client.get("/metrics")
+    return timed, plain, metrics
+
+
+def test_improve_reports_stage_timings_and_tokens():
+    timed, plain, metrics = asyncio.run(_improve_with_timings())
+
+    stages = timed["timings"]["stages"]
+    for stage in ("metrics_before", "describe", "recommendations", "refactor", "metrics_after"):
+        assert stages[stage] >= 0
+    assert timed["timings"]["tokens"]["describe"] == {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120}
+    assert timed["timings"]["total"] >= stages["describe"]
+    assert plain["timings"] is None
+
+    assert metrics.status_code == 200
+    assert metrics.headers["content-type"].startswith("text/plain")
+    assert 'sauco_stage_duration_seconds_count{stage="describe"}' in metrics.text
+    assert 'sauco_llm_tokens_total{stage="refactor",kind="completion"}' in metrics.text
+    assert 'sauco_stage_duration_seconds_count{stage="improve_request"}' in metrics.text
@@ -0,0 +1,117 @@
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from src.service.improvement_service import search_tfidf_batch
+from src.service.tfidf_artifact import TfidfArtifact, TfidfQueryEncoder, export_vectorizer, is_artifact
+from test_retrieval_batch import FakeQdrant, corpus
+
+queries = [
+    "Long methods with many IF statements",
+    "functions should do one thing; one thing well",
+    "Área de código: nombres descriptivos y funciones cortas",
+    "zzz unknown words",
+    "",
+]
+
+
+def _assert_same_vectors(expected, actual):
+    assert actual.shape == expected.shape
+    assert actual.indptr.tolist() == expected.indptr.tolist()
+    assert actual.indices.tolist() == expected.indices.tolist()
+    # float32 IDF in the artifact: equal to the precision Qdrant stores
+    assert np.allclose(actual.data, expected.data, rtol=1e-6, atol=0)
+
+
+def test_artifact_matches_the_vectorizer(tmp_path):
+    vectorizer = TfidfVectorizer(ngram_range=(1, 2), lowercase=True).fit(corpus + queries[2:3])
+    meta = export_vectorizer(vectorizer, str(tmp_path))
+
+    assert is_artifact(str(tmp_path))
+    assert meta["n_terms"] == len(vectorizer.vocabulary_)
+    # sklearn numbers its columns in term order, so no columns file is needed
+    assert meta["sorted_columns"] and not (tmp_path / "columns.npy").exists()
+
+    encoder = TfidfQueryEncoder.load(str(tmp_path))
+    assert isinstance(encoder.artifact.idf, np.memmap)
+    assert isinstance(encoder.artifact._offsets, np.memmap)  # mapped, not copied at load
+    assert encoder.artifact.idf.dtype == np.float32
+    _assert_same_vectors(vectorizer.transform(queries), encoder.transform(queries))
+
+
+def test_custom_vocabulary_order_and_sublinear_tf(tmp_path):
+    fitted = TfidfVectorizer(stop_words="english", sublinear_tf=True).fit(corpus)
+    vocabulary = {term: i for i, term in enumerate(sorted(fitted.vocabulary_, reverse=True))}
+    vectorizer = TfidfVectorizer(stop_words="english", sublinear_tf=True, vocabulary=vocabulary).fit(corpus)
+    export_vectorizer(vectorizer, str(tmp_path), idf_dtype="float64")
+
+    artifact = TfidfArtifact.load(str(tmp_path))
+    assert artifact.columns is not None
+    assert artifact.column("functions") == vocabulary["functions"]
+    assert artifact.column("the") == -1
+    texts = queries + ["loops loops loops nested"]
+    _assert_same_vectors(vectorizer.transform(texts), TfidfQueryEncoder(artifact).transform(texts))
+
+
+def test_unsupported_analyzer_is_rejected(tmp_path):
+    vectorizer = TfidfVectorizer(analyzer="char").fit(corpus)
+    try:
+        export_vectorizer(vectorizer, str(tmp_path))
+        assert False, "expected ValueError"
+    except ValueError as e:
+        assert "analyzer" in str(e)
+    assert not is_artifact(str(tmp_path))
+
+
+def test_encoder_drives_the_batched_qdrant_search(tmp_path):
+    vectorizer = TfidfVectorizer(ngram_range=(1, 2), lowercase=True).fit(corpus)
+    export_vectorizer(vectorizer, str(tmp_path))
+    qdrant = FakeQdrant()
+
+    results = search_tfidf_batch(qdrant, "code_knowledge", queries[:4], TfidfQueryEncoder.load(str(tmp_path)))
+
+    expected = vectorizer.transform(queries[:4])
+    sent = qdrant.batch_calls[0]
+    assert [len(r) for r in results] == [1, 1, 0, 0]
+    assert [req.query.indices for req in sent] == [expected[i].indices.tolist() for i in range(2)]
+
+
+def test_batch_encoder_is_bit_identical_to_the_vectorizer():
+    vectorizer = TfidfVectorizer(ngram_range=(1, 3), lowercase=True).fit(corpus)
+    encoder = TfidfQueryEncoder.from_vectorizer(vectorizer)
+    texts = queries + [" ".join(corpus * 3), "nested nested nested loops", "Functions"]
+
+    expected, actual = vectorizer.transform(texts), encoder.transform(texts)
+    # Cached second pass goes through the same arithmetic
+    again = encoder.transform(texts)
+
+    for result in (actual, again):
+        assert np.array_equal(result.indptr, expected.indptr)
+        assert np.array_equal(result.indices, expected.indices)
+        assert np.array_equal(result.data, expected.data)
+
+
+def test_full_ngram_cache_is_evicted_without_losing_the_batch_hits():
+    vectorizer = TfidfVectorizer().fit(["alpha beta gamma delta epsilon"])
+    encoder = TfidfQueryEncoder(TfidfArtifact.from_vectorizer(vectorizer), cache_size=4)
+
+    encoder.transform(["alpha beta gamma"])
+    # "alpha" is a hit, but the two misses overflow the cache and clear it
+    result = encoder.transform(["alpha delta epsilon"])
+
+    expected = vectorizer.transform(["alpha delta epsilon"])
+    assert np.array_equal(result.indices, expected.indices)
+    assert np.array_equal(result.data, expected.data)
+    assert len(encoder._column_cache) <= 4
+
+
+def test_hash_lookup_matches_the_vocabulary(tmp_path):
+    vectorizer = TfidfVectorizer(ngram_range=(1, 2)).fit(corpus)
+    export_vectorizer(vectorizer, str(tmp_path))
+    artifact = TfidfArtifact.load(str(tmp_path))
+    terms = list(vectorizer.vocabulary_) + ["zzz", "functions zzz", "ñandú", "a"]
+
+    found = artifact.lookup(terms).tolist()
+
+    assert found == [vectorizer.vocabulary_.get(t, -1) for t in terms]
+    assert found == [artifact.column(t) for t in terms]
+    assert artifact.lookup([]).tolist() == []
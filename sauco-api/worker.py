@@ -0,0 +1,27 @@
+# worker.py
+"""
+Standalone job worker: drains the /jobs queue without serving HTTP.
+
+    JOB_QUEUE_URL=sqlite:///.cache/jobs.sqlite3 JOB_WORKERS=4 python worker.py
+
+Run API nodes with JOB_WORKERS=0 to scale request admission and LLM workers separately.
+"""
+import asyncio
+import os
+
+import api
+
+
+async def main():
+    concurrency = int(os.getenv("JOB_WORKERS", "2")) or 1
+    pool = api._job_worker_pool(concurrency)
+    pool.start()
+    print(f"Draining {api.JOB_QUEUE_URL} with {concurrency} workers")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await pool.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())